@@ -0,0 +1,253 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from text_utils import normalize_text, tokenize
+
+DEFAULT_CACHE_PATH = "./.kit_cache/answers.sqlite3"
+
+# Stopwords da busca que mudam o sentido da pergunta ("com docker" x "sem docker")
+NEGATIONS = frozenset({"nao", "sem", "nem", "nunca", "jamais", "nenhum", "nenhuma"})
+
+
+def question_key(question):
+    """Chave exata da pergunta: minúsculas, sem acentos e sem pontuação final."""
+    return normalize_text(question).strip(" ?!.")
+
+
+def question_terms(question):
+    """Termos da pergunta para o cache: os da busca na KB mais as negações."""
+    return tokenize(question, keep=NEGATIONS)
+
+
+def trigrams(term):
+    padded = f" {term} "
+    return [padded[start:start + 3] for start in range(len(padded) - 2)]
+
+
+def question_vector(terms):
+    """Vetor esparso com termos e trigramas de caracteres, para achar perguntas parecidas."""
+    features = Counter()
+    for term in terms:
+        features["w:" + term] += 2
+        for trigram in trigrams(term):
+            features["c:" + trigram] += 1
+    return features
+
+
+def similar_term(term_a, term_b, minimum=0.6):
+    """Mesma palavra com erro de digitação ou flexão (coeficiente de Dice dos trigramas)."""
+    grams_a, grams_b = set(trigrams(term_a)), set(trigrams(term_b))
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b)) >= minimum
+
+
+def same_subject(terms_a, terms_b):
+    """As duas perguntas só diferem em variações das mesmas palavras?
+
+    Um termo que só aparece numa delas ("produção" x "homologação") ou uma negação
+    a mais muda a resposta, por mais alta que seja a similaridade do vetor.
+    """
+    terms_a, terms_b = set(terms_a), set(terms_b)
+    if terms_a & NEGATIONS != terms_b & NEGATIONS:
+        return False
+    only_a, only_b = terms_a - terms_b, terms_b - terms_a
+    return (
+        all(any(similar_term(term, other) for other in only_b) for term in only_a)
+        and all(any(similar_term(term, other) for other in only_a) for term in only_b)
+    )
+
+
+def cosine(vector_a, vector_b, norm_a, norm_b):
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(vector_a) > len(vector_b):
+        vector_a, vector_b = vector_b, vector_a
+    return sum(weight * vector_b.get(feature, 0) for feature, weight in vector_a.items()) / (norm_a * norm_b)
+
+
+def vector_norm(vector):
+    return math.sqrt(sum(weight * weight for weight in vector.values()))
+
+
+class AnswerCache:
+    """Cache persistente (SQLite) de respostas, com busca por perguntas quase iguais."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, kb_version="", model="", threshold=0.85, ttl=7 * 24 * 3600, max_entries=1000):
+        self.path = path
+        self.kb_version = kb_version
+        self.model = model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                question_key TEXT NOT NULL,
+                kb_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (question_key, kb_version, model)
+            )
+        """)
+        # Respostas geradas com outra versão da KB estão desatualizadas
+        self.connection.execute("DELETE FROM answers WHERE kb_version != ?", (kb_version,))
+        self.connection.commit()
+
+        # Vetores das perguntas já respondidas ficam em memória para a busca por similaridade
+        self.vectors = {}
+        for row_id, question in self.connection.execute(
+            "SELECT id, question FROM answers WHERE kb_version = ? AND model = ?", (kb_version, model)
+        ):
+            self._remember_vector(row_id, question)
+
+    def _remember_vector(self, row_id, question):
+        terms = question_terms(question)
+        vector = question_vector(terms)
+        self.vectors[row_id] = (vector, vector_norm(vector), terms)
+
+    def get(self, question):
+        """Retorna (resposta, similaridade) ou None quando não há pergunta parecida no cache."""
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT id, answer, created_at FROM answers WHERE question_key = ? AND kb_version = ? AND model = ?",
+                (question_key(question), self.kb_version, self.model),
+            ).fetchone()
+            similarity = 1.0
+            if row is None:
+                terms = question_terms(question)
+                vector = question_vector(terms)
+                norm = vector_norm(vector)
+                best_id, similarity = None, 0.0
+                for row_id, (cached_vector, cached_norm, cached_terms) in self.vectors.items():
+                    score = cosine(vector, cached_vector, norm, cached_norm)
+                    if score > similarity and score >= self.threshold and same_subject(terms, cached_terms):
+                        best_id, similarity = row_id, score
+                if best_id is None or similarity < self.threshold:
+                    return None
+                row = self.connection.execute(
+                    "SELECT id, answer, created_at FROM answers WHERE id = ?", (best_id,)
+                ).fetchone()
+                if row is None:
+                    self.vectors.pop(best_id, None)
+                    return None
+
+            row_id, answer, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._delete(row_id)
+                return None
+            self.connection.execute(
+                "UPDATE answers SET last_used_at = ?, hits = hits + 1 WHERE id = ?", (now, row_id)
+            )
+            self.connection.commit()
+            return answer, similarity
+
+    def put(self, question, answer):
+        """Guarda a resposta e aplica as políticas de TTL e LRU."""
+        now = time.time()
+        with self._lock:
+            self.connection.execute(
+                """
+                INSERT INTO answers (question_key, kb_version, model, question, answer, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (question_key, kb_version, model)
+                DO UPDATE SET answer = excluded.answer, created_at = excluded.created_at, last_used_at = excluded.last_used_at
+                """,
+                (question_key(question), self.kb_version, self.model, question, answer, now, now),
+            )
+            (row_id,) = self.connection.execute(
+                "SELECT id FROM answers WHERE question_key = ? AND kb_version = ? AND model = ?",
+                (question_key(question), self.kb_version, self.model),
+            ).fetchone()
+            self._remember_vector(row_id, question)
+            self._evict(now)
+            self.connection.commit()
+
+    def _delete(self, row_id):
+        self.connection.execute("DELETE FROM answers WHERE id = ?", (row_id,))
+        self.connection.commit()
+        self.vectors.pop(row_id, None)
+
+    def _evict(self, now):
+        if self.ttl:
+            expired = [row_id for (row_id,) in self.connection.execute(
+                "SELECT id FROM answers WHERE created_at < ?", (now - self.ttl,)
+            )]
+            for row_id in expired:
+                self.connection.execute("DELETE FROM answers WHERE id = ?", (row_id,))
+                self.vectors.pop(row_id, None)
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count > self.max_entries:
+            # LRU: remove as respostas usadas há mais tempo
+            oldest = [row_id for (row_id,) in self.connection.execute(
+                "SELECT id FROM answers ORDER BY last_used_at ASC LIMIT ?", (count - self.max_entries,)
+            )]
+            for row_id in oldest:
+                self.connection.execute("DELETE FROM answers WHERE id = ?", (row_id,))
+                self.vectors.pop(row_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM answers")
+            self.connection.commit()
+            self.vectors.clear()
+
+    def close(self):
+        self.connection.close()
+
+
+_open_caches = {}
+_open_caches_lock = threading.Lock()
+
+
+def open_answer_cache(kb_version, model):
+    """Abre o cache de respostas conforme as variáveis KIT_CACHE_* do .env (ou None se desligado).
+
+    Sessões do mesmo processo compartilham a mesma conexão (AnswerCache é thread-safe).
+    """
+    if os.getenv("KIT_CACHE", "1").lower() in ("0", "false", "nao", "não"):
+        return None
+    path = os.getenv("KIT_CACHE_PATH", DEFAULT_CACHE_PATH)
+    with _open_caches_lock:
+        cache = _open_caches.get((path, kb_version, model))
+        if cache is not None:
+            return cache
+        try:
+            cache = AnswerCache(
+                path=path,
+                kb_version=kb_version,
+                model=model,
+                threshold=float(os.getenv("KIT_CACHE_THRESHOLD", "0.85")),
+                ttl=float(os.getenv("KIT_CACHE_TTL", str(7 * 24 * 3600))),
+                max_entries=int(os.getenv("KIT_CACHE_MAX_ENTRIES", "1000")),
+            )
+        except (sqlite3.Error, OSError):
+            # Pasta sem permissão, disco somente leitura ou arquivo corrompido: sem cache o
+            # bot continua funcionando normalmente
+            return None
+        _open_caches[(path, kb_version, model)] = cache
+        return cache
+
+
+def discard_answer_caches(kb_version):
+    """Esquece os caches abertos para uma versão antiga da KB (depois de recarregar a KB).
+
+    As conexões não são fechadas: uma sessão no meio do turno ainda pode gravar nelas, e o
+    próximo open_answer_cache da versão nova apaga essas respostas do arquivo.
+    """
+    with _open_caches_lock:
+        for key in [key for key in _open_caches if key[1] == kb_version]:
+            del _open_caches[key]
@@ -0,0 +1,6 @@
+"""Benchmarks dos bots contra o servidor local de testes (mock_server.py).
+
+Uso:
+    python -m benchmarks.runner --provider gemini anthropic --repeat 3
+    python -m benchmarks.runner --compare benchmarks/results/antes.json benchmarks/results/depois.json
+"""
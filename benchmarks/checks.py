@@ -0,0 +1,1099 @@
+"""Verificações de comportamento das partes que não aparecem numa sessão roteirizada.
+
+Cada verificação leva menos de um segundo, sem rede externa nem cota (as que falam
+com um provedor usam o mock_server). As verificações são agrupadas por área, uma por
+módulo; --help lista as áreas.
+
+Uso:
+    python -m benchmarks.checks               # sai com código 1 se alguma falhar
+    python -m benchmarks.checks sse snapshot  # só as áreas pedidas
+"""
+import argparse
+import contextlib
+import gc
+import io
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from answer_cache import AnswerCache, open_answer_cache
+from bots import load_bot_class
+from chatbot_base import TurnCancelled
+from doc_ingest import DocumentIndex
+from history_window import PINNED, ConversationWindow, turn_text
+from http_client import HttpClient, request_exceptions, retry_after_seconds
+from kb_index import KB_PATH, SNAPSHOT_MAGIC, KnowledgeBase, load_knowledge_base
+from kb_lookup import lookup_matcher
+from kb_reload import KBWatcher, KnowledgeStore
+from kb_shared import SharedSection, attach_knowledge_base, publish_knowledge_base
+from memory_index import DIMENSIONS, ConversationMemory
+from metrics import MetricsRegistry
+from mock_server import MockLLMServer
+from prompt_cache import GeminiContextCache
+from providers import AnthropicProvider, Reply, SystemPrompt, provider_from_env
+from router import ProviderRouter
+from scheduler import PRIORITY_NORMAL, PRIORITY_SHORT, AdmissionScheduler, Coalescer, TokenBucket
+from session_store import SNAPSHOT_EVERY, SessionStore
+from session_summary import RollingSummarizer, summarize_turn
+from sse import StreamError, anthropic_stream_text, gemini_stream_text, iter_sse_events
+from text_utils import estimate_tokens
+
+# área -> verificações, na ordem em que foram declaradas
+CHECKS = {}
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def check(area):
+    def register(function):
+        CHECKS.setdefault(area, []).append(function)
+        return function
+    return register
+
+
+def expect(condition, message):
+    # assert some com python -O; a verificação precisa rodar sempre
+    if not condition:
+        raise CheckFailed(message)
+
+
+def expect_equal(actual, expected, what):
+    expect(actual == expected, f"{what}: esperado {expected!r}, veio {actual!r}")
+
+
+def expect_raises(error_class, function, what):
+    try:
+        function()
+    except error_class:
+        return
+    raise CheckFailed(f"{what}: esperado {error_class.__name__}")
+
+
+# SSE (sse.py)
+
+@check("sse")
+def sse_event_framing():
+    # Como o iter_lines() do requests entrega: sem o "\n", às vezes com o "\r" do CRLF
+    lines = [
+        b": comentario do servidor",
+        b"event: ping\r",
+        b"data: primeira\r",
+        b"data:segunda",
+        b"\r",
+        "data: sem nome",
+        "",
+        "",
+        "data: fim sem linha em branco",
+    ]
+    events = list(iter_sse_events(lines))
+    expect_equal(events, [("ping", "primeira\nsegunda"), (None, "sem nome"), (None, "fim sem linha em branco")], "eventos")
+
+
+@check("sse")
+def sse_gemini_text_and_usage():
+    lines = [
+        'data: {"candidates": [{"content": {"parts": [{"text": "Olá"}, {"text": ""}]}}]}',
+        "",
+        'data: {"candidates": [{"content": {"parts": [{"text": ", dev!"}]}}], "usageMetadata": {"promptTokenCount": 12}}',
+        "",
+    ]
+    usage = {}
+    expect_equal("".join(gemini_stream_text(lines, usage)), "Olá, dev!", "texto do Gemini")
+    expect_equal(usage, {"promptTokenCount": 12}, "usageMetadata do Gemini")
+    error = ['data: {"error": {"code": 429, "message": "quota"}}', ""]
+    expect_raises(StreamError, lambda: list(gemini_stream_text(error)), "erro no meio do stream do Gemini")
+
+
+@check("sse")
+def sse_anthropic_text_and_usage():
+    lines = [
+        "event: message_start",
+        'data: {"type": "message_start", "message": {"usage": {"input_tokens": 30, "cache_read_input_tokens": 20}}}',
+        "",
+        "event: content_block_delta",
+        'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Kit"}}',
+        "",
+        # Sem "type" no JSON, vale o nome do evento
+        "event: content_block_delta",
+        'data: {"delta": {"type": "text_delta", "text": " aqui"}}',
+        "",
+        'data: {"type": "content_block_delta", "delta": {"type": "input_json_delta", "partial_json": "{}"}}',
+        "",
+        'data: {"type": "message_delta", "usage": {"output_tokens": 5}}',
+        "",
+        'data: {"type": "message_stop"}',
+        "",
+        'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": " depois do fim"}}',
+        "",
+    ]
+    usage = {}
+    expect_equal("".join(anthropic_stream_text(lines, usage)), "Kit aqui", "texto da Anthropic")
+    expect_equal(usage, {"input_tokens": 30, "cache_read_input_tokens": 20, "output_tokens": 5}, "usage da Anthropic")
+    error = ["event: error", 'data: {"type": "error", "error": {"message": "overloaded"}}', ""]
+    expect_raises(StreamError, lambda: list(anthropic_stream_text(error)), "erro no meio do stream da Anthropic")
+
+
+# Novas tentativas do cliente HTTP (http_client.py)
+
+GEMINI_BODY = {"contents": [{"role": "user", "parts": [{"text": "oi"}]}]}
+
+
+def gemini_url(server):
+    return f"{server.url}/v1beta/models/gemini-checks:generateContent?key=checks"
+
+
+def quick_client(**kwargs):
+    # Backoff de milissegundos: a verificação não pode levar segundos esperando
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_max", 0.01)
+    return HttpClient(**kwargs)
+
+
+@check("http")
+def http_retries_until_success():
+    with MockLLMServer() as server:
+        client = quick_client(max_retries=3)
+        server.inject_errors(503, count=2)
+        response = client.post(gemini_url(server), "gemini", json=GEMINI_BODY)
+        expect_equal(response.status_code, 200, "status depois das novas tentativas")
+        expect_equal(len(server.requests), 3, "requisições ao servidor")
+        expect_equal(client.stats("gemini").as_dict()["retries"], 2, "novas tentativas contadas")
+        # Os erros foram lidos até o fim: a mesma conexão keep-alive serve às três
+        expect_equal(server.connections, 1, "conexões TCP abertas")
+
+
+@check("http")
+def http_gives_up_after_max_retries():
+    with MockLLMServer() as server:
+        client = quick_client(max_retries=2)
+        server.inject_errors(502, count=5)
+        response = client.post(gemini_url(server), "gemini", json=GEMINI_BODY)
+        expect_equal(response.status_code, 502, "status devolvido depois de esgotar as tentativas")
+        expect_equal(len(server.requests), 3, "requisições ao servidor")
+        stats = client.stats("gemini").as_dict()
+        expect_equal((stats["requests"], stats["errors"], stats["retries"]), (3, 3, 2), "requisições, erros e novas tentativas")
+
+
+@check("http")
+def http_does_not_retry_client_errors():
+    with MockLLMServer() as server:
+        client = quick_client(max_retries=3)
+        server.inject_errors(400)
+        expect_equal(client.post(gemini_url(server), "gemini", json=GEMINI_BODY).status_code, 400, "status de 400")
+        expect_equal(len(server.requests), 1, "requisições ao servidor")
+
+
+@check("http")
+def http_honours_retry_after():
+    with MockLLMServer() as server:
+        client = quick_client(max_retries=1, backoff_max=1.0)
+        server.inject_errors(429, retry_after=0.2)
+        started_at = time.perf_counter()
+        expect_equal(client.post(gemini_url(server), "gemini", json=GEMINI_BODY).status_code, 200, "status depois do Retry-After")
+        expect(time.perf_counter() - started_at >= 0.2, "a nova tentativa deveria esperar o Retry-After")
+        # Retry-After maior que backoff_max: devolve o 429 em vez de travar o chat
+        server.inject_errors(429, retry_after=60)
+        started_at = time.perf_counter()
+        expect_equal(client.post(gemini_url(server), "gemini", json=GEMINI_BODY).status_code, 429, "status com Retry-After longo")
+        expect(time.perf_counter() - started_at < 1.0, "Retry-After longo não deveria ser esperado")
+        expect_equal(len(server.requests), 3, "requisições ao servidor")
+
+
+@check("http")
+def http_retries_connection_errors():
+    # Porta livre e fechada: toda conexão é recusada
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    client = quick_client(max_retries=2)
+    expect_raises(request_exceptions().ConnectionError, lambda: client.post(f"http://127.0.0.1:{port}/", "gemini"), "conexão recusada")
+    stats = client.stats("gemini").as_dict()
+    expect_equal((stats["errors"], stats["retries"]), (3, 2), "erros e novas tentativas")
+
+
+@check("http")
+def http_post_not_retried_on_read_timeout():
+    with MockLLMServer(latency=0.4) as server:
+        client = quick_client(max_retries=3, read_timeout=0.1)
+        expect_raises(request_exceptions().ReadTimeout, lambda: client.post(gemini_url(server), "gemini", json=GEMINI_BODY), "POST lento")
+        # O provedor já recebeu a chamada: repetir dobraria o custo
+        expect_equal(len(server.requests), 1, "requisições ao servidor")
+
+
+@check("http")
+def http_total_timeout_caps_retries():
+    with MockLLMServer() as server:
+        client = quick_client(max_retries=20, backoff_base=0.05, backoff_max=0.05, total_timeout=0.3)
+        server.inject_errors(503, count=50)
+        started_at = time.perf_counter()
+        try:
+            status = client.post(gemini_url(server), "gemini", json=GEMINI_BODY).status_code
+        except request_exceptions().RequestException:
+            # A última tentativa pode estourar o que sobrou do prazo no meio da leitura
+            status = None
+        elapsed = time.perf_counter() - started_at
+        expect(status in (503, None), f"no fim do prazo: 503 ou erro de timeout, veio {status}")
+        expect(elapsed < 0.4, f"as tentativas deveriam parar no prazo de 0.3s, levaram {elapsed:.2f}s")
+        expect(len(server.requests) < 21, "o prazo deveria cortar as tentativas antes do limite")
+        # Prazo do turno já esgotado (ex.: gasto pelo provedor anterior): nem tenta
+        requests_before = len(server.requests)
+        expect_raises(request_exceptions().Timeout, lambda: client.post(gemini_url(server), "gemini", json=GEMINI_BODY, deadline=time.monotonic()), "prazo esgotado")
+        expect_equal(len(server.requests), requests_before, "requisições com o prazo esgotado")
+
+
+@check("http")
+def http_backoff_bounds():
+    client = HttpClient(backoff_base=0.5, backoff_max=20.0)
+    for attempt in range(8):
+        limit = min(20.0, 0.5 * 2 ** attempt)
+        delays = [client.backoff(attempt) for _ in range(50)]
+        expect(all(0 <= delay <= limit for delay in delays), f"backoff da tentativa {attempt} fora de [0, {limit}]")
+
+    class Response:
+        def __init__(self, value):
+            self.headers = {"Retry-After": value} if value is not None else {}
+
+    expect_equal(retry_after_seconds(Response("3")), 3.0, "Retry-After em segundos")
+    expect_equal(retry_after_seconds(Response(None)), None, "sem Retry-After")
+    expect_equal(retry_after_seconds(Response("amanhã")), None, "Retry-After inválido")
+    expect_equal(retry_after_seconds(Response("Wed, 21 Oct 2015 07:28:00 GMT")), 0.0, "Retry-After com data no passado")
+
+
+# Roteador de provedores (router.py)
+
+class ScriptedProvider:
+    """Provedor sem rede: espera `delay`, manda `chunks` e termina com `error`, se houver."""
+
+    def __init__(self, name, chunks=("resposta",), delay=0.0, error=None):
+        self.name = name
+        self.chunks = chunks
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def generate(self, system, turns, on_chunk=None, trace=None, deadline=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        for text in self.chunks:
+            if on_chunk:
+                on_chunk(text)
+        if self.error is not None:
+            raise self.error
+        return Reply("".join(self.chunks), time.perf_counter(), {}, self.name)
+
+
+ROUTER_TURNS = [{"role": "user", "parts": [{"text": "oi"}]}]
+
+
+@check("router")
+def router_fails_over_before_first_chunk():
+    broken = ScriptedProvider("gemini", chunks=(), error=request_exceptions().ConnectionError("recusada"))
+    backup = ScriptedProvider("anthropic", chunks=("do ", "reserva"))
+    router = ProviderRouter([broken, backup], min_samples=1)
+    expect_equal(router.generate("sistema", ROUTER_TURNS).provider, "anthropic", "provedor que respondeu")
+    expect_equal(router.stats_dict()["gemini"]["error_rate"], 1.0, "taxa de erro do provedor que falhou")
+    # Com a falha na janela, o provedor doente vai para o fim da fila
+    expect_equal([provider.name for provider in router.order()], ["anthropic", "gemini"], "ordem depois da falha")
+
+
+@check("router")
+def router_keeps_error_after_streamed_text():
+    # Texto já exibido não pode ser emendado com a resposta de outro provedor
+    broken = ScriptedProvider("gemini", chunks=("meia ",), error=StreamError("conexão caiu"))
+    backup = ScriptedProvider("anthropic")
+    router = ProviderRouter([broken, backup])
+    shown = []
+    expect_raises(StreamError, lambda: router.generate("sistema", ROUTER_TURNS, shown.append), "falha depois do primeiro pedaço")
+    expect_equal((shown, backup.calls), (["meia "], 0), "texto exibido e chamadas ao reserva")
+
+
+@check("router")
+def router_hedges_slow_first_token():
+    slow = ScriptedProvider("gemini", chunks=("lenta",), delay=0.5)
+    fast = ScriptedProvider("anthropic", chunks=("rápida",))
+    router = ProviderRouter([slow, fast], hedge_after=0.1)
+    shown = []
+    started_at = time.perf_counter()
+    reply = router.generate("sistema", ROUTER_TURNS, shown.append)
+    expect_equal((reply.provider, shown, router.hedges), ("anthropic", ["rápida"], 1), "provedor, texto exibido e hedges")
+    expect(time.perf_counter() - started_at < 0.4, "a resposta deveria vir do segundo provedor, sem esperar o primeiro")
+    # Primeiro token dentro do prazo: nenhuma requisição extra
+    slow.delay = 0.0
+    expect_equal(router.generate("sistema", ROUTER_TURNS).provider, "gemini", "provedor sem hedge")
+    expect_equal(router.hedges, 1, "hedges depois de uma resposta rápida")
+
+
+# Fila de admissão e junção de chamadas (scheduler.py)
+
+@check("scheduler")
+def scheduler_token_bucket():
+    bucket = TokenBucket(60)
+    now = bucket.updated_at
+    expect_equal(bucket.delay(60, now), 0.0, "espera com o balde cheio")
+    bucket.take(60)
+    expect_equal(bucket.delay(1, now), 1.0, "espera por uma unidade com o balde vazio")
+    # Pedido maior que o balde espera só o balde encher
+    expect_equal(bucket.delay(600, now), 60.0, "espera de um pedido maior que o balde")
+    # Gasto real acima da estimativa deixa o nível negativo e aumenta a espera
+    bucket.adjust(30)
+    expect_equal(bucket.delay(1, now), 31.0, "espera depois do acerto com o gasto real")
+    expect_equal(bucket.delay(1, now + 31), 0.0, "espera depois de 31s")
+
+
+@check("scheduler")
+def scheduler_short_first_then_round_robin():
+    # 100 tokens por segundo: cada chamada de 20 tokens espera 0.2s com o balde vazio
+    scheduler = AdmissionScheduler({"gemini": (0, 6000)})
+    scheduler.admit("gemini", "aquecimento", 6000)
+    order = []
+    lock = threading.Lock()
+
+    def call(session, name, priority):
+        scheduler.admit("gemini", session, 20, priority)
+        with lock:
+            order.append(name)
+
+    threads = []
+    for session, name, priority in (("a", "a1", PRIORITY_NORMAL), ("a", "a2", PRIORITY_NORMAL), ("b", "b1", PRIORITY_NORMAL), ("c", "c1", PRIORITY_SHORT)):
+        thread = threading.Thread(target=call, args=(session, name, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(5)
+    # A pergunta curta fura a fila; depois as sessões revezam
+    expect_equal(order, ["c1", "a1", "b1", "a2"], "ordem de admissão")
+    expect_equal(scheduler.depth(), {"gemini": 0}, "fila depois de todos entrarem")
+
+
+@check("scheduler")
+def scheduler_coalesces_identical_calls():
+    coalescer = Coalescer()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def call(publish):
+        calls.append(1)
+        publish("olá, ")
+        started.set()
+        release.wait(2)
+        publish("mundo")
+        return "olá, mundo"
+
+    leader_chunks, follower_chunks, results = [], [], []
+    leader = threading.Thread(target=lambda: results.append(coalescer.run("chave", call, leader_chunks.append)))
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=lambda: results.append(coalescer.run("chave", call, follower_chunks.append)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+    expect_equal(len(calls), 1, "chamadas ao provedor")
+    expect_equal(sorted(results), [("olá, mundo", False), ("olá, mundo", True)], "respostas e quem veio de outra chamada")
+    # Quem chegou no meio recebe também os pedaços já publicados, na ordem
+    expect_equal((leader_chunks, follower_chunks), (["olá, ", "mundo"], ["olá, ", "mundo"]), "pedaços entregues")
+    expect_equal((coalescer.coalesced, coalescer.inflight), (1, {}), "junções e chamadas em andamento")
+
+
+# Cache de prompt do Gemini (prompt_cache.py)
+
+def context_cache(server):
+    # Sem novas tentativas no cliente: cada falha injetada chega direto ao cache
+    state_path = os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "cache.json")
+    return GeminiContextCache(server.url, "checks", "gemini-checks", state_path=state_path, http=HttpClient(max_retries=0))
+
+
+def cache_creations(server):
+    return sum(1 for path, _ in server.requests if path.split("?")[0] == "/v1beta/cachedContents")
+
+
+@check("cache")
+def cache_reused_for_same_kb_version():
+    with MockLLMServer() as server:
+        cache = context_cache(server)
+        name = cache.get("prompt estático", "v1")
+        expect(name is not None, "o cache deveria ser criado")
+        expect_equal(cache.get("prompt estático", "v1"), name, "nome do cache na segunda chamada")
+        expect_equal(cache_creations(server), 1, "cachedContents criados")
+
+
+@check("cache")
+def cache_transient_failure_backs_off():
+    with MockLLMServer() as server:
+        cache = context_cache(server)
+        server.inject_errors(503)
+        expect(cache.get("prompt estático", "v1") is None, "503 deveria deixar o turno sem cache")
+        expect(cache.supported, "503 não pode desligar o cache de vez")
+        cache.get("prompt estático", "v1")
+        expect_equal(cache_creations(server), 1, "tentativas durante o backoff")
+        # KB nova não espera o backoff
+        expect(cache.get("prompt estático", "v2") is not None, "KB nova deveria criar o cache")
+        server.inject_errors(429)
+        cache.invalidate()
+        expect(cache.get("prompt estático", "v2") is None and cache.supported, "429 não pode desligar o cache de vez")
+
+
+@check("cache")
+def cache_unsupported_disables():
+    with MockLLMServer(cache_mode="unsupported") as server:
+        cache = context_cache(server)
+        expect(cache.get("prompt estático", "v1") is None, "provedor sem cachedContents")
+        expect(not cache.supported, "400 do cachedContents deveria desligar o cache")
+        cache.get("prompt estático", "v2")
+        expect_equal(cache_creations(server), 1, "tentativas depois de desligado")
+
+
+@check("cache")
+def cache_rejected_twice_disables():
+    with MockLLMServer() as server:
+        cache = context_cache(server)
+        cache.get("prompt estático", "v1")
+        # Cache expirado no provedor: recria no próximo turno
+        cache.rejected()
+        expect(cache.supported and cache.name is None, "a primeira recusa só invalida o cache")
+        expect(cache.get("prompt estático", "v1") is not None, "o cache deveria ser recriado")
+        # O recém-criado também recusado: o modelo não aceita cachedContents
+        cache.rejected()
+        expect(not cache.supported, "a segunda recusa seguida deveria desligar o cache")
+
+
+@check("cache")
+def cache_kept_when_state_unwritable():
+    with MockLLMServer() as server:
+        # A "pasta" do estado é um arquivo: gravar o estado falha com OSError
+        blocker = os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "arquivo")
+        write_bytes(blocker, b"")
+        cache = GeminiContextCache(server.url, "checks", "gemini-checks", state_path=os.path.join(blocker, "cache.json"), http=HttpClient(max_retries=0))
+        name = cache.get("prompt estático", "v1")
+        expect(name is not None, "o cache deveria valer em memória mesmo sem gravar o estado")
+        expect_equal(cache.get("prompt estático", "v1"), name, "cache reaproveitado")
+        expect_equal(cache_creations(server), 1, "caches criados")
+
+
+def anthropic_provider(server):
+    return AnthropicProvider("checks", server.url, streaming=False, http=HttpClient(max_retries=0))
+
+
+def anthropic_system():
+    return SystemPrompt("prompt estático", "v1", lambda: "seções recuperadas")
+
+
+@check("cache")
+def cache_control_refused_falls_back():
+    with MockLLMServer(cache_mode="unsupported") as server:
+        provider = anthropic_provider(server)
+        reply = provider.generate(anthropic_system(), [provider.make_turn("user", "oi")])
+        expect(reply.text, "o turno deveria sair com o system prompt em texto")
+        expect(not provider.prompt_caching, "400 citando cache_control deveria desligar o cache_control")
+
+
+@check("cache")
+def cache_control_kept_on_other_400():
+    with MockLLMServer() as server:
+        provider = anthropic_provider(server)
+        server.inject_errors(400, count=1)
+        expect_raises(request_exceptions().HTTPError, lambda: provider.generate(anthropic_system(), [provider.make_turn("user", "oi")]), "400 sem relação com o cache")
+        expect(provider.prompt_caching, "um 400 qualquer não pode desligar o cache_control")
+        expect_equal(len(server.requests), 1, "requisições depois de um 400 qualquer")
+
+
+# Snapshot da KB (kb_index.py)
+
+def kb_text():
+    with open(KB_PATH, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def snapshot_file():
+    return os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "kb.snapshot")
+
+
+def read_bytes(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def write_bytes(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def same_kb(actual, expected, what):
+    expect_equal([(s.title, s.text, s.tokens) for s in actual.sections], [(s.title, s.text, s.tokens) for s in expected.sections], f"{what}: seções")
+    for query in ("url do jenkins", "versão do node", "deploy em produção"):
+        expect_equal(
+            [(section.title, round(score, 9)) for section, score in actual.search(query)],
+            [(section.title, round(score, 9)) for section, score in expected.search(query)],
+            f"{what}: busca por {query!r}",
+        )
+
+
+@check("snapshot")
+def snapshot_round_trip():
+    text, path = kb_text(), snapshot_file()
+    fresh = KnowledgeBase(text)
+    load_knowledge_base(text, path)
+    expect_equal(read_bytes(path), fresh.snapshot_bytes(), "snapshot gravado na primeira abertura")
+    loaded = KnowledgeBase.from_snapshot(text, read_bytes(path))
+    expect(loaded is not None, "o snapshot gravado deveria ser aceito")
+    same_kb(loaded, fresh, "KB lida do snapshot")
+
+
+@check("snapshot")
+def snapshot_rebuilt_for_other_kb():
+    text, path = kb_text(), snapshot_file()
+    load_knowledge_base(text, path)
+    changed = text + "\n\n## NOVA SEÇÃO\nO canal de plantão é o #oncall-choco.\n"
+    expect(KnowledgeBase.from_snapshot(changed, read_bytes(path)) is None, "snapshot de outra KB deveria ser recusado")
+    kb = load_knowledge_base(changed, path)
+    same_kb(kb, KnowledgeBase(changed), "KB refeita")
+    expect_equal(read_bytes(path), KnowledgeBase(changed).snapshot_bytes(), "snapshot regravado para a KB nova")
+
+
+@check("snapshot")
+def snapshot_rebuilt_when_damaged():
+    text, path = kb_text(), snapshot_file()
+    good = KnowledgeBase(text).snapshot_bytes()
+    header_size = len(SNAPSHOT_MAGIC) + 2 + 32
+    damaged = {
+        "formato antigo": good[:len(SNAPSHOT_MAGIC)] + bytes([good[len(SNAPSHOT_MAGIC)] + 1]) + good[len(SNAPSHOT_MAGIC) + 1:],
+        "outro marshal": good[:len(SNAPSHOT_MAGIC) + 1] + bytes([good[len(SNAPSHOT_MAGIC) + 1] + 1]) + good[len(SNAPSHOT_MAGIC) + 2:],
+        "cortado no cabeçalho": good[:header_size - 5],
+        "cortado no corpo": good[:header_size + (len(good) - header_size) // 2],
+        "vazio": b"",
+    }
+    for what, data in damaged.items():
+        expect(KnowledgeBase.from_snapshot(text, data) is None, f"snapshot {what} deveria ser recusado")
+        write_bytes(path, data)
+        same_kb(load_knowledge_base(text, path), KnowledgeBase(text), f"KB refeita (snapshot {what})")
+        expect_equal(read_bytes(path), good, f"snapshot regravado (snapshot {what})")
+
+
+# Recarga da KB (kb_reload.py)
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@check("reload")
+def reload_swaps_changed_kb():
+    path = os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "kb.txt")
+    write_bytes(path, b"## Jenkins\n- URL: https://jenkins.choco.dev\n")
+    with environment(KIT_KB_SNAPSHOT="0"):
+        store = KnowledgeStore(path, "reserva")
+        expect(not store.reload(), "o mesmo texto não é uma versão nova")
+        write_bytes(path, b"## Jenkins\n- URL: https://ci.choco.dev\n")
+        expect(store.reload(), "o texto novo deveria entrar no lugar")
+    expect_equal(store.current.generation, 2, "geração depois da recarga")
+    expect("ci.choco.dev" in store.current.knowledge_base.sections[0].text, "a seção deveria ter o texto novo")
+
+
+@check("reload")
+def reload_keeps_kb_when_file_missing():
+    path = os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "kb.txt")
+    write_bytes(path, b"## Jenkins\n- URL: https://jenkins.choco.dev\n")
+    store = KnowledgeStore(path, "reserva")
+    current = store.current
+    # "Grava e renomeia" ou git checkout: por um instante o arquivo não existe
+    os.remove(path)
+    expect_raises(FileNotFoundError, store.reload, "recarga com o arquivo sumido")
+    expect(store.current is current, "a KB atual deveria continuar valendo, sem trocar pelo texto de reserva")
+
+
+@check("reload")
+def reload_watcher_survives_errors():
+    path = os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "kb.txt")
+    write_bytes(path, b"versao 1")
+    calls = []
+
+    def on_change():
+        calls.append(time.perf_counter())
+        if len(calls) == 1:
+            raise ValueError("falha simulada")
+
+    watcher = KBWatcher(path, on_change, poll_interval=0.05, debounce=0.01).start()
+    errors = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(errors):
+            # Dá tempo de o inotify (ou o primeiro polling) começar a observar
+            time.sleep(0.1)
+            write_bytes(path, b"versao 2")
+            expect(wait_until(lambda: len(calls) >= 1), "a mudança deveria chamar on_change")
+            time.sleep(0.05)
+            write_bytes(path, b"versao 3 maior")
+            expect(wait_until(lambda: len(calls) >= 2), "a observação deveria continuar depois do erro")
+    finally:
+        watcher.stop()
+    expect("falha simulada" in errors.getvalue(), "o erro inesperado deveria aparecer no stderr")
+
+
+# KB em memória compartilhada (kb_shared.py)
+
+@check("shared")
+def shared_kb_matches_original():
+    kb = KnowledgeBase(kb_text())
+    segment = publish_knowledge_base(kb)
+    try:
+        shared = attach_knowledge_base(segment.name)
+        expect_equal(shared.version, kb.version, "versão da KB")
+        expect(all(isinstance(section, SharedSection) for section in shared.sections), "as seções deveriam ficar no segmento")
+        expect_equal([(section.title, section.text, section.tokens) for section in shared.sections],
+                     [(section.title, section.text, section.tokens) for section in kb.sections], "seções")
+        expect(all(term in shared.index.postings for term in kb.index.postings), "todos os termos deveriam estar no segmento")
+        expect("termo-que-nao-existe" not in shared.index.postings, "termo ausente")
+        for query in ("url do jenkins", "como subir o ambiente de homologação", "docker compose", "termo-que-nao-existe"):
+            expect_equal([(section.section_id, round(score, 9)) for section, score in shared.search(query, 4)],
+                         [(section.section_id, round(score, 9)) for section, score in kb.search(query, 4)], f"busca por {query!r}")
+        del shared
+        gc.collect()
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+# Documentos adicionados (doc_ingest.py)
+
+def write_document(path, text, mtime_offset=0):
+    write_bytes(path, text.encode("utf-8"))
+    # O índice só relê arquivos com mtime novo; dois write_bytes seguidos podem cair no mesmo
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + mtime_offset))
+
+
+def selected_titles(index, query):
+    return [section.title for section, _ in index.select(query)]
+
+
+@check("documents")
+def documents_shared_chunks_counted():
+    directory = tempfile.mkdtemp(prefix="kit-checks-")
+    first, second = os.path.join(directory, "a.md"), os.path.join(directory, "b.md")
+    write_document(first, "# Jenkins\npipeline jenkins ci\n# Docker\nimagem docker base\n")
+    write_document(second, "# Docker\nimagem docker base\n# Kafka\ntopico kafka eventos\n")
+    index = DocumentIndex(chunk_chars=10)
+    expect_equal(index.add_paths(first).chunks_added, 2, "trechos do primeiro arquivo")
+    report = index.add_paths(second)
+    expect_equal((report.chunks_added, report.chunks_duplicated, len(index)), (1, 1, 3), "trecho repetido indexado uma vez só")
+
+    # O primeiro arquivo perde o trecho do Docker, que o segundo ainda tem
+    write_document(first, "# Jenkins\npipeline jenkins ci\n# Redis\ncache redis sessao\n", 5)
+    index.add_paths(first)
+    expect_equal(len(index), 4, "trechos depois de trocar um trecho do primeiro arquivo")
+    expect(selected_titles(index, "imagem docker"), "o trecho do Docker ainda pertence ao segundo arquivo")
+
+    # Agora nenhum arquivo tem o trecho: ele sai da busca
+    write_document(second, "# Kafka\ntopico kafka eventos\n", 5)
+    index.add_paths(second)
+    expect_equal(len(index), 3, "trechos depois que o último dono larga o trecho")
+    expect_equal(selected_titles(index, "imagem docker"), [], "trecho sem dono na busca")
+    expect_equal(selected_titles(index, "cache redis"), ["a.md (trecho 2)"], "trecho novo na busca")
+
+
+@check("documents")
+def documents_unchanged_file_skipped():
+    directory = tempfile.mkdtemp(prefix="kit-checks-")
+    path = os.path.join(directory, "a.md")
+    write_document(path, "# Jenkins\npipeline jenkins ci\n")
+    index = DocumentIndex(chunk_chars=10)
+    index.add_paths(directory)
+    report = index.add_paths(directory)
+    expect_equal((report.files_added, report.files_unchanged), ([], [path]), "arquivo sem mudança na segunda vez")
+    expect_equal(len(index), 1, "trechos depois de adicionar a pasta duas vezes")
+
+
+# Janela do histórico (history_window.py)
+
+def conversation(exchanges, words=40):
+    history = []
+    for number in range(exchanges):
+        history.append({"role": "user", "content": f"pergunta {number} " + "palavra " * words})
+        history.append({"role": "assistant", "content": f"resposta {number} " + "palavra " * words})
+    return history
+
+
+@check("history")
+def history_trimmed_to_budget():
+    window = ConversationWindow(token_budget=400)
+    history = conversation(12) + [{"role": "user", "content": "pergunta atual"}]
+    turns = window.build(history)
+    report = window.last_report
+    expect(report["tokens_before"] > 400, "o histórico de teste deveria passar do orçamento")
+    # A nota de resumo entra por cima do orçamento; o resto da janela precisa caber nele
+    first = turn_text(turns[0]).split("\n\n", 1)[1]
+    body_tokens = estimate_tokens(first) + sum(estimate_tokens(turn_text(turn)) for turn in turns[1:])
+    expect(body_tokens <= 400, f"janela com {body_tokens} tokens fora da nota, orçamento 400")
+    expect_equal(turn_text(turns[-1]), "pergunta atual", "a pergunta atual fica no fim")
+    expect(turn_text(turns[0]).startswith("[Resumo de mensagens anteriores"), "os turnos cortados viram uma nota")
+    expect(all(a["role"] != b["role"] for a, b in zip(turns, turns[1:])), "os papéis precisam alternar")
+    expect(report["bytes_after"] < report["bytes_before"], "o corte deveria reduzir os bytes")
+
+
+@check("history")
+def history_pinned_turns_survive():
+    window = ConversationWindow(token_budget=300)
+    history = conversation(10)
+    for turn in history[2:4]:
+        turn[PINNED] = True
+    history.append({"role": "user", "content": "pergunta atual"})
+    turns = window.build(history)
+    texts = [turn_text(turn) for turn in turns]
+    expect(any("pergunta 1 " in text for text in texts) and any(text.startswith("resposta 1 ") for text in texts), "a troca fixada deveria ficar")
+    expect(not any(PINNED in turn for turn in turns), "metadados locais não podem ir para a API")
+    expect(all(a["role"] != b["role"] for a, b in zip(turns, turns[1:])), "os papéis precisam alternar depois da troca fixada")
+    retained = window.retained(history, condensed_turns=0)
+    expect(history[2] in retained and history[3] in retained, "o snapshot da sessão deveria guardar a troca fixada")
+
+
+# Cache de respostas (answer_cache.py)
+
+def answer_cache():
+    return AnswerCache(os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "answers.sqlite3"), "kb", "modelo")
+
+
+@check("answers")
+def answers_unusable_path_disables_cache():
+    blocker = os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "arquivo")
+    write_bytes(blocker, b"")
+    # A pasta do cache é um arquivo: os.makedirs levanta OSError
+    with environment(KIT_CACHE="1", KIT_CACHE_PATH=os.path.join(blocker, "answers.sqlite3")):
+        expect(open_answer_cache("v1", "gemini-checks") is None, "sem onde gravar o bot deveria seguir sem cache")
+
+
+@check("answers")
+def answers_paraphrase_hits():
+    cache = answer_cache()
+    cache.put("Como faço o deploy da ChocoAPI em produção usando o Jenkins?", "passos de produção")
+    hit = cache.get("como faço deploy da chocoapi em produção usando jenkins")
+    expect(hit is not None and hit[0] == "passos de produção", f"paráfrase sem stopwords deveria acertar, veio {hit!r}")
+
+
+@check("answers")
+def answers_negation_misses():
+    cache = answer_cache()
+    cache.put("quero usar docker, como rodo a ChocoAPI localmente?", "passos com docker")
+    hit = cache.get("não quero usar docker, como rodo a ChocoAPI localmente?")
+    expect(hit is None, f"a pergunta negada não pode reaproveitar a resposta, veio {hit!r}")
+
+
+@check("answers")
+def answers_other_environment_misses():
+    cache = answer_cache()
+    cache.put("Como faço o deploy da ChocoAPI em produção usando o Jenkins?", "passos de produção")
+    hit = cache.get("Como faço o deploy da ChocoAPI em homologação usando o Jenkins?")
+    expect(hit is None, f"outro ambiente não pode reaproveitar a resposta, veio {hit!r}")
+
+
+# Resumo da sessão (session_summary.py)
+
+SUMMARY_ANSWER = (
+    "Olá! 🍫 Que bom te ver por aqui.\n\n"
+    "O servidor do Jenkins fica em https://jenkins.choco-dev.internal e usa pipeline declarativo.\n"
+    "- Os jobs são organizados por produto e projeto.\n"
+    "Peça permissão ao time de DevOps pelo helpdesk do Jenkins.\n\n"
+    "[Você ainda tem 2 interação(ões) disponível(is) nesta sessão]"
+)
+
+
+@check("summary")
+def summary_keeps_relevant_sentences():
+    title, summary = summarize_turn("Onde fica o servidor do Jenkins e como peço permissão para os jobs?", SUMMARY_ANSWER)
+    expect_equal(title, "Onde fica o servidor do Jenkins e como...", "título do turno")
+    expect("[Você ainda tem" not in summary, "o aviso de interações restantes não deveria entrar no resumo")
+    expect(summary.index("servidor do Jenkins") < summary.index("Peça permissão"), "frases fora da ordem original")
+    # Sem espaço para todas, fica a frase mais ligada à pergunta, não a saudação do começo
+    _, summary = summarize_turn("Onde fica o servidor do Jenkins?", SUMMARY_ANSWER, max_chars=100)
+    expect_equal(summary, "O servidor do Jenkins fica em https://jenkins.choco-dev.internal e usa pipeline declarativo.", "resumo curto")
+
+
+@check("summary")
+def summary_rolling_order_and_pending():
+    release = threading.Event()
+
+    def summarize(question, answer):
+        # O primeiro turno termina por último
+        if question == "primeira":
+            release.wait(1.0)
+        return question, answer
+
+    summarizer = RollingSummarizer(summarize)
+    summarizer.submit("primeira", "a")
+    summarizer.submit("segunda", "b")
+    expect_equal(summarizer.result(timeout=0.05), None, "resumo com um turno ainda em andamento")
+    release.set()
+    expect_equal(summarizer.result(timeout=1.0), [("primeira", "a"), ("segunda", "b")], "resumos na ordem da conversa")
+
+    def broken(question, answer):
+        raise ValueError("resumo quebrado")
+
+    summarizer = RollingSummarizer(broken)
+    summarizer.submit("terceira", "c")
+    expect_equal(summarizer.result(timeout=1.0), None, "resumo com um turno que falhou")
+
+
+# Memória da conversa (memory_index.py)
+
+MEMORY_TOPICS = ("jenkins pipeline", "docker imagem", "kafka topico", "redis cache", "gitlab runner", "terraform modulo")
+
+
+@check("memory")
+def memory_eviction_accounting():
+    # A frequência das posições sozinha já ocupa DIMENSIONS * 4 bytes
+    limit = DIMENSIONS * 4 + 2048
+    memory = ConversationMemory(max_bytes=limit)
+    added = 0
+    for round_number in range(10):
+        for topic in MEMORY_TOPICS:
+            memory.add(f"Como uso {topic} na rodada {round_number}?", f"Para {topic}, siga o guia da wiki. " * 4)
+            added += 1
+            expect(memory.nbytes <= limit, f"memória passou do limite: {memory.nbytes} bytes")
+    expect(memory.evicted > len(MEMORY_TOPICS), "a primeira rodada inteira deveria ter sido descartada")
+    expect_equal(memory.evicted + len(memory), added, "trocas guardadas mais descartadas")
+    expect_equal(sum(memory.document_frequency), len(memory.features), "frequência das posições depois dos descartes")
+    # A conta depois dos descartes bate com uma memória montada só com as trocas que sobraram
+    rebuilt = ConversationMemory(max_bytes=limit)
+    rebuilt.load(memory.dump())
+    expect_equal((rebuilt.nbytes, rebuilt.evicted), (memory.nbytes, 0), "bytes e descartes da memória remontada")
+    found = [section.text for section, _ in memory.search("terraform modulo rodada 9")]
+    expect(found and "rodada 9" in found[0], "a troca mais nova deveria ser encontrada")
+    found = [section.text for section, _ in memory.search("jenkins pipeline rodada 0", top_k=10)]
+    expect(not any("rodada 0" in text for text in found), "troca descartada não deveria voltar na busca")
+
+
+@check("memory")
+def memory_keeps_single_large_exchange():
+    memory = ConversationMemory(max_bytes=1024)
+    memory.add("Qual o passo a passo do Jenkins?", "Passo longo. " * 500)
+    # Uma troca sozinha maior que o limite fica: a memória nunca esvazia por causa da última
+    expect_equal((len(memory), memory.evicted), (1, 0), "trocas e descartes com uma troca grande")
+    memory.add("E o Docker?", "Use a imagem base.")
+    expect_equal((len(memory), memory.evicted), (1, 1), "trocas e descartes depois da segunda troca")
+    expect("Docker" in memory.dump()[0], "a troca mais nova deveria ficar")
+
+
+# Turnos cancelados (chatbot_base.py, chat_loop.py)
+
+@contextlib.contextmanager
+def environment(**values):
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def mock_bot(server, provider="gemini"):
+    """Bot falando com o mock_server, sem cache, sessões, caminho rápido nem recarga da KB."""
+    with environment(GOOGLE_API_KEY="checks", ANTHROPIC_API_KEY="checks", GEMINI_API_BASE=server.url, ANTHROPIC_API_BASE=server.url,
+                     KIT_PROVIDERS=provider, KIT_STREAMING="0", KIT_CACHE="0", KIT_SESSIONS="0", KIT_FAST_PATH="0",
+                     KIT_KB_WATCH="0", KIT_PROMPT_CACHE="0", KIT_MEMORY="0"):
+        bot = load_bot_class(provider)()
+        # O roteador do processo é compartilhado e guarda o endereço do primeiro mock_server
+        bot.router = ProviderRouter([provider_from_env(provider, streaming=False)])
+    bot.verbose = False
+    return bot
+
+
+@check("turns")
+def turns_abandoned_turn_leaves_session_alone():
+    with MockLLMServer(latency=0.6) as server:
+        bot = mock_bot(server)
+        outcome = []
+
+        def slow_turn():
+            try:
+                outcome.append(bot.send_message("Como configuro o Docker no meu ambiente?"))
+            except TurnCancelled:
+                outcome.append("cancelado")
+
+        worker = threading.Thread(target=slow_turn)
+        worker.start()
+        time.sleep(0.2)
+        expect(bot.abandon_turn(), "o turno esperando o provedor deveria ser abandonado")
+        expect_equal(len(bot.history), 0, "mensagens no histórico logo depois de abandonar")
+        # O chat_loop dá um evento novo para o próximo turno, que roda enquanto o abandonado termina
+        server.latency = 0.0
+        bot.cancel_event = threading.Event()
+        bot.send_message("Onde ficam os pipelines do Jenkins?")
+        worker.join()
+        expect_equal(outcome, ["cancelado"], "resultado do turno abandonado")
+        expect_equal(bot.last_turn["source"], "api", "last_turn é do turno novo")
+        expect_equal((bot.metrics.turns, bot.metrics.cancelled), (2, 1), "turnos e cancelados nas métricas")
+        expect_equal((bot.response_count, len(bot.interaction_summary)), (1, 1), "respostas contadas na sessão")
+        expect_equal([turn["role"] for turn in bot.history], ["user", "model"], "histórico depois dos dois turnos")
+        expect(not bot.abandon_turn(), "sem turno no provedor não há o que abandonar")
+        expect_equal(len(bot.history), 2, "mensagens depois de tentar abandonar sem turno")
+
+
+# Caminho rápido (kb_lookup.py)
+
+@check("fastpath")
+def fastpath_confidence_and_margin():
+    matcher = lookup_matcher(load_knowledge_base(kb_text()))
+    fact, confidence = matcher.match("qual a URL do Jenkins?")
+    expect_equal(fact.value, "https://jenkins.choco-dev.internal", "fato da URL do Jenkins")
+    expect(confidence >= 0.8, f"consulta direta deveria passar do limite padrão, confiança {confidence:.2f}")
+    # Vários fatos "Documentação completa": sem folga para o segundo, a confiança cai pela metade
+    _, confidence = matcher.match("qual a documentação completa?")
+    expect(confidence < 0.8, f"consulta ambígua não deveria passar do limite, confiança {confidence:.2f}")
+    expect_equal(matcher.match("Como configuro o Docker no meu ambiente?"), (None, 0.0), "pergunta que não é consulta")
+
+
+@check("fastpath")
+def fastpath_answers_without_provider():
+    with MockLLMServer() as server:
+        bot = mock_bot(server)
+        bot.fast_path = True
+        answer, _ = bot.send_message("qual a URL do Jenkins?")
+        expect("https://jenkins.choco-dev.internal" in answer, "resposta com a URL do Jenkins")
+        expect_equal((bot.last_turn["source"], len(server.requests)), ("kb", 0), "origem da resposta e requisições ao provedor")
+        # Abaixo do limite configurado a mesma pergunta vai para o modelo
+        bot.fast_path_threshold = 0.99
+        bot.send_message("qual a URL do Jenkins?")
+        expect(bot.last_turn["source"] != "kb", "com limite alto a resposta deveria vir do provedor")
+        expect_equal(len(server.requests), 1, "requisições ao provedor com limite alto")
+
+
+# Sessões retomadas (session_store.py)
+
+def history_state(bot):
+    return [(turn["role"], turn_text(turn), bool(turn.get(PINNED))) for turn in bot.history]
+
+
+def session_store():
+    return SessionStore(os.path.join(tempfile.mkdtemp(prefix="kit-checks-"), "sessions.sqlite3"))
+
+
+def play_session(bot, exchanges):
+    """Trocas sem chamar o modelo; a cada três, uma pergunta cancelada e a troca anterior fixada."""
+    for number in range(exchanges):
+        bot.append_turn("user", f"Pergunta {number} sobre o Jenkins")
+        bot.append_turn("assistant", f"Resposta {number}: veja o pipeline declarativo")
+        if number % 3 == 2:
+            bot.pin_last_exchange()
+            bot.append_turn("user", f"Pergunta {number} cancelada")
+            bot.cancel_pending_turn()
+
+
+@check("sessions")
+def sessions_resume_replays_cancel_and_pin():
+    store = session_store()
+    with MockLLMServer() as server:
+        bot = mock_bot(server)
+        session_id = bot.start_session(store)
+        play_session(bot, 4)
+        resumed = mock_bot(server)
+        expect_equal(resumed.start_session(store, ""), session_id, "sessão aberta mais recente")
+    expect_equal(history_state(resumed), history_state(bot), "histórico retomado")
+    expect(any(pinned for _, _, pinned in history_state(resumed)), "a troca fixada deveria continuar fixada")
+    # O replay não grava de novo os eventos: o próximo continua a numeração
+    resumed.append_turn("user", "Pergunta depois de retomar")
+    _, _, _, _, events = store.load(session_id)
+    expect_equal([seq for seq, _, _ in events], list(range(1, len(events) + 1)), "numeração dos eventos")
+    store.close()
+
+
+@check("sessions")
+def sessions_resume_from_snapshot():
+    store = session_store()
+    with MockLLMServer() as server:
+        bot = mock_bot(server)
+        session_id = bot.start_session(store)
+        # Eventos suficientes para passar de um snapshot
+        play_session(bot, SNAPSHOT_EVERY // 2)
+        bot.close_session()
+        _, _, snapshot, snapshot_seq, events = store.load(session_id)
+        expect(snapshot is not None and snapshot_seq > 0, "a sessão deveria ter um snapshot")
+        expect(len(events) < SNAPSHOT_EVERY, f"só os eventos depois do snapshot deveriam ser lidos, vieram {len(events)}")
+        resumed = mock_bot(server)
+        resumed.start_session(store, session_id)
+    expect_equal(history_state(resumed), history_state(bot), "histórico retomado do snapshot")
+    store.close()
+
+
+# Métricas (metrics.py)
+
+def turn_record():
+    return {"timestamp": time.time(), "provider": "gemini", "source": "api", "total": 0.2, "ttft": 0.1,
+            "tokens": {"input": 10, "output": 5, "cached": 0}, "spans": {"ttfb": 0.1}}
+
+
+@check("metrics")
+def metrics_concurrent_prometheus_writes():
+    directory = tempfile.mkdtemp(prefix="kit-checks-")
+    path = os.path.join(directory, "kit.prom")
+    registry = MetricsRegistry(prometheus_path=path)
+    workers = [threading.Thread(target=lambda: [registry.record(turn_record()) for _ in range(25)]) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with open(path, "r", encoding="utf-8") as file:
+        text = file.read()
+    expect('kit_turns_total{provider="gemini",source="api"} 100' in text, "o arquivo deveria ter o retrato mais novo (100 turnos)")
+    expect_equal(os.listdir(directory), ["kit.prom"], "arquivos na pasta (nenhum temporário sobrando)")
+
+
+@check("metrics")
+def metrics_unwritable_path_keeps_turn():
+    directory = tempfile.mkdtemp(prefix="kit-checks-")
+    blocker = os.path.join(directory, "arquivo")
+    write_bytes(blocker, b"")
+    registry = MetricsRegistry(os.path.join(blocker, "trace.jsonl"), os.path.join(blocker, "kit.prom"))
+    errors = io.StringIO()
+    with contextlib.redirect_stderr(errors):
+        registry.record(turn_record())
+    expect_equal(sum(registry.turns.values()), 1, "turnos registrados em memória")
+    expect("[métricas]" in errors.getvalue(), "a falha de gravação deveria aparecer no stderr")
+
+
+def run_checks(areas=None):
+    """Roda as verificações das áreas pedidas (todas por padrão); retorna [(nome, erro)] das que falharam."""
+    failures = []
+    for area in areas or CHECKS:
+        for function in CHECKS[area]:
+            name = f"{area}.{function.__name__}"
+            started_at = time.perf_counter()
+            try:
+                function()
+            except CheckFailed as error:
+                failures.append((name, str(error)))
+                status = "FALHOU"
+            except Exception:
+                failures.append((name, traceback.format_exc()))
+                status = "ERRO"
+            else:
+                status = "ok"
+            print(f"{status:6} {name} ({(time.perf_counter() - started_at) * 1000:.0f} ms)")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificações de comportamento da Kit")
+    parser.add_argument("areas", nargs="*", help=f"áreas a verificar: {', '.join(CHECKS)} (padrão: todas)")
+    args = parser.parse_args()
+    unknown = [area for area in args.areas if area not in CHECKS]
+    if unknown:
+        parser.error(f"área desconhecida: {', '.join(unknown)}")
+
+    failures = run_checks(args.areas)
+    if failures:
+        print("\nVerificações com problema:")
+        for name, message in failures:
+            print(f"- {name}: {message}")
+        sys.exit(1)
@@ -0,0 +1,347 @@
+"""Avaliação offline: qualidade das respostas contra o custo de cada configuração do pipeline.
+
+Cada pergunta do conjunto de referência (benchmarks/golden.jsonl) traz os fatos da
+KB-CHOCODEV.txt que a resposta precisa conter (URLs, versões, branches). Cada configuração
+(variáveis KIT_* de recuperação, histórico, cache e caminho rápido) roda o conjunto inteiro
+num processo novo, contra o servidor local de testes, e é medida em:
+
+- cobertura da resposta: fração dos fatos que aparecem na resposta;
+- cobertura do contexto: fração dos fatos que estavam no que o modelo recebeu;
+- tokens de entrada (em cache e fora dele), bytes enviados e latência do pipeline.
+
+Sem gravação, o servidor de testes responde como um modelo que só usa o contexto recebido:
+devolve as linhas do prompt (KB, documentos, histórico) mais parecidas com a pergunta.
+Se a configuração tira o fato do prompt, a resposta perde o fato. Com --replay, as
+respostas vêm de um JSONL gravado com o modelo de verdade, por exemplo a saída do
+kit_batch.py para o mesmo conjunto (campos "id" e "answer"; "config" opcional).
+
+O relatório marca com * as configurações da fronteira: nenhuma outra tem cobertura maior
+ou igual gastando menos tokens.
+
+Uso:
+    python -m benchmarks.evaluation
+    python -m benchmarks.evaluation --config padrao kb_enxuta historico_curto --provider anthropic
+    python -m benchmarks.evaluation --env KIT_KB_TOP_K=3 KIT_PROMPT_CACHE=0
+    KIT_PROMPT_CACHE=0 python kit_batch.py benchmarks/golden.jsonl -o respostas.jsonl
+    python -m benchmarks.evaluation --replay respostas.jsonl
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.runner import RESULTS_DIR, percentile
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden.jsonl")
+
+# Variáveis de cada configuração, por cima do padrão da Kit
+CONFIGS = {
+    "padrao": {},
+    "kb_minima": {"KIT_KB_TOP_K": "1", "KIT_PROMPT_TOKEN_BUDGET": "600", "KIT_PROMPT_CACHE": "0"},
+    "kb_enxuta": {"KIT_KB_TOP_K": "2", "KIT_PROMPT_TOKEN_BUDGET": "900", "KIT_PROMPT_CACHE": "0"},
+    "kb_recuperada": {"KIT_PROMPT_CACHE": "0"},
+    "kb_ampla": {"KIT_KB_TOP_K": "8", "KIT_PROMPT_TOKEN_BUDGET": "4000", "KIT_PROMPT_CACHE": "0"},
+    "historico_curto": {"KIT_HISTORY_TOKEN_BUDGET": "60", "KIT_PROMPT_CACHE": "0"},
+    "sem_caminho_rapido": {"KIT_FAST_PATH": "0"},
+    "cache_respostas": {"KIT_CACHE": "1"},
+}
+
+# Linhas do contexto que o modelo simulado devolve como resposta
+ANSWER_LINES = 4
+# Peso de um token em cache no custo (os provedores cobram uma fração do preço normal)
+CACHED_TOKEN_WEIGHT = 0.25
+
+
+def load_golden(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def load_replay(path):
+    """(config, id) -> resposta; config None vale para todas as configurações."""
+    answers = {}
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                item = json.loads(line)
+                if item.get("answer") is not None:
+                    answers[(item.get("config"), str(item["id"]))] = item["answer"]
+    return answers
+
+
+def fact_found(fact, text):
+    from text_utils import normalize_text
+
+    return normalize_text(fact) in normalize_text(text)
+
+
+def recall(facts, text):
+    return sum(fact_found(fact, text) for fact in facts) / len(facts) if facts else 1.0
+
+
+def request_texts(body, cached_bodies):
+    """Textos que o modelo recebe: system prompt, cachedContent do Gemini e mensagens."""
+    texts = []
+
+    def collect(value, key=None):
+        if isinstance(value, str):
+            if key in ("text", "content", "system"):
+                texts.append(value)
+        elif isinstance(value, dict):
+            for child_key, child in value.items():
+                collect(child, child_key)
+        elif isinstance(value, list):
+            for child in value:
+                collect(child, key)
+
+    collect(cached_bodies.get(body.get("cachedContent"), {}))
+    collect(body)
+    return texts
+
+
+def user_messages(body):
+    messages = body.get("contents") or body.get("messages") or []
+    return [message for message in messages if message.get("role") == "user"]
+
+
+def matches(terms, line_terms):
+    """Termos da pergunta presentes na linha; prefixos contam ("homolog" e "homologacao")."""
+    return sum(
+        1 for term in terms
+        if term in line_terms or any(len(min(term, other, key=len)) >= 4 and (other.startswith(term) or term.startswith(other)) for other in line_terms)
+    )
+
+
+def grounded_answer(texts, question, previous=""):
+    """Resposta de um modelo que só repete o contexto: as linhas mais parecidas com a pergunta.
+
+    Os termos da pergunta anterior (se ela ainda está no histórico enviado) e os títulos
+    acima da linha valem metade, como num follow-up ("e a de homologação?").
+    """
+    from text_utils import normalize_text, tokenize
+
+    terms = set(tokenize(question))
+    follow_up = set(tokenize(previous)) - terms
+    asked = {normalize_text(question), normalize_text(previous)}
+    scored = {}
+    for text in texts:
+        headings = {}
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("#"):
+                headings[len(line) - len(line.lstrip("#"))] = set(tokenize(line))
+                # Um título ## novo encerra os ### de baixo dele
+                headings = {level: value for level, value in headings.items() if level <= len(line) - len(line.lstrip("#"))}
+                continue
+            if not line or line in scored or normalize_text(line) in asked:
+                continue
+            line_terms = set(tokenize(line))
+            heading_terms = set().union(*headings.values()) - line_terms
+            score = matches(terms, line_terms) + 0.5 * (matches(follow_up, line_terms) + matches(terms | follow_up, heading_terms))
+            if matches(terms | follow_up, line_terms):
+                scored[line] = score
+    best = sorted(scored, key=scored.get, reverse=True)[:ANSWER_LINES]
+    return "\n".join(best) or "Não encontrei isso na documentação da Choco-dev."
+
+
+def run_config(spec):
+    """Roda o conjunto de referência numa configuração; executado num processo separado."""
+    from mock_server import MockLLMServer
+
+    current = {}
+    replay = spec["replay"]
+
+    def reply(body):
+        if replay is not None:
+            answer = replay.get((spec["config"], current["id"]), replay.get((None, current["id"])))
+            if answer is None:
+                current["missing_replay"] = True
+                return ""
+            return answer
+        messages = user_messages(body)
+        previous = "".join(request_texts(messages[-2], {})) if len(messages) > 1 else ""
+        return grounded_answer(request_texts(body, server.cached_content_bodies), current["question"], previous)
+
+    server = MockLLMServer(latency=spec["latency"], reply=reply).start()
+    workdir = tempfile.mkdtemp(prefix="kit-eval-")
+    os.environ.update({
+        "GOOGLE_API_KEY": "avaliacao",
+        "ANTHROPIC_API_KEY": "avaliacao",
+        "GEMINI_API_BASE": server.url,
+        "ANTHROPIC_API_BASE": server.url,
+        "KIT_PROVIDERS": spec["provider"],
+        "KIT_CACHE": "0",
+        "KIT_CACHE_PATH": os.path.join(workdir, "answers.sqlite3"),
+        "KIT_SESSIONS": "0",
+        "KIT_KB_WATCH": "0",
+    })
+    os.environ.update(spec["env"])
+
+    from bots import load_bot_class
+    from metrics import usage_tokens
+
+    bot_class = load_bot_class(spec["provider"])
+    results = []
+    try:
+        for item in spec["golden"]:
+            # Cada pergunta é uma conversa nova, com as mensagens de contexto antes
+            bot = bot_class()
+            bot.verbose = False
+            for message in item.get("context", []):
+                current.update(id=item["id"], question=message)
+                bot.send_message(message)
+            current.update(id=item["id"], question=item["question"], missing_replay=False)
+            requests_before = len(server.requests)
+            bytes_before = server.bytes_received
+            started_at = time.perf_counter()
+            bot.send_message(item["question"])
+            latency = time.perf_counter() - started_at
+
+            turn = bot.last_turn or {"source": "comando"}
+            answer = turn.get("answer") or ""
+            if turn["source"] == "api":
+                seen = [text for _, body in server.requests[requests_before:] for text in request_texts(body, server.cached_content_bodies)]
+            else:
+                # Resposta local (caminho rápido, cache): o que a pessoa lê é o que conta
+                seen = [answer]
+            tokens = usage_tokens(turn.get("usage"))
+            results.append({
+                "id": item["id"],
+                "source": turn["source"],
+                "answer_recall": recall(item["facts"], answer),
+                "context_recall": recall(item["facts"], "\n".join(seen)),
+                "missing_facts": [fact for fact in item["facts"] if not fact_found(fact, answer)],
+                "prompt_tokens": tokens["input"],
+                "cached_tokens": tokens["cached"],
+                "request_bytes": server.bytes_received - bytes_before,
+                "latency": latency,
+                "missing_replay": current["missing_replay"],
+            })
+    finally:
+        server.stop()
+    return {"config": spec["config"], "env": spec["env"], "questions": results}
+
+
+def summarize(run, cached_weight=CACHED_TOKEN_WEIGHT):
+    questions = run["questions"]
+    scored = [question for question in questions if not question["missing_replay"]]
+
+    def mean(key, items=questions):
+        return sum(question[key] for question in items) / len(items) if items else None
+
+    prompt_tokens = mean("prompt_tokens")
+    cached_tokens = mean("cached_tokens")
+    return {
+        "questions": len(questions),
+        "answer_recall": mean("answer_recall", scored),
+        "context_recall": mean("context_recall"),
+        "prompt_tokens_mean": prompt_tokens,
+        "cached_tokens_mean": cached_tokens,
+        # Custo comparável entre configurações: token em cache vale cached_weight de um token normal
+        "effective_tokens_mean": prompt_tokens - cached_tokens * (1 - cached_weight) if questions else None,
+        "request_bytes_mean": mean("request_bytes"),
+        "latency_p50": percentile([question["latency"] for question in questions], 0.5),
+        "latency_p95": percentile([question["latency"] for question in questions], 0.95),
+        "local_answers": sum(1 for question in questions if question["source"] in ("kb", "cache")),
+        "errors": sum(1 for question in questions if question["source"] == "error"),
+        "missing_replay": len(questions) - len(scored),
+    }
+
+
+def mark_frontier(summary):
+    """Marca as configurações que nenhuma outra supera em cobertura e custo ao mesmo tempo."""
+    for name, values in summary.items():
+        values["frontier"] = not any(
+            other["answer_recall"] >= values["answer_recall"]
+            and other["effective_tokens_mean"] <= values["effective_tokens_mean"]
+            and (other["answer_recall"], -other["effective_tokens_mean"]) != (values["answer_recall"], -values["effective_tokens_mean"])
+            for other_name, other in summary.items()
+            if other_name != name and other["answer_recall"] is not None
+        ) if values["answer_recall"] is not None else False
+
+
+def run_evaluation(configs, provider="gemini", golden_path=GOLDEN_PATH, replay_path=None, latency=0.0,
+                   cached_weight=CACHED_TOKEN_WEIGHT, parallel=1):
+    """configs: nome -> variáveis de ambiente. Retorna o relatório completo."""
+    golden = load_golden(golden_path)
+    replay = load_replay(replay_path) if replay_path else None
+    specs = [{
+        "config": name, "env": env, "provider": provider, "golden": golden, "replay": replay, "latency": latency,
+    } for name, env in configs.items()]
+    # spawn: cada configuração começa num interpretador limpo (KB, caches e provedores do processo)
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=parallel, maxtasksperchild=1) as pool:
+        # chunksize=1: duas configurações nunca dividem o mesmo processo
+        runs = pool.map(run_config, specs, chunksize=1)
+    summary = {run["config"]: summarize(run, cached_weight) for run in runs}
+    mark_frontier(summary)
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "provider": provider,
+        "golden": os.path.abspath(golden_path),
+        "answers": "replay" if replay_path else "mock extrativo",
+        "replay": replay_path,
+        "cached_token_weight": cached_weight,
+        "summary": summary,
+        "runs": runs,
+    }
+
+
+def format_summary(summary):
+    def fmt(value, pattern):
+        return "-" if value is None else pattern.format(value)
+
+    lines = []
+    for name, values in sorted(summary.items(), key=lambda item: item[1]["effective_tokens_mean"] or 0):
+        lines.append(
+            f"{'*' if values['frontier'] else ' '} {name}: cobertura {fmt(values['answer_recall'], '{:.0%}')} "
+            f"(contexto {fmt(values['context_recall'], '{:.0%}')}), "
+            f"tokens {fmt(values['effective_tokens_mean'], '{:.0f}')} efetivos / {fmt(values['prompt_tokens_mean'], '{:.0f}')} "
+            f"({fmt(values['cached_tokens_mean'], '{:.0f}')} em cache), "
+            f"{fmt(values['request_bytes_mean'], '{:.0f}')} B enviados, "
+            f"latência p50 {fmt(values['latency_p50'], '{:.3f}')}s p95 {fmt(values['latency_p95'], '{:.3f}')}s, "
+            f"{values['local_answers']} locais, {values['errors']} erros"
+            + (f", {values['missing_replay']} sem gravação" if values["missing_replay"] else "")
+        )
+    return "\n".join(lines)
+
+
+def parse_env(assignments):
+    env = {}
+    for assignment in assignments:
+        key, separator, value = assignment.partition("=")
+        if not separator:
+            raise SystemExit(f"--env espera VARIAVEL=valor, recebeu {assignment!r}")
+        env[key] = value
+    return env
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qualidade das respostas contra o custo de cada configuração da Kit")
+    parser.add_argument("--config", nargs="+", choices=sorted(CONFIGS), help="configurações a comparar (padrão: todas)")
+    parser.add_argument("--env", nargs="+", metavar="VARIAVEL=valor", default=[], help="roda também uma configuração 'personalizada'")
+    parser.add_argument("--provider", choices=["gemini", "anthropic"], default="gemini")
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="JSONL com id, question, facts e context (opcional)")
+    parser.add_argument("--replay", help="JSONL com as respostas gravadas (id, answer e config opcional)")
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos até o primeiro byte no mock")
+    parser.add_argument("--cached-weight", type=float, default=CACHED_TOKEN_WEIGHT, help="custo de um token em cache em relação a um normal")
+    parser.add_argument("--parallel", type=int, default=1, help="configurações rodando ao mesmo tempo")
+    parser.add_argument("-o", "--output", help="arquivo JSON de saída (padrão: benchmarks/results/avaliacao-<data>.json)")
+    args = parser.parse_args()
+
+    configs = {name: CONFIGS[name] for name in (args.config or ([] if args.env else sorted(CONFIGS)))}
+    if args.env:
+        configs["personalizada"] = parse_env(args.env)
+    report = run_evaluation(configs, args.provider, args.golden, args.replay, args.latency, args.cached_weight, args.parallel)
+    output = args.output or os.path.join(RESULTS_DIR, "avaliacao-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(format_summary(report["summary"]))
+    print(f"\nResultados salvos em {output}")
+    sys.exit(0)
@@ -0,0 +1,149 @@
+"""Compara o kit_server.py (um processo) com o kit_pool.py (N workers) contra o servidor local de testes.
+
+Cada configuração sobe o servidor num processo próprio, abre várias sessões em
+paralelo por HTTP e mede turnos por segundo e a latência de cada mensagem. O ganho
+do kit_pool depende dos núcleos livres: numa máquina com um núcleo os números ficam
+parecidos.
+
+Uso:
+    python -m benchmarks.pool --workers 1 2 4 --sessions 16 --turns 5
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from benchmarks.runner import percentile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = (
+    "Como configuro o Docker no meu ambiente?",
+    "Onde ficam os pipelines do Jenkins?",
+    "Qual é o fluxo de deploy para produção?",
+    "Como peço acesso ao banco de dados?",
+    "Quais são as regras de code review?",
+)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def call(base, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def wait_until_up(base, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"O servidor terminou com código {process.returncode}")
+        try:
+            return call(base, "GET", "/health")
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("O servidor não respondeu a tempo")
+
+
+def run_sessions(base, sessions, turns):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def session():
+        try:
+            session_id = call(base, "POST", "/sessions")["session_id"]
+            for turn in range(turns):
+                started_at = time.perf_counter()
+                reply = call(base, "POST", f"/sessions/{session_id}/messages", {"message": QUESTIONS[turn % len(QUESTIONS)]})
+                with lock:
+                    latencies.append(time.perf_counter() - started_at)
+                # A sessão termina sozinha no limite de interações
+                if reply.get("should_exit"):
+                    session_id = call(base, "POST", "/sessions")["session_id"]
+            call(base, "DELETE", f"/sessions/{session_id}")
+        except Exception as error:
+            with lock:
+                errors.append(repr(error))
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started_at
+
+
+def measure(mock_url, workers, sessions, turns, provider):
+    """workers=0 roda o kit_server.py; N > 0 roda o kit_pool.py com N workers."""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "kit_server.py", "--port", str(port)]
+    if workers:
+        command = [sys.executable, "kit_pool.py", "--port", str(port), "--workers", str(workers)]
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY="benchmark",
+        ANTHROPIC_API_KEY="benchmark",
+        GEMINI_API_BASE=mock_url,
+        ANTHROPIC_API_BASE=mock_url,
+        KIT_PROVIDERS=provider,
+        KIT_CACHE="0",
+        KIT_FAST_PATH="0",
+        KIT_SESSION_PATH=os.path.join(tempfile.mkdtemp(prefix="kit-pool-"), "sessions.sqlite3"),
+    )
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(base, process)
+        latencies, errors, wall_time = run_sessions(base, sessions, turns)
+        # Os workers mandam a carga a cada segundo (kit_pool.LOAD_INTERVAL)
+        time.sleep(1.5 if workers else 0)
+        health = call(base, "GET", "/health")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        "mode": f"kit_pool ({workers} workers)" if workers else "kit_server",
+        "turns_per_second": len(latencies) / wall_time if wall_time else 0.0,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "errors": len(errors),
+        "workers": [
+            {key: worker.get(key) for key in ("worker", "pid", "turns", "cpu_seconds", "peak_rss_mb")}
+            for worker in health.get("workers", [])
+        ],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turnos por segundo do kit_server.py e do kit_pool.py")
+    parser.add_argument("--provider", choices=["gemini", "anthropic"], default="gemini")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1], help="quantidades de workers do kit_pool")
+    parser.add_argument("--sessions", type=int, default=16, help="sessões em paralelo")
+    parser.add_argument("--turns", type=int, default=5, help="mensagens por sessão")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência do servidor de testes (s)")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="tokens por segundo do servidor de testes")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    from mock_server import MockLLMServer
+
+    server = MockLLMServer(latency=args.latency, token_rate=args.token_rate).start()
+    try:
+        results = [measure(server.url, 0, args.sessions, args.turns, args.provider)]
+        results += [measure(server.url, workers, args.sessions, args.turns, args.provider) for workers in dict.fromkeys(args.workers)]
+    finally:
+        server.stop()
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, ensure_ascii=False, indent=2))
@@ -0,0 +1,263 @@
+"""Roda as sessões de benchmarks/scenarios.py contra o mock_server e salva os resultados em JSON.
+
+Cada sessão roda num processo novo, com o próprio servidor mock, para que o pico de
+memória (RSS) seja só daquela sessão. Para cada turno são medidos latência, tempo até o
+primeiro token, tempo de codificação do corpo e bytes enviados ao provedor.
+
+Uso:
+    python -m benchmarks.runner --provider gemini anthropic --repeat 3 --parallel 2
+    python -m benchmarks.runner --latency 0.2 --token-rate 50 --error-rate 0.05
+    python -m benchmarks.runner --scenario conversa_longa documentos_grandes --gzip
+    python -m benchmarks.runner --compare benchmarks/results/antes.json benchmarks/results/depois.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.scenarios import SCENARIOS, session_steps
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo em MB (None onde o módulo resource não existe)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def mock_reply(words):
+    """Resposta do mock com `words` palavras, para o stream ter vários pedaços."""
+    filler = "Esta é uma resposta de teste da Kit sobre o onboarding na Choco-dev".split()
+    return " ".join(filler[index % len(filler)] for index in range(words)) + " 🍫"
+
+
+def run_session(spec):
+    """Roda um cenário com um bot novo; executado num processo separado."""
+    from mock_server import MockLLMServer
+
+    server = MockLLMServer(
+        latency=spec["latency"],
+        token_rate=spec["token_rate"],
+        error_rate=spec["error_rate"],
+        reply=mock_reply(spec["reply_words"]),
+        cache_mode=spec["cache_mode"],
+        seed=spec["seed"],
+    ).start()
+    os.environ.update({
+        "GOOGLE_API_KEY": "benchmark",
+        "ANTHROPIC_API_KEY": "benchmark",
+        "GEMINI_API_BASE": server.url,
+        "ANTHROPIC_API_BASE": server.url,
+        "KIT_PROVIDERS": spec["provider"],
+        "KIT_STREAMING": "1" if spec["streaming"] else "0",
+        "KIT_CACHE": "0",
+        "KIT_GZIP_REQUESTS": "1" if spec["gzip"] else "0",
+    })
+    workdir = tempfile.mkdtemp(prefix="kit-bench-")
+    steps = session_steps(spec["scenario"], workdir, spec["document_bytes"])
+    baseline_rss = peak_rss_mb()
+
+    from bots import load_bot_class
+
+    bot = load_bot_class(spec["provider"])()
+    bot.verbose = False
+    # O limite de interações do GeminiChatbot encerraria o cenário no meio
+    if hasattr(bot, "max_responses"):
+        bot.max_responses = len(steps) + 1
+
+    turns = []
+    session_started_at = time.perf_counter()
+    try:
+        for step in steps:
+            first_chunk = []
+
+            def on_chunk(text):
+                if not first_chunk:
+                    first_chunk.append(time.perf_counter())
+
+            bytes_before = server.bytes_received
+            requests_before = len(server.requests)
+            started_at = time.perf_counter()
+            bot.send_message(step, on_chunk if spec["streaming"] else None)
+            finished_at = time.perf_counter()
+
+            turn = bot.last_turn or {"source": "comando"}
+            turns.append({
+                "message": step[:80],
+                "source": turn["source"],
+                "latency": finished_at - started_at,
+                # Sem streaming o primeiro token chega junto com a resposta inteira
+                "ttft": (first_chunk[0] if first_chunk else finished_at) - started_at if turn["source"] == "api" else None,
+                "requests": len(server.requests) - requests_before,
+                "payload_bytes": server.bytes_received - bytes_before,
+                # Só a chamada que deu certo (sem novas tentativas nem cachedContents)
+                "encode_ms": turn["encode"] * 1000 if turn.get("encode") is not None else None,
+                "request_bytes": turn.get("request_bytes"),
+            })
+    finally:
+        wall_time = time.perf_counter() - session_started_at
+        server.stop()
+
+    return {
+        "provider": spec["provider"],
+        "scenario": spec["scenario"],
+        "turns": turns,
+        "wall_time": wall_time,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "connections": server.connections,
+    }
+
+
+def summarize(sessions, wall_time):
+    """Agrega as sessões de um mesmo provedor e cenário."""
+    api_turns = [turn for session in sessions for turn in session["turns"] if turn["source"] == "api"]
+    latencies = [turn["latency"] for turn in api_turns]
+    ttfts = [turn["ttft"] for turn in api_turns]
+    payloads = [turn["payload_bytes"] for turn in api_turns]
+    encodes = [turn["encode_ms"] for turn in api_turns if turn.get("encode_ms") is not None]
+    request_sizes = [turn["request_bytes"] for turn in api_turns if turn.get("request_bytes") is not None]
+    peaks = [session["peak_rss_mb"] for session in sessions if session["peak_rss_mb"] is not None]
+    all_turns = [turn for session in sessions for turn in session["turns"]]
+    return {
+        "sessions": len(sessions),
+        "turns": len(all_turns),
+        "api_turns": len(api_turns),
+        "errors": sum(1 for turn in all_turns if turn["source"] == "error"),
+        "local_turns": sum(1 for turn in all_turns if turn["source"] == "kb"),
+        "local_latency_p50": percentile([turn["latency"] for turn in all_turns if turn["source"] == "kb"], 0.5),
+        "throughput_turns_per_s": len(api_turns) / wall_time if wall_time else None,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "ttft_p50": percentile(ttfts, 0.5),
+        "ttft_p99": percentile(ttfts, 0.99),
+        "payload_bytes_mean": sum(payloads) / len(payloads) if payloads else None,
+        "payload_bytes_max": max(payloads) if payloads else None,
+        "encode_ms_p50": percentile(encodes, 0.5),
+        "encode_ms_max": max(encodes) if encodes else None,
+        "request_bytes_mean": sum(request_sizes) / len(request_sizes) if request_sizes else None,
+        "request_bytes_max": max(request_sizes) if request_sizes else None,
+        "peak_rss_mb_max": max(peaks) if peaks else None,
+    }
+
+
+def run_benchmarks(providers, scenarios, repeat=1, parallel=1, latency=0.05, token_rate=200.0, error_rate=0.0,
+                   reply_words=60, document_bytes=5 * 1024 * 1024, streaming=True, cache_mode="supported", gzip=False):
+    """Roda repeat sessões de cada provedor × cenário e retorna o relatório completo."""
+    # spawn: cada sessão começa num interpretador limpo, sem a memória das anteriores
+    context = multiprocessing.get_context("spawn")
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "repeat": repeat, "parallel": parallel, "latency": latency, "token_rate": token_rate,
+            "error_rate": error_rate, "reply_words": reply_words, "document_bytes": document_bytes,
+            "streaming": streaming, "cache_mode": cache_mode, "gzip": gzip,
+        },
+        "summary": {},
+        "sessions": [],
+    }
+    for provider in providers:
+        for scenario in scenarios:
+            specs = [{
+                "provider": provider, "scenario": scenario, "latency": latency, "token_rate": token_rate,
+                "error_rate": error_rate, "reply_words": reply_words, "document_bytes": document_bytes,
+                "streaming": streaming, "cache_mode": cache_mode, "gzip": gzip, "seed": index,
+            } for index in range(repeat)]
+            started_at = time.perf_counter()
+            with context.Pool(processes=parallel, maxtasksperchild=1) as pool:
+                sessions = pool.map(run_session, specs)
+            wall_time = time.perf_counter() - started_at
+            report["summary"][f"{provider}/{scenario}"] = summarize(sessions, wall_time)
+            report["sessions"].extend(sessions)
+    return report
+
+
+def compare(old_path, new_path):
+    """Texto com a variação de cada métrica entre dois relatórios."""
+    with open(old_path, "r", encoding="utf-8") as file:
+        old = json.load(file)["summary"]
+    with open(new_path, "r", encoding="utf-8") as file:
+        new = json.load(file)["summary"]
+    lines = []
+    for key in sorted(set(old) & set(new)):
+        lines.append(key)
+        for metric, new_value in new[key].items():
+            old_value = old[key].get(metric)
+            if not isinstance(new_value, (int, float)) or not isinstance(old_value, (int, float)):
+                continue
+            change = f"{(new_value - old_value) / old_value * 100:+.1f}%" if old_value else "-"
+            lines.append(f"  {metric}: {old_value:.4g} → {new_value:.4g} ({change})")
+    return "\n".join(lines)
+
+
+def format_summary(summary):
+    lines = []
+    for key, values in summary.items():
+        def fmt(value, unit=""):
+            return "-" if value is None else f"{value:.3f}{unit}" if isinstance(value, float) else f"{value}{unit}"
+
+        lines.append(
+            f"{key}: {values['api_turns']} turnos na API, {values['local_turns']} direto da KB, {values['errors']} erros, "
+            f"{fmt(values['throughput_turns_per_s'], ' turnos/s')}, "
+            f"latência p50 {fmt(values['latency_p50'], 's')} p99 {fmt(values['latency_p99'], 's')}, "
+            f"1º token p50 {fmt(values['ttft_p50'], 's')} p99 {fmt(values['ttft_p99'], 's')}, "
+            f"payload médio {fmt(values['payload_bytes_mean'], ' B')}, "
+            f"codificação p50 {fmt(values['encode_ms_p50'], ' ms')} máx {fmt(values['encode_ms_max'], ' ms')}, "
+            f"corpo enviado médio {fmt(values['request_bytes_mean'], ' B')}, pico RSS {fmt(values['peak_rss_mb_max'], ' MB')}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks da Kit contra o servidor local de testes")
+    parser.add_argument("--provider", nargs="+", choices=["gemini", "anthropic"], default=["gemini", "anthropic"])
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=1, help="sessões por provedor e cenário")
+    parser.add_argument("--parallel", type=int, default=1, help="sessões rodando ao mesmo tempo")
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos até o primeiro byte no mock")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="pedaços do stream por segundo no mock")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração das chamadas que responde 503")
+    parser.add_argument("--reply-words", type=int, default=60, help="tamanho da resposta do mock em palavras")
+    parser.add_argument("--document-mb", type=float, default=5.0, help="tamanho do documento grande em MB")
+    parser.add_argument("--sem-streaming", action="store_true")
+    parser.add_argument("--cache-mode", choices=["supported", "unsupported"], default="supported", help="suporte a cache de prompt no mock")
+    parser.add_argument("--gzip", action="store_true", help="comprime o corpo das requisições (KIT_GZIP_REQUESTS)")
+    parser.add_argument("-o", "--output", help="arquivo JSON de saída (padrão: benchmarks/results/<data>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois relatórios e sai")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(*args.compare))
+        sys.exit(0)
+
+    report = run_benchmarks(
+        args.provider, args.scenario, args.repeat, args.parallel, args.latency, args.token_rate, args.error_rate,
+        args.reply_words, int(args.document_mb * 1024 * 1024), not args.sem_streaming, args.cache_mode, args.gzip,
+    )
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(format_summary(report["summary"]))
+    print(f"\nResultados salvos em {output}")
@@ -0,0 +1,78 @@
+"""Sessões roteirizadas usadas nos benchmarks.
+
+Cada passo é uma mensagem enviada ao send_message do bot, como se fosse digitada no chat.
+"{documento_grande}" é trocado pelo caminho de um arquivo gerado na hora.
+"""
+import os
+import random
+
+SCENARIOS = {
+    "conversa_curta": [
+        "Onde fica o Jenkins?",
+        "E como faço deploy no ambiente de homologação?",
+        "Quem eu procuro se o pipeline quebrar?",
+    ],
+    "conversa_longa": [
+        "Oi Kit! Sou dev novo no time do ChocoPOV.",
+        "Qual é a stack do ChocoPOV?",
+        "Como configuro o ambiente de desenvolvimento?",
+        "E no Linux?",
+        "Onde ficam os repositórios?",
+        "Como funciona o code review?",
+        "E os testes automatizados?",
+        "Qual é o fluxo de deploy até produção?",
+        "Onde acompanho os logs de produção?",
+        "O que é a ChocoAPI?",
+        "Quem são os parceiros que usam a ChocoAPI?",
+        "Pode resumir o que conversamos?",
+    ],
+    "consultas": [
+        "qual a URL do Jenkins?",
+        "onde está o repositório da ChocoAPI?",
+        "qual a versão do Node?",
+        "qual a URL de homolog da ChocoAPI?",
+        "Como funciona o deploy em produção?",
+    ],
+    "documentos_grandes": [
+        "adicionar documento {documento_grande}",
+        "O que o documento diz sobre o processo de deploy?",
+        "E sobre o monitoramento dos serviços?",
+        "limpar contexto",
+        "Onde fica a wiki interna?",
+    ],
+}
+
+_WORDS = (
+    "deploy pipeline jenkins kubernetes docker cluster homologação produção serviço api "
+    "parceiro monitoramento alerta log banco postgres migração release rollback cache "
+    "fila worker chocopov chocoapi token autenticação permissão ambiente configuração "
+    "teste integração revisão merge branch versão incidente plantão métrica painel"
+).split()
+
+
+def write_large_document(path, size_bytes, seed=42):
+    """Gera um markdown sintético com seções ## até chegar em size_bytes."""
+    rng = random.Random(seed)
+    written = 0
+    section = 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < size_bytes:
+            section += 1
+            lines = [f"## Seção {section}: {rng.choice(_WORDS)} e {rng.choice(_WORDS)}\n\n"]
+            for _ in range(rng.randint(3, 8)):
+                sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 20)))
+                lines.append(sentence.capitalize() + ".\n")
+            lines.append("\n")
+            text = "".join(lines)
+            file.write(text)
+            written += len(text.encode("utf-8"))
+    return path
+
+
+def session_steps(name, workdir, document_bytes):
+    """Passos do cenário `name`, com os arquivos que ele usa gerados em workdir."""
+    steps = SCENARIOS[name]
+    if any("{documento_grande}" in step for step in steps):
+        document = write_large_document(os.path.join(workdir, "documento_grande.md"), document_bytes)
+        steps = [step.replace("{documento_grande}", document) for step in steps]
+    return list(steps)
@@ -0,0 +1,101 @@
+"""Mede o tempo de abertura dos bots e falha se passar do orçamento.
+
+Cada medição roda num interpretador novo: o import dos módulos do bot e a criação do bot
+(leitura da KB pelo snapshot, cache de respostas, provedores). Também confere que o
+requests só é importado na primeira chamada à API.
+
+Uso:
+    python -m benchmarks.startup                      # sai com código 1 se estourar o orçamento
+    python -m benchmarks.startup --import-budget-ms 60 --startup-budget-ms 100 --runs 9
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.runner import percentile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Orçamentos padrão com folga de ~2x sobre a máquina mais lenta medida (p50 de import em
+# ~40 ms num Xeon de 1 vCPU e ~95 ms num Linux de desenvolvimento, ambos com Python 3.11).
+# A ideia é pegar uma regressão grande (um import pesado no caminho da abertura), não ruído
+IMPORT_BUDGET_MS = 200.0
+STARTUP_BUDGET_MS = 300.0
+
+# Roda no processo filho; imprime os tempos em JSON
+_CHILD = """
+import json, sys, time
+started_at = time.perf_counter()
+from bots import load_bot_class
+bot_class = load_bot_class(sys.argv[1])
+imported_at = time.perf_counter()
+bot = bot_class()
+created_at = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported_at - started_at) * 1000,
+    "startup_ms": (created_at - started_at) * 1000,
+    "requests_imported": "requests" in sys.modules,
+}))
+"""
+
+
+def measure(provider, snapshot_path, cache_path):
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY="startup",
+        ANTHROPIC_API_KEY="startup",
+        KIT_PROVIDERS=provider,
+        KIT_KB_SNAPSHOT=snapshot_path,
+        KIT_CACHE_PATH=cache_path,
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD, provider], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_startup(providers, runs=5, import_budget_ms=IMPORT_BUDGET_MS, startup_budget_ms=STARTUP_BUDGET_MS):
+    """Retorna (relatório, lista de violações do orçamento)."""
+    report = {"import_budget_ms": import_budget_ms, "startup_budget_ms": startup_budget_ms, "providers": {}}
+    violations = []
+    workdir = tempfile.mkdtemp(prefix="kit-startup-")
+    for provider in providers:
+        snapshot_path = os.path.join(workdir, f"{provider}-kb.snapshot")
+        cache_path = os.path.join(workdir, f"{provider}-answers.sqlite3")
+        # A primeira abertura grava o snapshot; as seguintes medem o caminho normal
+        cold = measure(provider, snapshot_path, cache_path)
+        samples = [measure(provider, snapshot_path, cache_path) for _ in range(runs)]
+        result = {
+            "cold_startup_ms": cold["startup_ms"],
+            "import_ms_p50": percentile([sample["import_ms"] for sample in samples], 0.5),
+            "startup_ms_p50": percentile([sample["startup_ms"] for sample in samples], 0.5),
+            "requests_imported": any(sample["requests_imported"] for sample in samples),
+        }
+        report["providers"][provider] = result
+        if result["import_ms_p50"] > import_budget_ms:
+            violations.append(f"{provider}: import {result['import_ms_p50']:.1f}ms > {import_budget_ms:.0f}ms")
+        if result["startup_ms_p50"] > startup_budget_ms:
+            violations.append(f"{provider}: abertura {result['startup_ms_p50']:.1f}ms > {startup_budget_ms:.0f}ms")
+        if result["requests_imported"]:
+            violations.append(f"{provider}: o requests foi importado antes da primeira chamada à API")
+    return report, violations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de abertura dos bots, com orçamento")
+    parser.add_argument("--provider", nargs="+", choices=["gemini", "anthropic"], default=["gemini", "anthropic"])
+    parser.add_argument("--runs", type=int, default=5, help="aberturas medidas por provedor")
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("KIT_IMPORT_BUDGET_MS", IMPORT_BUDGET_MS)))
+    parser.add_argument("--startup-budget-ms", type=float, default=float(os.getenv("KIT_STARTUP_BUDGET_MS", STARTUP_BUDGET_MS)))
+    args = parser.parse_args()
+
+    report, violations = run_startup(args.provider, args.runs, args.import_budget_ms, args.startup_budget_ms)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if violations:
+        print("\nOrçamento de abertura estourado:")
+        for violation in violations:
+            print(f"- {violation}")
+        sys.exit(1)
@@ -0,0 +1,36 @@
+"""Acesso às classes dos bots a partir de outros módulos.
+
+Os scripts chatbot-onboarding*.py têm hífen no nome e não podem ser importados com
+import; este módulo carrega cada script uma única vez por processo.
+"""
+import importlib.util
+import os
+import sys
+import threading
+
+BOT_SCRIPTS = {
+    "gemini": ("chatbot_onboarding_gemini", "chatbot-onboarding-gemini.py", "GeminiChatbot"),
+    "anthropic": ("chatbot_onboarding", "chatbot-onboarding.py", "ClaudeChatbot"),
+}
+
+_lock = threading.Lock()
+
+
+def load_bot_class(provider="gemini"):
+    """Retorna a classe do bot do provedor ("gemini" ou "anthropic")."""
+    if provider not in BOT_SCRIPTS:
+        raise ValueError(f"Provedor desconhecido: {provider}")
+    module_name, filename, class_name = BOT_SCRIPTS[provider]
+    with _lock:
+        module = sys.modules.get(module_name)
+        if module is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[module_name]
+                raise
+    return getattr(module, class_name)
@@ -0,0 +1,178 @@
+"""Loop do chat no terminal com a resposta rodando em segundo plano.
+
+Enquanto a Kit responde dá para digitar a próxima pergunta, que espera a vez.
+'cancelar' ou Ctrl-C interrompem só a resposta em andamento, e a pergunta sai do
+histórico. Cada resposta tem um prazo (KIT_TURN_DEADLINE, em segundos; 0 desliga).
+Se a chamada ao provedor não parar logo depois do cancelamento (primeiro byte lento,
+resposta sem streaming), o prompt volta mesmo assim e a resposta que chegar é descartada;
+a thread do turno abandonado não mexe mais no estado da sessão. Fora da espera pelo
+provedor o trabalho é local, e o loop espera o turno terminar.
+Ctrl-C sem resposta em andamento (ou o segundo Ctrl-C) encerra o programa como antes.
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+from collections import deque
+
+from colorama import Fore, Style
+
+from chatbot_base import TurnCancelled
+
+EXIT_COMMANDS = ("sair", "exit", "quit")
+CANCEL_COMMAND = "cancelar"
+
+# Eventos da fila do loop
+LINE = "line"
+INTERRUPT = "interrupt"
+DONE = "done"
+
+# Quanto esperar o turno cancelado terminar sozinho antes de abandoná-lo
+CANCEL_GRACE = 0.5
+
+
+def turn_deadline_from_env():
+    deadline = float(os.getenv("KIT_TURN_DEADLINE", "120"))
+    return deadline or None
+
+
+class ChatLoop:
+    """REPL em asyncio para um bot com run_turn(pergunta) -> sair? e end_chat().
+
+    A leitura do teclado e o turno rodam em threads daemon e avisam o loop por uma
+    única fila de eventos; o turno é interrompido pelo bot.cancel_event.
+    """
+
+    def __init__(self, bot, prompt, deadline=None):
+        self.bot = bot
+        self.prompt = prompt
+        self.deadline = deadline
+        # Linhas digitadas enquanto a Kit respondia
+        self.pending = deque()
+        # Um turno abandonado ainda pode mandar DONE depois; o id separa o turno atual
+        self.turn_id = 0
+
+    def run(self):
+        """Roda até 'sair'; Ctrl-C sem turno em andamento vira KeyboardInterrupt, como no input()."""
+        if not asyncio.run(self.main()):
+            raise KeyboardInterrupt
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+        threading.Thread(target=self.read_lines, name="kit-input", daemon=True).start()
+        previous_handler = signal.signal(signal.SIGINT, lambda *_: self.post(INTERRUPT))
+        try:
+            while True:
+                if self.pending:
+                    line = self.pending.popleft()
+                    if line is not None:
+                        print(self.prompt + line)
+                else:
+                    print(self.prompt, end="", flush=True)
+                    kind, line = await self.events.get()
+                    while kind == DONE:
+                        # Fim de um turno abandonado: a resposta já foi descartada
+                        kind, line = await self.events.get()
+                    if kind == INTERRUPT:
+                        return False
+                if line is None or line.strip().lower() in EXIT_COMMANDS:
+                    self.bot.end_chat()
+                    return True
+                if line.strip().lower() == CANCEL_COMMAND:
+                    print(Fore.YELLOW + "Nenhuma resposta em andamento para cancelar." + Style.RESET_ALL)
+                    continue
+                outcome = await self.turn(line)
+                if outcome is not None:
+                    return outcome
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+
+    def post(self, kind, value=None):
+        # Chamado de outras threads (e do handler de sinal); o loop pode já ter terminado
+        try:
+            self.loop.call_soon_threadsafe(self.events.put_nowait, (kind, value))
+        except RuntimeError:
+            pass
+
+    def read_lines(self):
+        if sys.stdin.isatty():
+            while True:
+                try:
+                    line = input()
+                except EOFError:
+                    break
+                self.post(LINE, line)
+        else:
+            # Entrada redirecionada: um leitor próprio, porque esta thread fica parada na
+            # leitura até o fim do processo e não pode segurar o lock do sys.stdin
+            with open(sys.stdin.fileno(), encoding=sys.stdin.encoding, errors="replace", closefd=False) as lines:
+                for line in lines:
+                    self.post(LINE, line.rstrip("\r\n"))
+        self.post(LINE, None)
+
+    def run_turn(self, turn_id, user_input):
+        try:
+            self.post(DONE, (turn_id, self.bot.run_turn(user_input), None))
+        except Exception as error:
+            self.post(DONE, (turn_id, None, error))
+
+    def cancel(self, reason):
+        self.bot.cancel_event.set()
+        print(Fore.YELLOW + f"\n[{reason}]" + Style.RESET_ALL)
+
+    async def turn(self, user_input):
+        """Roda um turno; retorna True/False para encerrar o loop ou None para continuar."""
+        # Evento novo por turno: o turno abandonado continua vendo o seu, já ligado
+        self.bot.cancel_event = threading.Event()
+        self.turn_id += 1
+        threading.Thread(target=self.run_turn, args=(self.turn_id, user_input), name="kit-turn", daemon=True).start()
+        deadline = self.loop.time() + self.deadline if self.deadline else None
+        cancelled = False
+        while True:
+            if cancelled:
+                timeout = None if grace_deadline is None else max(0.0, grace_deadline - self.loop.time())
+            else:
+                timeout = None if deadline is None else max(0.0, deadline - self.loop.time())
+            try:
+                kind, value = await asyncio.wait_for(self.events.get(), timeout)
+            except asyncio.TimeoutError:
+                if cancelled:
+                    # O provedor não largou a chamada: a pergunta sai do histórico agora
+                    # e o turno termina em segundo plano, sem resposta
+                    if self.bot.abandon_turn():
+                        return None
+                    # O turno não está no provedor (trabalho local ou resposta já gravada):
+                    # termina logo, e o próximo não pode começar antes
+                    grace_deadline = None
+                    continue
+                self.cancel(f"Resposta cancelada: passou de {self.deadline:g}s")
+                cancelled = True
+                grace_deadline = self.loop.time() + CANCEL_GRACE
+                continue
+            if kind == DONE:
+                if value[0] == self.turn_id:
+                    break
+                continue
+            if kind == INTERRUPT:
+                # Segundo Ctrl-C: o usuário quer sair mesmo
+                if cancelled:
+                    return False
+                self.cancel("Resposta cancelada")
+                cancelled = True
+                grace_deadline = self.loop.time() + CANCEL_GRACE
+            elif value is not None and value.strip().lower() == CANCEL_COMMAND:
+                if not cancelled:
+                    self.cancel("Resposta cancelada")
+                    cancelled = True
+                    grace_deadline = self.loop.time() + CANCEL_GRACE
+            else:
+                self.pending.append(value)
+
+        _, should_exit, error = value
+        if isinstance(error, TurnCancelled):
+            return None
+        if error is not None:
+            raise error
+        return True if should_exit else None
@@ -1,35 +1,38 @@
+import argparse
 import os
-import requests
-import json
 import random
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 
+from chatbot_base import OnboardingChatbot
+from history_window import turn_text
+from session_store import EVENT_CHOCOLATE, EVENT_INTERACTION, EVENT_RESET
+from session_summary import RollingSummarizer
+
 # colorama
 init()
 load_dotenv()
 
-class GeminiChatbot:
-    def __init__(self):
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("API key não encontrada. Adicione a GOOGLE_API_KEY no .env")
-        
-        # API configuration
-        self.api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
-        self.headers = {"Content-Type": "application/json"}
-        
-        # Chat state tracking
-        self.gemini_history = []
-        self.interaction_summary = []
-        self.response_count = 0
-        self.max_responses = 3
-        
-        # Load company knowledge
-        self.company_knowledge = self.load_company_knowledge()
+SUMMARY_HEADER = """
+        ╔══════════════════════════════════════════════════════════════════════════════════════════════════════╗
+        ║    🍫 RESUMO DA NOSSA CONVERSA CHOCOLATUDA 🍫                                                       ║
+        ╚══════════════════════════════════════════════════════════════════════════════════════════════════════╝
         
-        # System prompt setup
-        self.system_prompt = f"""
+        """
+
+SUMMARY_FOOTER = """
+        ╔══════════════════════════════════════════════════════════════════════════════════════════════════════╗
+        ║    Obrigado por usar a Kit, seja bem vindo à empresa! 🍫                                             ║
+        ║    O chat será encerrado agora.                                                                      ║
+        ╚══════════════════════════════════════════════════════════════════════════════════════════════════════╝
+        """
+
+
+class GeminiChatbot(OnboardingChatbot):
+    provider_name = "gemini"
+    
+    # System prompt setup
+    system_prompt_template = """
         Você é a Kit, uma assistente de IA especializada em DevOps e onboarding de desenvolvedores.
         Seu tom é amigável, você usa emojis de chocolate 🍫 e faz piadas com chocolate ocasionalmente para manter o tema da empresa Choco-dev.
         
@@ -41,13 +44,13 @@ class GeminiChatbot:
         - Explicar funcionamento de esteiras de automação da empresa.
         
         INFORMAÇÕES IMPORTANTES SOBRE A EMPRESA CHOCO-DEV:
-        {self.company_knowledge}        
+        {company_knowledge}        
         Quando não souber uma resposta específica sobre processos internos da Choco-dev, 
         você deve indicar isso e sugerir que o desenvolvedor consulte a wiki interna ou 
         alguém do seu time.
         """
-        
-        self.welcome_message = """
+    
+    welcome_message = """
         ╔════════════════════════════════════════════════════════════════════════════════════════════════════════╗
          ║    🍫 Olá, Dev Chocolateiro! 🍫                                                                     ║
         ║                                                                                                        ║
@@ -65,53 +68,32 @@ class GeminiChatbot:
         ╚════════════════════════════════════════════════════════════════════════════════════════════════════════╝
         """
 
-    def load_company_knowledge(self):
-        """Carrega informações da empresa a partir de um arquivo."""
-        try:
-            with open("./KB-CHOCODEV.txt", "r", encoding="utf-8") as file:
-                return file.read()
-        except FileNotFoundError:
-            # Conhecimento base caso não ache o arquivo
-            return """
-            Stack de Tecnologia: Python, React native, Node.js, PostgreSQL
-            Ferramentas DevOps: Docker, Kubernetes, Jenkins, GitLab CI/CD
-            Principais Projetos: ChocoPOV (sistema de ponto de venda) e ChocoAPI (API para parceiros)
-            Ambientes: Desenvolvimento, Homologação, Produção
-            Wiki interna: https://wiki.choco-dev.internal
-            Repositório de código: GitLab em https://gitlab.choco-dev.internal
-            """
+    def __init__(self):
+        # Provedores, KB, documentos e caches ficam na base comum (chatbot_base.py)
+        super().__init__()
+        
+        # Chat state tracking
+        self.interaction_summary = []
+        # Resumo de cada interação feito em segundo plano, pronto na hora de sair ou reiniciar
+        self.summarizer = RollingSummarizer()
+        self.response_count = 0
+        self.max_responses = int(os.getenv("KIT_MAX_RESPONSES", "3"))
 
     def add_document_context(self, document_path, document_name):
-        """Adiciona um documento como contexto para a conversa."""
-        try:
-            with open(document_path, "r", encoding="utf-8") as file:
-                content = file.read()
-                
-            # Adiciona o documento ao histórico Gemini
-            self.gemini_history.append({
-                "role": "user",
-                "parts": [{"text": f"Aqui está um documento importante da Choco-dev que você deve usar como referência: {document_name}\n\n{content}"}]
-            })
-            
-            # Simula uma resposta do assistente
-            response_text = f"Obrigado por compartilhar o documento '{document_name}'. Vou usar essas informações para ajudar melhor nas suas dúvidas sobre a Choco-dev."
-            
-            # Adiciona a resposta ao histórico Gemini
-            self.gemini_history.append({
-                "role": "model",
-                "parts": [{"text": response_text}]
-            })
-            
-            # Registra esta interação no resumo
-            self.interaction_summary.append({
+        """Adiciona arquivo, pasta ou glob ao índice de documentos da sessão."""
+        report = super().add_document_context(document_path, document_name)
+        
+        if report.files_added:
+            # Registra esta interação no resumo (também no replay da sessão, que passa por aqui)
+            entry = {
                 "user": f"Compartilhou documento: {document_name}",
-                "assistant": response_text
-            })
-            
-            return True
-        except Exception as e:
-            print(Fore.PURPLE + f"Erro ao adicionar documento: {str(e)}" + Style.RESET_ALL)
-            return False
+                "assistant": f"Obrigado por compartilhar o documento '{document_name}'. Vou usar essas informações para ajudar melhor nas suas dúvidas sobre a Choco-dev."
+            }
+            self.interaction_summary.append(entry)
+            # Sem isso o resumo em segundo plano fica com uma entrada a menos e cai no de palavras-chave
+            self.summarizer.submit(entry["user"], entry["assistant"])
+        
+        return report
     
     # easter egg
     def get_chocolate_fact(self):
@@ -137,16 +119,27 @@ class GeminiChatbot:
     
     # Resumo
     def generate_interaction_summary(self):
-        """Gera um resumo com parágrafos para cada título de interação na conversa."""
+        """Resumo da conversa inteira a partir dos resumos feitos em segundo plano.
+
+        Se algum ainda não ficou pronto, usa o resumo por palavras-chave.
+        """
         if len(self.interaction_summary) == 0:
             return "Não houve interações nesta sessão para resumir."
         
-        summary = """
-        ╔══════════════════════════════════════════════════════════════════════════════════════════════════════╗
-        ║    🍫 RESUMO DA NOSSA CONVERSA CHOCOLATUDA 🍫                                                       ║
-        ╚══════════════════════════════════════════════════════════════════════════════════════════════════════╝
+        entries = self.summarizer.result()
+        if entries is None or len(entries) != len(self.interaction_summary):
+            return self.keyword_interaction_summary()
         
-        """
+        summary = SUMMARY_HEADER
+        for i, (interaction_title, interaction_summary) in enumerate(entries):
+            summary += f"🍫 **Interação {i+1}** - {interaction_title}\n"
+            summary += f"Resumo: {interaction_summary}\n\n"
+        summary += SUMMARY_FOOTER
+        return summary
+
+    def keyword_interaction_summary(self):
+        """Gera um resumo com parágrafos para cada título de interação na conversa (por palavras-chave)."""
+        summary = SUMMARY_HEADER
         
         # Limitar para as últimas 3 interações (ou menos se houver menos)
         interactions_to_show = self.interaction_summary[-self.max_responses:]
@@ -204,60 +197,99 @@ class GeminiChatbot:
             summary += f"🍫 **Interação {i+1}** - {interaction_title}\n"
             summary += f"Resumo: {interaction_summary}\n\n"
         
-        summary += """
-        ╔══════════════════════════════════════════════════════════════════════════════════════════════════════╗
-        ║    Obrigado por usar a Kit, seja bem vindo à empresa! 🍫                                             ║
-        ║    O chat será encerrado agora.                                                                      ║
-        ╚══════════════════════════════════════════════════════════════════════════════════════════════════════╝
-        """
+        summary += SUMMARY_FOOTER
         
         return summary
 
-    def send_message(self, user_input):
+
+    def register_response(self, user_input, assistant_message):
+        """Registra a resposta no resumo e aplica o limite de interações."""
+        # Registra esta interação no resumo com limitação de tamanho
+        user_message_short = user_input[:200] + "..." if len(user_input) > 200 else user_input
+        # A pergunta e a resposta já estão no log como turnos; aqui só a contagem
+        self.record_event(EVENT_INTERACTION)
+        
+        self.interaction_summary.append({
+            "user": user_message_short,
+            "assistant": assistant_message
+        })
+        self.summarizer.submit(user_message_short, assistant_message)
+        
+        # Lógica das 3 interações
+        self.response_count += 1
+        remaining = self.max_responses - self.response_count
+        if remaining > 0:
+            assistant_message += f"\n\n[Você ainda tem {remaining} interação(ões) disponível(is) nesta sessão]"
+        should_exit = self.response_count >= self.max_responses
+        return assistant_message, should_exit
+
+    def clear_context(self):
+        super().clear_context()
+        self.interaction_summary = []
+        self.summarizer.clear()
+
+    def session_state(self):
+        state = super().session_state()
+        state["interactions"] = [[entry["user"], entry["assistant"]] for entry in self.interaction_summary]
+        state["response_count"] = self.response_count
+        return state
+
+    def restore_session_state(self, state):
+        super().restore_session_state(state)
+        self.interaction_summary = [{"user": user, "assistant": assistant} for user, assistant in state["interactions"]]
+        self.summarizer.clear()
+        for entry in self.interaction_summary:
+            self.summarizer.submit(entry["user"], entry["assistant"])
+        self.response_count = state["response_count"]
+
+    def replay_event(self, kind, text):
+        if kind == EVENT_INTERACTION:
+            # Os dois últimos turnos do histórico são a pergunta e a resposta contadas
+            self.register_response(turn_text(self.history[-2]), turn_text(self.history[-1]))
+        elif kind == EVENT_CHOCOLATE:
+            self.interaction_summary.append({"user": "Solicitou um fato sobre chocolate", "assistant": text})
+            self.summarizer.submit("Curiosidade sobre chocolate", text)
+            self.response_count += 1
+        elif kind == EVENT_RESET:
+            self.clear_context()
+            self.response_count = 0
+        else:
+            super().replay_event(kind, text)
+
+    def send_message(self, user_input, on_chunk=None):
+        self.last_turn = None
+        
         # Verifica se o limite de respostas foi atingido
         if self.response_count >= self.max_responses:
             summary = self.generate_interaction_summary()
             self.reset_chat()
             return summary, True  # Retorna o resumo e sinaliza para sair
         
-        # Comandos especiais
-        if user_input.lower() == "comandos":
-            return self.show_commands(), False
-        
         if user_input.lower() == "reiniciar":
             if self.response_count > 0:
                 summary = self.generate_interaction_summary()
                 self.reset_chat()
-                return summary + "\n\nChat reiniciado! Agora você tem 3 novas interações disponíveis. 🍫", False
+                return summary + f"\n\nChat reiniciado! Agora você tem {self.max_responses} novas interações disponíveis. 🍫", False
             else:
                 self.reset_chat()
-                return "Chat reiniciado! Agora você tem 3 novas interações disponíveis. 🍫", False
-        
-        if user_input.lower().startswith("adicionar documento "):
-            parts = user_input.split(" ", 2)
-            if len(parts) == 3:
-                document_path = parts[2]
-                document_name = os.path.basename(document_path)
-                success = self.add_document_context(document_path, document_name)
-                if success:
-                    return f"Documento '{document_name}' adicionado ao contexto! 🍫 Agora posso te ajudar com base nessas informações.", False
-                else:
-                    return f"Não foi possível adicionar o documento. Verifique se o caminho está correto.", False
+                return f"Chat reiniciado! Agora você tem {self.max_responses} novas interações disponíveis. 🍫", False
         
-        if user_input.lower() == "limpar contexto":
-            self.gemini_history = []
-            self.interaction_summary = []
-            return "Contexto da conversa foi limpo! 🍫 Mantendo apenas meu conhecimento base sobre a Choco-dev.", False
+        # comandos, adicionar documento, limpar contexto
+        command_response = self.handle_common_command(user_input)
+        if command_response is not None:
+            return command_response, False
 
         # Easter egg do chocolate
         if user_input.strip() == "chocolate":
             fact = self.get_chocolate_fact()
+            self.record_event(EVENT_CHOCOLATE, fact)
             
             # Registra esta interação no resumo
             self.interaction_summary.append({
                 "user": "Solicitou um fato sobre chocolate",
                 "assistant": fact
             })
+            self.summarizer.submit("Curiosidade sobre chocolate", fact)
             
             self.response_count += 1
             
@@ -268,72 +300,10 @@ class GeminiChatbot:
                 
             return fact, self.response_count >= self.max_responses
 
-        # Adiciona a mensagem ao formato Gemini
-        self.gemini_history.append({
-            "role": "user",
-            "parts": [{"text": user_input}]
-        })
-        
-        # Configs pro Gemini
-        request_data = {
-            "contents": self.gemini_history,
-            "generationConfig": {
-                "temperature": 0.88,
-                "maxOutputTokens": 1000,
-                "topP": 0.95
-            }
-        }
-        
-        # Adiciona o system prompt como instrução do sistema
-        if self.system_prompt:
-            request_data["systemInstruction"] = {
-                "parts": [{"text": self.system_prompt}]
-            }
-        
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=request_data
-            )
-            
-            response.raise_for_status()
-            response_data = response.json()
-            
-            # Extrai a resposta do formato da API do Gemini
-            assistant_message = response_data["candidates"][0]["content"]["parts"][0]["text"]
-            
-            # Adiciona ao histórico Gemini 
-            self.gemini_history.append({
-                "role": "model",
-                "parts": [{"text": assistant_message}]
-            })
-            
-            # Registra esta interação no resumo com limitação de tamanho
-            user_message_short = user_input[:200] + "..." if len(user_input) > 200 else user_input
-            
-            self.interaction_summary.append({
-                "user": user_message_short,
-                "assistant": assistant_message
-            })
-            
-            # Lógica das 3 interações
-            self.response_count += 1
-            remaining = self.max_responses - self.response_count
-            if remaining > 0:
-                assistant_message += f"\n\n[Você ainda tem {remaining} interação(ões) disponível(is) nesta sessão]"
-            should_exit = self.response_count >= self.max_responses
-            return assistant_message, should_exit
-            
-        except requests.exceptions.RequestException as e:
-            error_message = f"Erro ao comunicar com a API: {str(e)}"
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_detail = e.response.json()
-                    error_message += f"\nDetalhes: {json.dumps(error_detail, indent=2)}"
-                except:
-                    error_message += f"\nCódigo de status: {e.response.status_code}"
-            return error_message, False
+        assistant_message, ok = self.ask(user_input, on_chunk)
+        if not ok:
+            return assistant_message, False
+        return self.register_response(user_input, assistant_message)
 
     def show_commands(self):
         """Exibe comandos especiais disponíveis"""
@@ -341,53 +311,96 @@ class GeminiChatbot:
         🍫 Comandos disponíveis:
         - 'adicionar documento [caminho]': Adiciona um documento ao contexto da conversa
         - 'limpar contexto': Remove o histórico de mensagens, mantendo apenas o conhecimento base
+        - 'fixar': Mantém a última pergunta e resposta no histórico mesmo em conversas longas
         - 'reiniciar': Reinicia o chat e reseta o contador de interações (gera resumo se houver interações)
         - 'comandos': Mostra esta lista de comandos
+        - 'estatisticas': Mostra latência (p50/p95) e tokens usados nesta sessão
+        - 'cancelar' (ou Ctrl-C): Interrompe a resposta em andamento
         - 'chocolate': Easter egg
         - 'sair', 'exit', 'quit': Encerra o chat
         """
         return commands
 
     def start_chat(self):
+        # asyncio só é importado aqui: modo servidor e batch não usam o loop do terminal
+        from chat_loop import ChatLoop, turn_deadline_from_env
+        
         print(Fore.RED + self.welcome_message + Style.RESET_ALL)
+        ChatLoop(self, Fore.WHITE + "\nVocê: " + Style.RESET_ALL, turn_deadline_from_env()).run()
+
+    def end_chat(self):
+        if self.response_count > 0:
+            summary = self.generate_interaction_summary()
+            print(Fore.CYAN + "\nKit: " + Style.RESET_ALL + summary)
+        else:
+            print(Fore.RED + "\nKit: Até logo! Foi um prazer ajudar no seu onboarding na Choco-dev! 🍫" + Style.RESET_ALL)
+        self.close_session(finished=True)
+
+    def run_turn(self, user_input):
+        """Responde uma pergunta no terminal (numa thread do ChatLoop); retorna True para encerrar o chat."""
+        streamed = []
         
-        while True:
-            user_input = input(Fore.WHITE + "\nVocê: " + Style.RESET_ALL)
-            
-            if user_input.lower() in ["sair", "exit", "quit"]:
-                if self.response_count > 0:
-                    summary = self.generate_interaction_summary()
-                    print(Fore.CYAN + "\nKit: " + Style.RESET_ALL + summary)
-                else:
-                    print(Fore.RED + "\nKit: Até logo! Foi um prazer ajudar no seu onboarding na Choco-dev! 🍫" + Style.RESET_ALL)
-                break
-                
-            response, should_exit = self.send_message(user_input)
+        def print_chunk(text):
+            if not streamed:
+                print(Fore.RED + "\nKit: " + Style.RESET_ALL, end="", flush=True)
+            streamed.append(text)
+            print(text, end="", flush=True)
+        
+        response, should_exit = self.send_message(user_input, on_chunk=print_chunk)
+        streamed_text = "".join(streamed)
+        if not streamed:
             print(Fore.RED + "\nKit: " + Style.RESET_ALL + response)
-            
-            # Saída
-            if should_exit:
-                summary = self.generate_interaction_summary()
-                print(Fore.RED + "\nKit: " + Style.RESET_ALL + summary)
-                break
+        elif response.startswith(streamed_text):
+            # O texto já apareceu no terminal; falta só o aviso de interações
+            print(response[len(streamed_text):])
+        else:
+            print("\n" + response)
+        
+        if self.profile:
+            print(Fore.YELLOW + self.metrics.turn_report() + Style.RESET_ALL)
+        
+        # Saída
+        if should_exit:
+            summary = self.generate_interaction_summary()
+            print(Fore.RED + "\nKit: " + Style.RESET_ALL + summary)
+            self.close_session(finished=True)
+        return should_exit
 
     def reset_chat(self):
-        self.gemini_history = []
-        self.interaction_summary = []
+        self.record_event(EVENT_RESET)
+        self.clear_context()
         self.response_count = 0
-        print(Fore.RED + "Conversa reiniciada!" + Style.RESET_ALL)
-        print(Fore.RED + self.welcome_message + Style.RESET_ALL)
+        if self.verbose:
+            print(Fore.RED + "Conversa reiniciada!" + Style.RESET_ALL)
+            print(Fore.RED + self.welcome_message + Style.RESET_ALL)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kit, a assistente de onboarding da Choco-dev (Gemini)")
+    parser.add_argument("--profile", action="store_true", help="mostra o tempo de cada etapa e os tokens de cada resposta")
+    parser.add_argument("--retomar", nargs="?", const="", metavar="ID", help="continua uma sessão salva (sem ID, a última não encerrada)")
+    args = parser.parse_args()
+    
     print(Fore.RED + "\n=== Carregando o sistema ===\n" + Style.RESET_ALL)
     
+    chatbot = None
     try:
         chatbot = GeminiChatbot()
+        if args.profile:
+            chatbot.enable_profile()
+        session_notice = chatbot.open_session(args.retomar)
+        if session_notice:
+            print(Fore.YELLOW + session_notice + Style.RESET_ALL)
         chatbot.start_chat()
+        if args.profile:
+            print(Fore.YELLOW + "\n" + chatbot.metrics.summary_text() + Style.RESET_ALL)
         print(Fore.WHITE + "\n\nEncerrando o programa. Até logo! 🍫" + Style.RESET_ALL)
     except ValueError as e:
         print(Fore.RED + f"Erro de configuração: {str(e)}" + Style.RESET_ALL)
         print("Confira a chave da API de IA no .env como GOOGLE_API_KEY=sua_chave_aqui")
     except KeyboardInterrupt:
+        # Histórico, resumo e contagem de interações ficam salvos para o --retomar
+        if chatbot is not None and chatbot.session_log is not None:
+            chatbot.close_session()
+            print(Fore.YELLOW + f"\nConversa salva. Para continuar: --retomar {chatbot.session_log.session_id}" + Style.RESET_ALL)
         print(Fore.WHITE + "\n\nEncerrando o programa. Até logo! 🍫" + Style.RESET_ALL)
\ No newline at end of file
@@ -1,37 +1,20 @@
-import os
-import requests
-import json
-import base64
+import argparse
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
 
+from chatbot_base import OnboardingChatbot
+
 # Inicializa colorama para formatação de terminal
 init()
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
-class ClaudeChatbot:
-    def __init__(self):
-        self.api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not self.api_key:
-            raise ValueError("API key não encontrada. Adicione a ANTHROPIC_API_KEY no .env")
-        
-        self.base_url = "https://api.anthropic.com/v1/messages"
-        self.headers = {
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        
-        # Histórico de mensagens para manter o contexto
-        self.messages = []
-        
-        # Carrega a base de conhecimentos da empresa
-        self.company_knowledge = self.load_company_knowledge()
-        
-        # Contexto do sistema para o assistente
-        self.system_prompt = f"""
+class ClaudeChatbot(OnboardingChatbot):
+    provider_name = "anthropic"
+    
+    # Contexto do sistema para o assistente
+    system_prompt_template = """
         Você é o Kit, uma assistente de IA especializada em DevOps e onboarding de desenvolvedores.
         Seu tom é amigável, você usa emojis de chocolate 🍫 e faz piadas com chocolate ocasionalmente para manter o tema da empresa Choco-dev.
         
@@ -43,13 +26,13 @@ class ClaudeChatbot:
         - Explicar funcionamento de esteiras de automação da empresa.
         
         INFORMAÇÕES IMPORTANTES SOBRE A EMPRESA CHOCO-DEV:
-        {self.company_knowledge}        
+        {company_knowledge}        
         Quando não souber uma resposta específica sobre processos internos da Choco-dev, 
         você deve indicar isso e sugerir que o desenvolvedor consulte a wiki interna ou 
         alguém do seu time.
         """
-        
-        self.welcome_message = """
+    
+    welcome_message = """
         Olá! Eu sou Kit, serei a sua assistente de Onboarding na empresa Choco-dev! 🍫
         
         Como posso ajudar você hoje? 
@@ -64,96 +47,16 @@ class ClaudeChatbot:
         Digite 'comandos' para ver opções especiais disponíveis.
         """
 
-    def load_company_knowledge(self):
-        """Carrega informações da empresa a partir de um arquivo."""
-        try:
-            with open("company_knowledge.txt", "r", encoding="utf-8") as file:
-                return file.read()
-        except FileNotFoundError:
-            # Conhecimento base caso o arquivo não exista
-            return """
-            Stack de Tecnologia: Python, React native, Node.js, PostgreSQL
-            Ferramentas DevOps: Docker, Kubernetes, Jenkins, GitLab CI/CD
-            Principais Projetos: ChocoPOV (sistema de ponto de venda) e ChocoAPI (API para parceiros)
-            Ambientes: Desenvolvimento, Homologação, Produção
-            Wiki interna: https://wiki.choco-dev.internal
-            Repositório de código: GitLab em https://gitlab.choco-dev.internal
-            """
-
-    def add_document_context(self, document_path, document_name):
-        """Adiciona um documento como contexto para a conversa."""
-        try:
-            with open(document_path, "r", encoding="utf-8") as file:
-                content = file.read()
-                
-            # Adiciona o documento como uma mensagem do sistema
-            system_message = {
-                "role": "user", 
-                "content": f"Aqui está um documento importante da Choco-dev que você deve usar como referência: {document_name}\n\n{content}"
-            }
-            self.messages.append(system_message)
-            
-            # Adiciona resposta a adição para manter o fluxo de conversa
-            self.messages.append({
-                "role": "assistant",
-                "content": f"Obrigado por compartilhar o documento '{document_name}'. Vou usar essas informações para ajudar melhor nas suas dúvidas sobre a Choco-dev."
-            })
-            
-            return True
-        except Exception as e:
-            print(Fore.PURPLE + f"Erro ao adicionar documento: {str(e)}" + Style.RESET_ALL)
-            return False
-
-    def send_message(self, user_input):
-        # REVER ADIÇÃO DE DOC AO CONTEXTO PARA FUNCIONAR
-        if user_input.lower() == "comandos":
-            return self.show_commands()
+    def send_message(self, user_input, on_chunk=None):
+        self.last_turn = None
         
-        if user_input.lower().startswith("adicionar documento "):
-            parts = user_input.split(" ", 2)
-            if len(parts) == 3:
-                document_path = parts[2]
-                document_name = os.path.basename(document_path)
-                success = self.add_document_context(document_path, document_name)
-                if success:
-                    return f"Documento '{document_name}' adicionado ao contexto! 🍫 Agora posso te ajudar com base nessas informações."
-                else:
-                    return f"Não foi possível adicionar o documento. Verifique se o caminho está correto."
+        # comandos, adicionar documento, limpar contexto
+        command_response = self.handle_common_command(user_input)
+        if command_response is not None:
+            return command_response
         
-        if user_input.lower() == "limpar contexto":
-            self.messages = []
-            return "Contexto da conversa foi limpo! 🍫 Mantendo apenas meu conhecimento base sobre a Choco-dev."
-            
-        # Append mensagem do usuário ao histórico
-        self.messages.append({"role": "user", "content": user_input})
-        
-        data = {
-            "model": "claude-3-sonnet-20240229",
-            "max_tokens": 1000,
-            "messages": self.messages,
-            "system": self.system_prompt,
-            "temperature": 0.7
-        }
-        
-        try:
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json=data
-            )
-            
-            response.raise_for_status()
-            response_data = response.json()
-            
-            assistant_message = response_data["content"][0]["text"]
-            
-            # Append resposta do assistente ao histórico
-            self.messages.append({"role": "assistant", "content": assistant_message})
-            
-            return assistant_message
-            
-        except requests.exceptions.RequestException as e:
-            return f"Erro ao comunicar com a API: {str(e)}"
+        assistant_message, _ = self.ask(user_input, on_chunk)
+        return assistant_message
 
     def show_commands(self):
         """Exibe comandos especiais disponíveis"""
@@ -161,38 +64,78 @@ class ClaudeChatbot:
         🍫 Comandos disponíveis:
         - 'adicionar documento [caminho]': Adiciona um documento ao contexto da conversa
         - 'limpar contexto': Remove o histórico de mensagens, mantendo apenas o conhecimento base
+        - 'fixar': Mantém a última pergunta e resposta no histórico mesmo em conversas longas
         - 'comandos': Mostra esta lista de comandos
+        - 'estatisticas': Mostra latência (p50/p95) e tokens usados nesta sessão
+        - 'cancelar' (ou Ctrl-C): Interrompe a resposta em andamento
         - 'sair', 'exit', 'quit': Encerra o chat
         """
         return commands
 
     def start_chat(self):
+        # asyncio só é importado aqui: modo servidor e batch não usam o loop do terminal
+        from chat_loop import ChatLoop, turn_deadline_from_env
+        
         print(Fore.RED + self.welcome_message + Style.RESET_ALL)
-        #
-        while True:
-            user_input = input(Fore.WHITE + "\nVocê: " + Style.RESET_ALL)
-            
-            if user_input.lower() in ["sair", "exit", "quit"]:
-                print(Fore.RED + "\nKit: Até logo! Foi um prazer ajudar no seu onboarding na Choco-dev! 🍫" + Style.RESET_ALL)
-                break
-                
-            response = self.send_message(user_input)
+        ChatLoop(self, Fore.WHITE + "\nVocê: " + Style.RESET_ALL, turn_deadline_from_env()).run()
+
+    def end_chat(self):
+        print(Fore.RED + "\nKit: Até logo! Foi um prazer ajudar no seu onboarding na Choco-dev! 🍫" + Style.RESET_ALL)
+        self.close_session(finished=True)
+
+    def run_turn(self, user_input):
+        """Responde uma pergunta no terminal (numa thread do ChatLoop); retorna True para encerrar o chat."""
+        streamed = []
+        
+        def print_chunk(text):
+            if not streamed:
+                print(Fore.CYAN + "\nKit: " + Style.RESET_ALL, end="", flush=True)
+            streamed.append(text)
+            print(text, end="", flush=True)
+        
+        response = self.send_message(user_input, on_chunk=print_chunk)
+        if streamed and response == "".join(streamed):
+            print()
+        elif streamed:
+            print("\n" + response)
+        else:
             print(Fore.CYAN + "\nKit: " + Style.RESET_ALL + response)
+        
+        if self.profile:
+            print(Fore.YELLOW + self.metrics.turn_report() + Style.RESET_ALL)
+        return False
 
     def reset_chat(self):
-        self.messages = []
+        self.clear_context()
         print(Fore.CYAN + "Conversa reiniciada!" + Style.RESET_ALL)
         print(Fore.RED + self.welcome_message + Style.RESET_ALL)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kit, a assistente de onboarding da Choco-dev (Anthropic)")
+    parser.add_argument("--profile", action="store_true", help="mostra o tempo de cada etapa e os tokens de cada resposta")
+    parser.add_argument("--retomar", nargs="?", const="", metavar="ID", help="continua uma sessão salva (sem ID, a última não encerrada)")
+    args = parser.parse_args()
+    
     print(Fore.RED + "\n=== Kit & seu onboarding está sendo iniciado ===\n" + Style.RESET_ALL)
     
+    chatbot = None
     try:
         chatbot = ClaudeChatbot()
+        if args.profile:
+            chatbot.enable_profile()
+        session_notice = chatbot.open_session(args.retomar)
+        if session_notice:
+            print(Fore.YELLOW + session_notice + Style.RESET_ALL)
         chatbot.start_chat()
+        if args.profile:
+            print(Fore.YELLOW + "\n" + chatbot.metrics.summary_text() + Style.RESET_ALL)
     except ValueError as e:
         print(Fore.RED + f"Erro de configuração: {str(e)}" + Style.RESET_ALL)
         print("Confira a chave da API de IA no .env")
     except KeyboardInterrupt:
+        # A conversa fica salva para o --retomar
+        if chatbot is not None and chatbot.session_log is not None:
+            chatbot.close_session()
+            print(Fore.YELLOW + f"\nConversa salva. Para continuar: --retomar {chatbot.session_log.session_id}" + Style.RESET_ALL)
         print(Fore.WHITE + "\n\nEncerrando o programa. Até logo! 🍫" + Style.RESET_ALL)
\ No newline at end of file
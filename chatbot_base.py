@@ -0,0 +1,552 @@
+import json
+import os
+import threading
+import time
+
+from colorama import Fore, Style
+
+from answer_cache import open_answer_cache
+from doc_ingest import DocumentIndex, ingest_message
+from history_window import PINNED, ConversationWindow, turn_text
+from http_client import request_exceptions
+from kb_index import KB_PATH, format_sections
+from kb_lookup import lookup_matcher
+from kb_reload import shared_knowledge_store
+from memory_index import ConversationMemory
+from metrics import NULL_TRACE, SessionMetrics, shared_metrics_registry, tracing_enabled
+from providers import SystemPrompt
+from router import router_from_env
+from scheduler import turn_priority
+from session_store import EVENT_ASSISTANT, EVENT_CANCEL, EVENT_CLEAR, EVENT_DOCUMENT, EVENT_PIN, EVENT_USER, SessionLog, SessionNotFound, shared_session_store
+from sse import StreamError
+from text_utils import estimate_tokens
+
+# Conhecimento base caso não ache o arquivo da KB
+FALLBACK_KNOWLEDGE = """
+            Stack de Tecnologia: Python, React native, Node.js, PostgreSQL
+            Ferramentas DevOps: Docker, Kubernetes, Jenkins, GitLab CI/CD
+            Principais Projetos: ChocoPOV (sistema de ponto de venda) e ChocoAPI (API para parceiros)
+            Ambientes: Desenvolvimento, Homologação, Produção
+            Wiki interna: https://wiki.choco-dev.internal
+            Repositório de código: GitLab em https://gitlab.choco-dev.internal
+            """
+
+
+def format_api_error(error):
+    """Mensagem para o usuário quando a chamada ao provedor falha."""
+    error_message = f"Erro ao comunicar com a API: {str(error)}"
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            error_message += f"\nDetalhes: {json.dumps(response.json(), indent=2)}"
+        except ValueError:
+            error_message += f"\nCódigo de status: {response.status_code}"
+    return error_message
+
+
+class TurnCancelled(Exception):
+    """O turno foi cancelado (cancel_event) antes de terminar; a pergunta já saiu do histórico."""
+
+
+def confined_document_path(spec, root):
+    """Caminho real de `spec` (relativo a `root`) se ficar dentro de `root`; None se sair dela ou tiver curinga."""
+    spec = spec.strip().strip('"').strip("'")
+    if any(char in spec for char in "*?[~"):
+        return None
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, spec))
+    return path if os.path.commonpath([path, root]) == root else None
+
+
+def document_name(document_path):
+    return os.path.basename(document_path.rstrip("/\\")) or document_path
+
+
+class OnboardingChatbot:
+    """Parte comum dos bots: KB, documentos, comandos e a chamada ao provedor pelo roteador.
+
+    As subclasses definem provider_name (provedor padrão), system_prompt_template,
+    welcome_message e o próprio send_message.
+    """
+
+    provider_name = None
+    system_prompt_template = None
+    welcome_message = None
+
+    def __init__(self):
+        self.streaming = os.getenv("KIT_STREAMING", "1").lower() not in ("0", "false", "nao", "não")
+        self.debug = os.getenv("KIT_DEBUG", "").lower() in ("1", "true", "sim")
+
+        # Provedores (KIT_PROVIDERS) com failover e hedging; o primeiro é o preferido
+        self.router = router_from_env(self.provider_name, self.streaming, self.debug)
+        self.model = self.router.primary.model
+
+        # Histórico no formato do provedor preferido; cada provedor converte ao enviar
+        self.history = []
+        self.turn_timings = []
+        # Último turno respondido pelo modelo ou pelo cache (resposta crua, usage, tempos); usado pelo modo batch
+        self.last_turn = None
+        self.verbose = True  # False no modo servidor: nada de banners no terminal
+        # None: 'adicionar documento' lê qualquer caminho (terminal). No modo servidor é a
+        # única pasta de onde o cliente pode adicionar documentos, ou "" para desligar o comando
+        self.document_root = None
+        # Ligado por quem roda o turno (chat_loop.py) para interromper a resposta em andamento;
+        # cada turno do chat_loop ganha um evento novo
+        self.cancel_event = threading.Event()
+        # Pergunta do turno que está no provedor (e desde quando), e a trava entre esse turno
+        # e abandon_turn()
+        self.pending_turn = None
+        self.pending_since = 0.0
+        self._turn_lock = threading.Lock()
+
+        # Latências e tokens por turno; as etapas só são medidas com tracing ligado (KIT_TRACE ou --profile)
+        self.metrics = SessionMetrics(shared_metrics_registry(), tracing=tracing_enabled())
+        self.profile = False
+
+        # Janela de histórico: limita os tokens enviados à API
+        self.history_window = ConversationWindow(int(os.getenv("KIT_HISTORY_TOKEN_BUDGET", "8000")))
+
+        # Documentos adicionados viram trechos indexados; só os relevantes vão em cada pergunta
+        self.document_index = DocumentIndex(max_workers=int(os.getenv("KIT_INGEST_WORKERS", "4")))
+        self.doc_top_k = int(os.getenv("KIT_DOC_TOP_K", "3"))
+        self.doc_token_budget = int(os.getenv("KIT_DOC_TOKEN_BUDGET", "1500"))
+
+        # Trocas que já saíram da janela do histórico voltam ao prompt quando são parecidas com a pergunta
+        self.memory_enabled = os.getenv("KIT_MEMORY", "1").lower() not in ("0", "false", "nao", "não")
+        self.memory = ConversationMemory(int(os.getenv("KIT_MEMORY_MAX_KB", "256")) * 1024)
+        self.memory_top_k = int(os.getenv("KIT_MEMORY_TOP_K", "2"))
+        self.memory_token_budget = int(os.getenv("KIT_MEMORY_TOKEN_BUDGET", "1000"))
+
+        # Caminho rápido: consultas diretas à KB ("qual a URL do Jenkins?") respondidas sem o modelo
+        self.fast_path = os.getenv("KIT_FAST_PATH", "1").lower() not in ("0", "false", "nao", "não")
+        self.fast_path_threshold = float(os.getenv("KIT_FAST_PATH_THRESHOLD", "0.8"))
+
+        # Recuperação: só as seções relevantes da KB vão em cada requisição
+        self.kb_top_k = int(os.getenv("KIT_KB_TOP_K", "4"))
+        self.prompt_token_budget = int(os.getenv("KIT_PROMPT_TOKEN_BUDGET", "2000"))
+
+        # Sessão gravada em disco (session_store.py); None até start_session
+        self.session_log = None
+        self.document_paths = []
+
+        # KB compartilhada no processo e recarregada quando o arquivo muda
+        self.knowledge_store = shared_knowledge_store(KB_PATH, FALLBACK_KNOWLEDGE)
+        self.knowledge = None
+        self.refresh_knowledge()
+
+    def refresh_knowledge(self):
+        """Passa a usar a versão atual da KB; retorna True se ela mudou desde o último turno."""
+        current = self.knowledge_store.current
+        if current is self.knowledge:
+            return False
+        # Cache persistente de respostas (chave: pergunta, versão da KB e modelo preferido);
+        # continua desligado se quem criou o bot o desligou (kit_batch --sem-cache)
+        if self.knowledge is None or self.answer_cache is not None:
+            self.answer_cache = open_answer_cache(current.version, f"{self.router.primary.name}/{self.model}")
+        self.knowledge = current
+        self.company_knowledge = current.text
+        self.knowledge_base = current.knowledge_base
+        # Prefixo estático (persona + KB completa) para o cache de prompt no provedor
+        self.static_system_prompt = self.system_prompt_template.format(company_knowledge=current.text)
+        return True
+
+    def enable_profile(self):
+        """--profile: mede as etapas de cada turno e mostra os tempos no terminal."""
+        self.profile = True
+        self.metrics.tracing = True
+
+    def make_turn(self, role, text):
+        return self.router.primary.make_turn(role, text)
+
+    def append_turn(self, role, text):
+        self.record_event(EVENT_USER if role == "user" else EVENT_ASSISTANT, text)
+        if role != "user":
+            self.remember_exchange(text)
+        self.history.append(self.make_turn(role, text))
+
+    def remember_exchange(self, answer):
+        """Guarda a pergunta pendente e a resposta na memória da conversa."""
+        if self.memory_enabled and self.history and self.history[-1]["role"] == "user":
+            self.memory.add(turn_text(self.history[-1]), answer)
+
+    def pin_last_exchange(self):
+        """Fixa a última pergunta e resposta (sobrevivem ao corte do histórico); False se não houver."""
+        if len(self.history) < 2 or self.history[-1]["role"] == "user" or self.history[-2]["role"] != "user":
+            return False
+        self.record_event(EVENT_PIN)
+        for turn in self.history[-2:]:
+            turn[PINNED] = True
+        return True
+
+    def cancel_pending_turn(self):
+        """Tira do histórico a pergunta que ficou sem resposta."""
+        if self.history and self.history[-1]["role"] == "user":
+            self.record_event(EVENT_CANCEL)
+            self.history.pop()
+
+    def abandon_turn(self):
+        """Cancela o turno que espera o provedor sem esperar a chamada terminar.
+
+        A pergunta sai do histórico agora e o turno conta como cancelado; a thread dele
+        não mexe em mais nada quando o provedor responder. Retorna False se o turno não
+        estiver esperando o provedor (trabalho local ou resposta já gravada): aí quem
+        chamou precisa esperar ele terminar.
+        """
+        self.cancel_event.set()
+        with self._turn_lock:
+            pending = self.pending_turn
+            if pending is None:
+                return False
+            self.pending_turn = None
+            self.rollback_turn(pending)
+            self.last_turn = {"source": "cancelled"}
+            self.metrics.record(NULL_TRACE, "cancelled", time.perf_counter() - self.pending_since)
+        return True
+
+    def owns_turn(self, pending):
+        """Chamado com _turn_lock: a pergunta `pending` ainda é a última (o turno não foi abandonado)."""
+        return bool(self.history) and self.history[-1] is pending
+
+    def rollback_turn(self, pending):
+        # Só tira a pergunta se ela ainda for a última (abandon_turn pode ter chegado antes)
+        if pending is not None and self.owns_turn(pending):
+            self.cancel_pending_turn()
+
+    # Sessão em disco
+
+    def start_session(self, store, session_id=None):
+        """Começa uma sessão nova no store ou, com session_id, continua uma sessão salva.
+
+        Retorna o id da sessão. session_id "" retoma a última sessão não encerrada.
+        """
+        if session_id is None:
+            self.session_log = SessionLog(store, store.create(self.provider_name))
+            return self.session_log.session_id
+        session_id, _, snapshot, snapshot_seq, events = store.load(session_id)
+        # Replay sem log aberto: nada do que já está gravado é gravado de novo
+        self.session_log = None
+        verbose, self.verbose = self.verbose, False
+        try:
+            if snapshot is not None:
+                self.restore_session_state(snapshot)
+            for _, kind, text in events:
+                self.replay_event(kind, text)
+        finally:
+            self.verbose = verbose
+        last_seq = events[-1][0] if events else snapshot_seq
+        self.session_log = SessionLog(store, session_id, last_seq, snapshot_seq)
+        return session_id
+
+    def open_session(self, session_id=None):
+        """start_session no arquivo de sessões do processo; retorna o aviso para o terminal (None com KIT_SESSIONS=0)."""
+        store = shared_session_store()
+        if store is None:
+            return None
+        notice = ""
+        if session_id is not None:
+            try:
+                session_id = self.start_session(store, session_id)
+                return f"Sessão {session_id} retomada ({len(self.history)} mensagens no histórico). 🍫"
+            except SessionNotFound:
+                notice = f"Sessão {session_id or 'anterior'} não encontrada, começando uma nova.\n"
+        session_id = self.start_session(store)
+        return notice + f"Sessão {session_id} (para continuar depois: --retomar {session_id})"
+
+    def record_event(self, kind, text=""):
+        """Grava o evento no log da sessão; chame antes de mudar o estado que ele descreve."""
+        if self.session_log is None:
+            return
+        # O estado ainda é o dos eventos anteriores: é o momento certo para o snapshot
+        if self.session_log.snapshot_due:
+            self.session_log.snapshot(self.session_state())
+        self.session_log.record(kind, text)
+
+    def close_session(self, finished=False):
+        """Grava o que falta; finished marca a sessão como encerrada (a compactação pode apagá-la)."""
+        if self.session_log is None:
+            return
+        if finished:
+            self.session_log.snapshot(self.session_state(), finished=True)
+        self.session_log.flush()
+
+    def session_state(self):
+        """Estado para o snapshot: só o final do histórico que ainda vai para a API e os documentos."""
+        return {
+            "history": [
+                [turn["role"] == "user", turn_text(turn)] + ([True] if turn.get(PINNED) else [])
+                for turn in self.history_window.retained(self.history)
+            ],
+            "documents": self.document_paths,
+            "memory": self.memory.dump(),
+        }
+
+    def restore_session_state(self, state):
+        self.history = []
+        for is_user, text, *pinned in state["history"]:
+            turn = self.make_turn("user" if is_user else "assistant", text)
+            if pinned:
+                turn[PINNED] = True
+            self.history.append(turn)
+        # Snapshots gravados antes da memória não têm a chave; a memória recomeça da janela
+        self.memory.load(state.get("memory", []))
+        for path in state["documents"]:
+            self.add_document_context(path, document_name(path))
+
+    def replay_event(self, kind, text):
+        """Aplica um evento do log sem chamar o modelo; tipos desconhecidos são ignorados."""
+        if kind == EVENT_USER:
+            self.history.append(self.make_turn("user", text))
+        elif kind == EVENT_ASSISTANT:
+            self.remember_exchange(text)
+            self.history.append(self.make_turn("assistant", text))
+        elif kind == EVENT_CLEAR:
+            self.clear_context()
+        elif kind == EVENT_DOCUMENT:
+            self.add_document_context(text, document_name(text))
+        elif kind == EVENT_CANCEL:
+            self.cancel_pending_turn()
+        elif kind == EVENT_PIN:
+            self.pin_last_exchange()
+
+    def retrieval_query(self, user_input):
+        # A pergunta anterior ajuda em follow-ups como "e no Linux?"
+        previous_user_turns = [turn for turn in self.history if turn["role"] == "user"]
+        if previous_user_turns:
+            return turn_text(previous_user_turns[-1])[:200] + " " + user_input
+        return user_input
+
+    def build_system_prompt(self, query):
+        """Monta o system prompt só com as seções da KB relevantes para a pergunta."""
+        section_budget = self.prompt_token_budget - estimate_tokens(self.system_prompt_template)
+        selected = self.knowledge_base.select(query, self.kb_top_k, section_budget)
+
+        if self.debug:
+            print(Fore.YELLOW + "[debug] Seções da KB selecionadas:" + Style.RESET_ALL)
+            for section, score in selected:
+                print(Fore.YELLOW + f"  - {section.title} (score {score:.2f}, ~{section.tokens} tokens)" + Style.RESET_ALL)
+
+        return self.system_prompt_template.format(company_knowledge=format_sections(selected))
+
+    def add_document_context(self, document_path, document_name):
+        """Adiciona arquivo, pasta ou glob ao índice de documentos da sessão."""
+        report = self.document_index.add_paths(document_path, root=self.document_root or None)
+        for path, error in report.errors:
+            print(Fore.MAGENTA + f"Erro ao adicionar documento {path}: {error}" + Style.RESET_ALL)
+        if report.files_added:
+            # Caminho absoluto: a sessão pode ser retomada de outra pasta
+            path = os.path.abspath(document_path)
+            self.record_event(EVENT_DOCUMENT, path)
+            self.document_paths.append(path)
+        return report
+
+    def build_document_context(self, user_input):
+        """Trechos dos documentos adicionados que são relevantes para a pergunta."""
+        selected = self.document_index.select(user_input, self.doc_top_k, self.doc_token_budget)
+        if self.debug and selected:
+            print(Fore.YELLOW + "[debug] Trechos de documentos selecionados:" + Style.RESET_ALL)
+            for section, score in selected:
+                print(Fore.YELLOW + f"  - {section.title} (score {score:.2f}, ~{section.tokens} tokens)" + Style.RESET_ALL)
+        if not selected:
+            return ""
+        return "Trechos de documentos da Choco-dev compartilhados por mim (use como referência):\n\n" + format_sections(selected)
+
+    def build_memory_context(self, user_input, window):
+        """Trocas antigas, fora da janela, que são relevantes para a pergunta."""
+        if not self.memory_enabled:
+            return ""
+        # As respostas que ainda estão na janela já vão inteiras para a API
+        recent = sum(1 for turn in window if turn["role"] != "user")
+        selected = self.memory.search(user_input, self.memory_top_k, self.memory_token_budget, skip_recent=recent)
+        if self.debug and selected:
+            print(Fore.YELLOW + "[debug] Trocas antigas recuperadas da memória:" + Style.RESET_ALL)
+            for exchange, score in selected:
+                print(Fore.YELLOW + f"  - {exchange.title} (score {score:.2f}, ~{exchange.tokens} tokens)" + Style.RESET_ALL)
+        if not selected:
+            return ""
+        return "Trechos anteriores desta conversa, relevantes para a pergunta:\n\n" + format_sections(selected)
+
+    def build_turns(self):
+        """Histórico que cabe no orçamento de tokens, com os documentos expandidos."""
+        turns = self.history_window.build(self.history)
+        # Os trechos de documentos entram só na pergunta atual, não ficam no histórico
+        question = turn_text(self.history[-1])
+        document_context = self.build_document_context(question)
+        self.history_window.prepend_to_last(turns, document_context)
+        self.history_window.prepend_to_last(turns, self.build_memory_context(question, turns))
+        if self.debug:
+            report = self.history_window.last_report
+            print(Fore.YELLOW + f"[debug] Histórico: {report['turns_before']} → {report['turns_after']} turnos, "
+                  f"~{report['tokens_before']} → ~{report['tokens_after']} tokens, "
+                  f"{report['bytes_before']} → {report['bytes_after']} bytes" + Style.RESET_ALL)
+        return turns
+
+    def clear_context(self):
+        self.record_event(EVENT_CLEAR)
+        self.history = []
+        self.document_index.clear()
+        self.document_paths = []
+        self.memory.clear()
+
+    def handle_common_command(self, user_input):
+        """Comandos comuns aos bots; retorna a mensagem para o usuário ou None se não for comando."""
+        if user_input.lower() == "comandos":
+            return self.show_commands()
+
+        if user_input.lower().startswith("adicionar documento "):
+            parts = user_input.split(" ", 2)
+            if len(parts) == 3:
+                document_path = parts[2]
+                if self.document_root is not None:
+                    if not self.document_root:
+                        return "Adicionar documentos não está disponível neste servidor."
+                    document_path = confined_document_path(document_path, self.document_root)
+                    if document_path is None:
+                        return "Só dá para adicionar documentos da pasta de documentos do servidor (sem curingas)."
+                name = document_name(document_path)
+                report = self.add_document_context(document_path, name)
+                return ingest_message(report, name)
+
+        if user_input.strip().lower() == "fixar":
+            if not self.pin_last_exchange():
+                return "Ainda não há resposta para fixar. 🍫"
+            return "Última pergunta e resposta fixadas! 🍫 Elas continuam no histórico mesmo quando a conversa ficar longa."
+
+        if user_input.lower() == "limpar contexto":
+            self.clear_context()
+            return "Contexto da conversa foi limpo! 🍫 Mantendo apenas meu conhecimento base sobre a Choco-dev."
+
+        if user_input.strip().lower() in ("estatisticas", "estatísticas"):
+            return self.metrics.summary_text() + "\n" + self.memory.summary_text()
+        return None
+
+    def answer_locally(self, user_input):
+        """Resposta tirada direto da KB para perguntas de consulta, ou None se não houver confiança."""
+        if not self.fast_path:
+            return None
+        fact, confidence = lookup_matcher(self.knowledge_base).match(user_input)
+        if self.debug and fact is not None:
+            print(Fore.YELLOW + f"[debug] Caminho rápido: {fact.key!r} (confiança {confidence:.2f}, mínimo {self.fast_path_threshold:.2f})" + Style.RESET_ALL)
+        if fact is None or confidence < self.fast_path_threshold:
+            return None
+        return "⚡ Resposta rápida, direto da KB (sem chamar o modelo):\n" + fact.answer(), confidence
+
+    def ask(self, user_input, on_chunk=None):
+        """Responde a pergunta pelo cache de respostas ou pelo provedor e grava o turno no histórico.
+
+        Retorna (texto, sucesso); em caso de erro o texto é a mensagem de erro para o usuário.
+        Levanta TurnCancelled se cancel_event for ligado antes da resposta terminar.
+        """
+        trace = self.metrics.start_turn()
+        started_at = time.perf_counter()
+        cancel = self.cancel_event
+        # A KB pode ter sido recarregada enquanto a sessão estava parada
+        if self.refresh_knowledge() and self.debug:
+            print(Fore.YELLOW + f"[debug] KB recarregada (versão {self.knowledge.generation}, {self.knowledge.version})" + Style.RESET_ALL)
+
+        local = self.answer_locally(user_input)
+        if local is not None:
+            assistant_message, confidence = local
+            self.append_turn("user", user_input)
+            self.append_turn("assistant", assistant_message)
+            if on_chunk:
+                on_chunk(assistant_message)
+            self.last_turn = {"source": "kb", "answer": assistant_message, "confidence": confidence}
+            self.metrics.record(trace, "kb", time.perf_counter() - started_at)
+            return assistant_message, True
+
+        # Só perguntas que abrem a conversa usam o cache: a resposta depende apenas da pergunta e da KB
+        use_cache = self.answer_cache is not None and not self.history and not len(self.document_index)
+        if use_cache:
+            cached = self.answer_cache.get(user_input)
+            if cached is not None:
+                assistant_message, similarity = cached
+                if self.debug:
+                    print(Fore.YELLOW + f"[debug] Resposta vinda do cache (similaridade {similarity:.2f})" + Style.RESET_ALL)
+                self.append_turn("user", user_input)
+                self.append_turn("assistant", assistant_message)
+                if on_chunk:
+                    on_chunk(assistant_message)
+                self.last_turn = {"source": "cache", "answer": assistant_message, "similarity": similarity}
+                self.metrics.record(trace, "cache", time.perf_counter() - started_at)
+                return assistant_message, True
+
+        query = self.retrieval_query(user_input)
+        system = SystemPrompt(self.static_system_prompt, self.knowledge_base.version, lambda: self.build_system_prompt(query))
+        with self._turn_lock:
+            self.append_turn("user", user_input)
+            pending = self.history[-1]
+
+        def forward(text):
+            # Levantar aqui fecha o stream; o texto que chegar depois não aparece mais
+            if cancel.is_set():
+                raise TurnCancelled()
+            on_chunk(text)
+
+        try:
+            with trace.span("build"):
+                turns = self.build_turns()
+            # Só a espera pelo provedor pode ser abandonada (abandon_turn); antes dela é tudo local
+            with self._turn_lock:
+                if cancel.is_set():
+                    raise TurnCancelled()
+                self.pending_turn = pending
+                self.pending_since = started_at
+            # id(self): cada bot é uma sessão na fila de admissão do provedor
+            reply = self.router.generate(system, turns, forward if on_chunk else None, trace, session=id(self), priority=turn_priority(user_input))
+        except TurnCancelled:
+            self.drop_turn(pending, trace, started_at)
+        except (request_exceptions().RequestException, StreamError) as e:
+            # O erro de um turno já cancelado não interessa mais a ninguém
+            with self._turn_lock:
+                settled = self.owns_turn(pending) and not cancel.is_set()
+                if settled:
+                    self.pending_turn = None
+            if not settled:
+                self.drop_turn(pending, trace, started_at)
+            error_message = format_api_error(e)
+            self.last_turn = {"source": "error", "error": error_message}
+            self.metrics.record(trace, "error", time.perf_counter() - started_at)
+            return error_message, False
+
+        # Sem streaming não há pedaços para interromper: a resposta é descartada ao chegar.
+        # A trava garante que abandon_turn() não tira a pergunta depois da resposta entrar;
+        # daí em diante o turno não pode mais ser abandonado e termina sozinho
+        with self._turn_lock:
+            settled = self.owns_turn(pending) and not cancel.is_set()
+            if settled:
+                self.pending_turn = None
+                self.append_turn("assistant", reply.text)
+        if not settled:
+            self.drop_turn(pending, trace, started_at)
+
+        # Tempo até o primeiro token (igual ao total quando não há streaming)
+        finished_at = time.perf_counter()
+        self.turn_timings.append({
+            "ttft": (reply.first_token_at or finished_at) - started_at,
+            "total": finished_at - started_at,
+            "streamed": reply.first_token_at is not None,
+            "provider": reply.provider,
+            "encode": reply.request.encode_seconds if reply.request else None,
+            "request_bytes": reply.request.size if reply.request else None
+        })
+        self.last_turn = dict(self.turn_timings[-1], source="api", answer=reply.text, usage=reply.usage, coalesced=reply.coalesced)
+        self.metrics.record(trace, "api", self.turn_timings[-1]["total"], reply.provider, self.turn_timings[-1]["ttft"], reply.usage)
+        if self.debug and len(self.router.providers) > 1:
+            print(Fore.YELLOW + f"\n[debug] Respondido por {reply.provider} (1º token em {self.turn_timings[-1]['ttft']:.2f}s)" + Style.RESET_ALL)
+
+        if use_cache:
+            self.answer_cache.put(user_input, reply.text)
+        return reply.text, True
+
+    def drop_turn(self, pending, trace, started_at):
+        """Desfaz o turno cancelado e levanta TurnCancelled."""
+        with self._turn_lock:
+            # Turno abandonado: abandon_turn já desfez e contou o turno, e outro turno pode
+            # estar em andamento; nada do estado da sessão é mais desta thread
+            if not self.owns_turn(pending):
+                raise TurnCancelled()
+            self.pending_turn = None
+            self.rollback_turn(pending)
+            self.last_turn = {"source": "cancelled"}
+        self.metrics.record(trace, "cancelled", time.perf_counter() - started_at)
+        raise TurnCancelled()
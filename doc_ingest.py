@@ -0,0 +1,186 @@
+import glob
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kb_index import BM25Index, Section, select_within_budget
+from text_utils import tokenize
+
+# Extensões lidas quando o usuário aponta uma pasta inteira
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".markdown", ".rst", ".html", ".htm", ".csv", ".json",
+    ".yaml", ".yml", ".ini", ".cfg", ".conf", ".log", ".xml", ".adoc",
+}
+
+
+def expand_document_paths(spec):
+    """Transforma arquivo, pasta ou glob numa lista ordenada de arquivos."""
+    spec = os.path.expanduser(spec.strip().strip('"').strip("'"))
+    if any(char in spec for char in "*?["):
+        paths = [path for path in glob.glob(spec, recursive=True) if os.path.isfile(path)]
+    elif os.path.isdir(spec):
+        paths = []
+        for root, directories, files in os.walk(spec):
+            # Pastas ocultas (.git, .venv...) não são documentação
+            directories[:] = [name for name in directories if not name.startswith(".")]
+            for name in files:
+                if not name.startswith(".") and os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS:
+                    paths.append(os.path.join(root, name))
+    elif os.path.isfile(spec):
+        paths = [spec]
+    else:
+        paths = []
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def read_chunks(path, chunk_chars=1600):
+    """Lê o arquivo linha a linha e retorna (hash do arquivo, trechos) sem carregar tudo de uma vez.
+
+    Os cortes acontecem de preferência em linhas em branco ou em títulos.
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    current = []
+    current_size = 0
+    with open(path, "rb") as file:
+        if b"\x00" in file.read(1024):
+            raise ValueError("arquivo binário")
+        file.seek(0)
+        for raw_line in file:
+            digest.update(raw_line)
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+            boundary = not line.strip() or line.lstrip().startswith("#")
+            if current and (current_size >= chunk_chars * 1.5 or (boundary and current_size >= chunk_chars)):
+                chunks.append("\n".join(current).strip())
+                current, current_size = [], 0
+            current.append(line)
+            current_size += len(line) + 1
+    if current and "\n".join(current).strip():
+        chunks.append("\n".join(current).strip())
+    return digest.hexdigest(), [chunk for chunk in chunks if chunk]
+
+
+class IngestReport:
+    """Resumo de uma chamada a DocumentIndex.add_paths."""
+
+    def __init__(self):
+        self.files_added = []
+        self.files_unchanged = []
+        self.errors = []
+        self.chunks_added = 0
+        self.chunks_duplicated = 0
+
+    @property
+    def files_found(self):
+        return len(self.files_added) + len(self.files_unchanged) + len(self.errors)
+
+
+class DocumentIndex:
+    """Índice de recuperação dos documentos que o usuário adicionou na sessão."""
+
+    def __init__(self, chunk_chars=1600, max_workers=4):
+        self.chunk_chars = chunk_chars
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.chunks = []
+        self.index = BM25Index()
+        # hash do trecho -> [doc_id, quantos trechos de arquivos apontam para ele]
+        self.chunk_refs = {}
+        # caminho -> (mtime, hash do arquivo): evita reprocessar arquivo que não mudou
+        self.files = {}
+        # caminho -> hashes dos trechos do arquivo, inclusive os que já existiam em outro arquivo
+        self.file_chunks = {}
+
+    def __len__(self):
+        return self.index.doc_count
+
+    def _load(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+            known = self.files.get(path)
+            if known and known[0] == mtime:
+                return path, mtime, known[1], None, None
+            digest, chunks = read_chunks(path, self.chunk_chars)
+            return path, mtime, digest, chunks, None
+        except (OSError, ValueError) as error:
+            return path, None, None, None, error
+
+    def add_paths(self, spec, root=None):
+        """Adiciona arquivo, pasta ou glob ao índice, lendo os arquivos em paralelo.
+
+        Com `root`, arquivos cujo caminho real (links resolvidos) fica fora dela são ignorados.
+        """
+        report = IngestReport()
+        paths = expand_document_paths(spec)
+        if root is not None:
+            root = os.path.realpath(root)
+            paths = [path for path in paths if os.path.commonpath([os.path.realpath(path), root]) == root]
+        if not paths:
+            return report
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as executor:
+            for path, mtime, digest, chunks, error in executor.map(self._load, paths):
+                if error is not None:
+                    report.errors.append((path, str(error)))
+                    continue
+                with self._lock:
+                    known = self.files.get(path)
+                    self.files[path] = (mtime, digest)
+                    if chunks is None or (known and known[1] == digest):
+                        report.files_unchanged.append(path)
+                        continue
+                    self._add_chunks(path, chunks, report)
+                    report.files_added.append(path)
+        return report
+
+    def _add_chunks(self, path, chunks, report):
+        name = os.path.basename(path)
+        chunk_hashes = []
+        for number, text in enumerate(chunks, start=1):
+            chunk_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            chunk_hashes.append(chunk_hash)
+            if chunk_hash in self.chunk_refs:
+                self.chunk_refs[chunk_hash][1] += 1
+                report.chunks_duplicated += 1
+                continue
+            title = f"{name} (trecho {number})"
+            self.chunks.append(Section(len(self.chunks), title, f"[{title}]\n{text}"))
+            self.chunk_refs[chunk_hash] = [self.index.add(tokenize(name) + tokenize(text)), 1]
+            report.chunks_added += 1
+
+        # Arquivo alterado: os trechos da versão anterior que nenhum outro arquivo tem saem da busca.
+        # Os novos entram antes, para que um trecho que continua no arquivo não seja reindexado
+        removed = []
+        for chunk_hash in self.file_chunks.get(path, []):
+            entry = self.chunk_refs[chunk_hash]
+            entry[1] -= 1
+            if not entry[1]:
+                del self.chunk_refs[chunk_hash]
+                removed.append(entry[0])
+                self.chunks[entry[0]] = None
+        self.index.remove(removed)
+        self.file_chunks[path] = chunk_hashes
+
+    def select(self, query, top_k=3, token_budget=1500):
+        """Trechos mais relevantes para a pergunta que cabem no orçamento de tokens."""
+        with self._lock:
+            if not self.chunk_refs:
+                return []
+            ranked = [(self.chunks[doc_id], score) for doc_id, score in self.index.search(tokenize(query), top_k)]
+        return select_within_budget(ranked, token_budget)
+
+
+def ingest_message(report, document_name):
+    """Mensagem para o usuário depois do comando 'adicionar documento'."""
+    if report.files_added:
+        message = f"Documento '{document_name}' adicionado ao contexto! 🍫 Agora posso te ajudar com base nessas informações."
+        if len(report.files_added) > 1 or report.files_unchanged:
+            message += f" ({len(report.files_added)} arquivo(s) novos, {report.chunks_added} trecho(s) indexados)"
+        return message
+    if report.files_unchanged:
+        return f"Documento '{document_name}' já estava no contexto e não mudou. 🍫"
+    return "Não foi possível adicionar o documento. Verifique se o caminho está correto."
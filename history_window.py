@@ -0,0 +1,119 @@
+import json
+from collections import deque
+
+from text_utils import estimate_tokens
+
+# Campos com "_" no começo são metadados locais e nunca vão para a API
+PINNED = "_pinned"
+
+
+def turn_text(turn):
+    """Texto de um turno no formato Gemini (parts) ou Anthropic (content)."""
+    if "parts" in turn:
+        return "".join(part.get("text", "") for part in turn["parts"])
+    return turn["content"]
+
+
+def with_text(turn, text):
+    """Cópia limpa do turno (sem metadados locais) com outro texto."""
+    if "parts" in turn:
+        return {"role": turn["role"], "parts": [{"text": text}]}
+    return {"role": turn["role"], "content": text}
+
+
+def payload_size(turns):
+    return len(json.dumps(turns, ensure_ascii=False).encode("utf-8"))
+
+
+class ConversationWindow:
+    """Mantém o histórico enviado à API dentro de um orçamento de tokens.
+
+    Na hora de montar a requisição os turnos mais antigos são condensados numa
+    nota curta. Turnos fixados (comando 'fixar') nunca saem, mas contam no orçamento.
+    """
+
+    def __init__(self, token_budget=8000):
+        self.token_budget = token_budget
+        self.reports = deque(maxlen=200)
+
+    def build(self, history):
+        """Retorna os turnos (limpos) que cabem no orçamento e registra o antes/depois."""
+        turns = [with_text(turn, turn_text(turn)) for turn in history]
+        tokens = [estimate_tokens(turn_text(turn)) for turn in turns]
+        report = {
+            "turns_before": len(turns),
+            "tokens_before": sum(tokens),
+            "bytes_before": payload_size(turns),
+        }
+
+        keep = [True] * len(turns)
+        total = sum(tokens)
+        dropped = []
+        # O último turno é a pergunta atual e nunca sai; os mais antigos saem primeiro
+        for index in range(len(turns) - 1):
+            if total <= self.token_budget:
+                break
+            if history[index].get(PINNED):
+                continue
+            keep[index] = False
+            total -= tokens[index]
+            dropped.append(turns[index])
+
+        window = []
+        for index, (turn, kept) in enumerate(zip(turns, keep)):
+            if not kept:
+                continue
+            # Depois de uma troca fixada o trecho mantido pode começar numa resposta: os
+            # papéis precisam alternar, então ela vai para a nota junto com a pergunta dela
+            if window and turn["role"] == window[-1]["role"] and not history[index].get(PINNED) and index < len(turns) - 1:
+                dropped.append(turn)
+                continue
+            window.append(turn)
+        # A conversa enviada precisa começar com o usuário
+        while len(window) > 1 and window[0]["role"] != "user":
+            dropped.append(window.pop(0))
+
+        if dropped:
+            note = self.condense(dropped)
+            first = window[0]
+            window[0] = with_text(first, note + "\n\n" + turn_text(first))
+
+        report.update({
+            "turns_after": len(window),
+            "tokens_after": sum(estimate_tokens(turn_text(turn)) for turn in window),
+            "bytes_after": payload_size(window),
+        })
+        self.reports.append(report)
+        return window
+
+    def retained(self, history, condensed_turns=10):
+        """Final do histórico que ainda pesa no build: os turnos que cabem no orçamento,
+        os últimos condensed_turns que viram a nota de resumo e os fixados."""
+        total = 0
+        start = len(history)
+        while start > 0 and total <= self.token_budget:
+            start -= 1
+            total += estimate_tokens(turn_text(history[start]))
+        start = max(0, start - condensed_turns)
+        return [turn for turn in history[:start] if turn.get(PINNED)] + history[start:]
+
+    def condense(self, dropped):
+        """Resumo de uma linha por turno removido, para o modelo não perder o fio da conversa."""
+        lines = ["[Resumo de mensagens anteriores, removidas para economizar contexto]"]
+        if len(dropped) > 10:
+            lines.append(f"- ({len(dropped) - 10} mensagens mais antigas omitidas)")
+        for turn in dropped[-10:]:
+            speaker = "Usuário" if turn["role"] == "user" else "Kit"
+            text = " ".join(turn_text(turn).split())
+            lines.append(f"- {speaker}: {text[:120]}{'...' if len(text) > 120 else ''}")
+        return "\n".join(lines)
+
+    def prepend_to_last(self, window, text):
+        """Coloca um contexto extra só na pergunta atual, sem gravá-lo no histórico."""
+        if text and window:
+            window[-1] = with_text(window[-1], text + "\n\n" + turn_text(window[-1]))
+        return window
+
+    @property
+    def last_report(self):
+        return self.reports[-1] if self.reports else None
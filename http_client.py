@@ -0,0 +1,193 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Respostas que valem uma nova tentativa (limite de taxa e instabilidade do provedor)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def request_exceptions():
+    """Módulo requests.exceptions, importado só quando é preciso.
+
+    Importar o requests leva ~0,1s: o chat abre sem ele e só o carrega na primeira chamada à API.
+    """
+    import requests.exceptions
+    return requests.exceptions
+
+
+def retry_after_seconds(response):
+    """Lê o cabeçalho Retry-After (segundos ou data HTTP); None se ausente ou inválido."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # Formato de data é raro; o import do email.utils fica para quando aparecer
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class LatencyStats:
+    """Latência (até os cabeçalhos da resposta), erros e novas tentativas de um provedor."""
+
+    def __init__(self, max_samples=500):
+        self.samples = deque(maxlen=max_samples)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+
+    def record(self, seconds, ok=True):
+        self.requests += 1
+        if ok:
+            self.samples.append(seconds)
+        else:
+            self.errors += 1
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+def capped_timeout(timeout, remaining):
+    """timeout do requests (número ou par conexão/leitura) limitado a `remaining` segundos."""
+    if isinstance(timeout, tuple):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+class HttpClient:
+    """requests.Session compartilhada: mantém conexões keep-alive, aplica timeouts e refaz
+    requisições que falharam por rede, 429 ou 5xx com backoff exponencial (com jitter).
+
+    total_timeout limita o tempo somado das tentativas e das esperas entre elas; quem chama
+    pode passar um deadline próprio (o do turno, que vale para todas as chamadas dele).
+    """
+
+    def __init__(self, connect_timeout=5.0, read_timeout=60.0, max_retries=3, backoff_base=0.5, backoff_max=20.0, pool_size=32, total_timeout=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.latency = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Criada na primeira requisição, junto com o import do requests
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def stats(self, provider):
+        with self._lock:
+            if provider not in self.latency:
+                self.latency[provider] = LatencyStats()
+            return self.latency[provider]
+
+    def backoff(self, attempt):
+        # "Full jitter": espalha as novas tentativas de várias sessões no tempo
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, provider="api", deadline=None, **kwargs):
+        """Como requests.request, com timeout padrão e novas tentativas; retorna a última resposta.
+
+        deadline (em time.monotonic) é o limite de todas as tentativas; sem ele vale
+        total_timeout a partir de agora. Levanta Timeout se o prazo já tiver acabado.
+        """
+        timeout = kwargs.pop("timeout", self.timeout)
+        if deadline is None and self.total_timeout:
+            deadline = time.monotonic() + self.total_timeout
+        stats = self.stats(provider)
+        session = self.session
+        errors = request_exceptions()
+        for attempt in range(self.max_retries + 1):
+            attempt_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise errors.Timeout(f"Prazo da chamada a {provider} esgotado ({attempt} tentativa(s))")
+                attempt_timeout = capped_timeout(timeout, remaining)
+            started_at = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except (errors.ConnectionError, errors.Timeout) as error:
+                stats.record(time.perf_counter() - started_at, ok=False)
+                # Um POST que passou do tempo de leitura chegou ao provedor, que pode estar
+                # gerando (e cobrando) a resposta: repetir dobraria o custo e a espera
+                if attempt >= self.max_retries or (method == "POST" and isinstance(error, errors.ReadTimeout)):
+                    raise
+                delay = self.backoff(attempt)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+            else:
+                stats.record(time.perf_counter() - started_at, ok=response.status_code < 400)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                elif delay > self.backoff_max:
+                    # Esperar minutos travaria o chat: devolve o erro para o usuário
+                    return response
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    # A próxima tentativa já começaria fora do prazo
+                    return response
+                # Lê o corpo (pequeno) do erro para a conexão voltar ao pool em vez de ser fechada
+                response.content
+                response.close()
+            stats.retries += 1
+            time.sleep(delay)
+
+    def post(self, url, provider="api", **kwargs):
+        return self.request("POST", url, provider, **kwargs)
+
+    def delete(self, url, provider="api", **kwargs):
+        return self.request("DELETE", url, provider, **kwargs)
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def shared_http_client():
+    """HttpClient único por processo, configurado pelo .env."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient(
+                connect_timeout=float(os.getenv("KIT_HTTP_CONNECT_TIMEOUT", "5")),
+                read_timeout=float(os.getenv("KIT_HTTP_READ_TIMEOUT", "60")),
+                max_retries=int(os.getenv("KIT_HTTP_MAX_RETRIES", "3")),
+                total_timeout=float(os.getenv("KIT_HTTP_TOTAL_TIMEOUT", "90")) or None,
+            )
+        return _shared_client
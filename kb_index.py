@@ -0,0 +1,296 @@
+import hashlib
+import marshal
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from text_utils import estimate_tokens, tokenize
+
+KB_PATH = "./KB-CHOCODEV.txt"
+
+# Snapshot: cabeçalho fixo (magia, formato, sha256 do texto da KB) + seções e índice em marshal
+SNAPSHOT_MAGIC = b"KITKB"
+SNAPSHOT_FORMAT = 1
+_SNAPSHOT_HEADER_SIZE = len(SNAPSHOT_MAGIC) + 2 + 32
+
+_HEADING_PATTERN = re.compile(r"^(#{2,3})\s+(.*\S)\s*$")
+
+
+class Section:
+    """Trecho da base de conhecimento delimitado por um título ## ou ###."""
+
+    def __init__(self, section_id, title, text, tokens=None):
+        self.section_id = section_id
+        self.title = title
+        self.text = text
+        self.tokens = estimate_tokens(text) if tokens is None else tokens
+
+    def __repr__(self):
+        return f"Section({self.section_id}, {self.title!r}, {self.tokens} tokens)"
+
+
+def split_sections(text):
+    """Divide a KB nos títulos ##/### mantendo o título pai em cada subseção."""
+    sections = []
+    parent_title = None
+    current_title = None
+    current_lines = []
+
+    def flush():
+        # Um título ## seguido direto de subseções não vira seção vazia
+        if any(line.strip() and not line.startswith("#") for line in current_lines):
+            body = "\n".join(current_lines).strip()
+            sections.append(Section(len(sections), current_title or "Introdução", body))
+
+    for line in text.splitlines():
+        match = _HEADING_PATTERN.match(line)
+        if match:
+            flush()
+            level, heading = match.groups()
+            if level == "##":
+                parent_title = heading
+                current_title = heading
+                current_lines = [line]
+            else:
+                current_title = f"{parent_title} > {heading}" if parent_title else heading
+                current_lines = [f"## {parent_title}", line] if parent_title else [line]
+            continue
+        current_lines.append(line)
+    flush()
+    return sections
+
+
+class BM25Index:
+    """Índice invertido em memória com ranqueamento BM25."""
+
+    def __init__(self, documents=(), k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        self.total_length = 0
+        # Documentos tirados com remove(); o doc_id deles não é reaproveitado
+        self.removed_count = 0
+        for terms in documents:
+            self.add(terms)
+
+    @classmethod
+    def from_data(cls, postings, doc_lengths, total_length, k1=1.5, b=0.75):
+        """Índice já montado (vindo do snapshot), sem tokenizar os documentos de novo."""
+        index = cls(k1=k1, b=b)
+        index.postings = defaultdict(list, postings)
+        index.doc_lengths = doc_lengths
+        index.total_length = total_length
+        return index
+
+    @property
+    def doc_count(self):
+        return len(self.doc_lengths) - self.removed_count
+
+    @property
+    def avg_length(self):
+        return (self.total_length / self.doc_count) if self.doc_count else 0.0
+
+    def add(self, terms):
+        """Indexa mais um documento e retorna o seu doc_id."""
+        return self.add_counts(Counter(terms), len(terms))
+
+    def add_counts(self, counts, length):
+        """Como add, a partir da frequência de cada termo já contada."""
+        doc_id = len(self.doc_lengths)
+        self.doc_lengths.append(length)
+        self.total_length += length
+        for term, frequency in counts.items():
+            self.postings[term].append((doc_id, frequency))
+        return doc_id
+
+    def remove(self, doc_ids):
+        """Tira os documentos da busca e das estatísticas (idf e tamanho médio)."""
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return
+        # Uma passada por todas as postings serve para o lote inteiro
+        for term in list(self.postings):
+            postings = self.postings[term]
+            kept = [posting for posting in postings if posting[0] not in doc_ids]
+            if len(kept) == len(postings):
+                continue
+            if kept:
+                self.postings[term] = kept
+            else:
+                del self.postings[term]
+        for doc_id in doc_ids:
+            self.total_length -= self.doc_lengths[doc_id]
+            self.doc_lengths[doc_id] = 0
+        self.removed_count += len(doc_ids)
+
+    def document_counts(self):
+        """Frequência dos termos de cada documento, reconstruída a partir das postings."""
+        counts = [{} for _ in self.doc_lengths]
+        for term, postings in self.postings.items():
+            for doc_id, frequency in postings:
+                counts[doc_id][term] = frequency
+        return counts
+
+    def idf(self, term):
+        document_frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (self.doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query_terms, top_k=None):
+        """Retorna (doc_id, score) em ordem decrescente de relevância."""
+        scores = defaultdict(float)
+        avg_length = self.avg_length or 1
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, frequency in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k] if top_k else ranked
+
+
+class KnowledgeBase:
+    """Base de conhecimento dividida em seções e indexada para recuperação."""
+
+    def __init__(self, text, sections=None, index=None):
+        self.text = text
+        self.digest = hashlib.sha256(text.encode("utf-8")).digest()
+        self.version = self.digest.hex()[:12]
+        if sections is None:
+            sections = split_sections(text)
+            # O título entra duas vezes para pesar mais que o corpo da seção
+            index = BM25Index([tokenize(section.title) * 2 + tokenize(section.text) for section in sections])
+        self.sections = sections
+        self.index = index
+
+    def updated(self, text):
+        """Nova KnowledgeBase para `text`, tokenizando só as seções novas ou alteradas."""
+        sections = split_sections(text)
+        known = {
+            (section.title, section.text): (counts, self.index.doc_lengths[section.section_id])
+            for section, counts in zip(self.sections, self.index.document_counts())
+        }
+        index = BM25Index()
+        changed = 0
+        for section in sections:
+            entry = known.get((section.title, section.text))
+            if entry is None:
+                changed += 1
+                index.add(tokenize(section.title) * 2 + tokenize(section.text))
+            else:
+                index.add_counts(*entry)
+        kb = KnowledgeBase(text, sections, index)
+        kb.changed_sections = changed
+        return kb
+
+    def snapshot_bytes(self):
+        """Seções e índice serializados; KnowledgeBase.from_snapshot desfaz."""
+        payload = (
+            [(section.title, section.text, section.tokens) for section in self.sections],
+            dict(self.index.postings),
+            self.index.doc_lengths,
+            self.index.total_length,
+        )
+        header = SNAPSHOT_MAGIC + bytes([SNAPSHOT_FORMAT, marshal.version]) + self.digest
+        return header + marshal.dumps(payload)
+
+    @classmethod
+    def from_snapshot(cls, text, data):
+        """KnowledgeBase a partir de snapshot_bytes; None se o snapshot for de outra KB ou versão."""
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        header = SNAPSHOT_MAGIC + bytes([SNAPSHOT_FORMAT, marshal.version]) + digest
+        if data[:_SNAPSHOT_HEADER_SIZE] != header:
+            return None
+        try:
+            sections, postings, doc_lengths, total_length = marshal.loads(memoryview(data)[_SNAPSHOT_HEADER_SIZE:])
+        except (EOFError, ValueError, TypeError):
+            return None
+        sections = [Section(section_id, title, body, tokens) for section_id, (title, body, tokens) in enumerate(sections)]
+        return cls(text, sections, BM25Index.from_data(postings, doc_lengths, total_length))
+
+    def search(self, query, top_k=None):
+        """Retorna (Section, score) das seções mais relevantes para a pergunta."""
+        return [(self.sections[doc_id], score) for doc_id, score in self.index.search(tokenize(query), top_k)]
+
+    def select(self, query, top_k=4, token_budget=1500, min_relative_score=0.3):
+        """Escolhe as seções mais relevantes que cabem no orçamento de tokens."""
+        selected = select_within_budget(self.search(query, top_k), token_budget, min_relative_score)
+        if not selected and self.sections and self.sections[0].tokens <= token_budget:
+            # Sem termos em comum: usa a visão geral da empresa como contexto mínimo
+            selected.append((self.sections[0], 0.0))
+        return selected
+
+
+def snapshot_path():
+    """Arquivo do snapshot da KB (KIT_KB_SNAPSHOT no .env; "0" desliga)."""
+    path = os.getenv("KIT_KB_SNAPSHOT", os.path.join(".kit_cache", "kb.snapshot"))
+    return None if path.lower() in ("", "0", "false", "nao", "não") else path
+
+
+def save_snapshot(kb, path):
+    """Grava o snapshot de `kb`; sem erro se o disco for somente leitura."""
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Grava num temporário e troca: outro processo nunca lê o snapshot pela metade
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(kb.snapshot_bytes())
+        os.replace(temporary, path)
+    except OSError:
+        pass
+
+
+def load_knowledge_base(text, path=None):
+    """KnowledgeBase lida do snapshot em `path` (uma leitura, sem dividir nem tokenizar a KB).
+
+    Se o snapshot não existe ou é de outro texto, monta a KB e grava um novo. Cada processo
+    (workers do servidor, batch) lê o mesmo arquivo em vez de refazer o índice.
+    """
+    if path is None:
+        return KnowledgeBase(text)
+    try:
+        with open(path, "rb") as file:
+            kb = KnowledgeBase.from_snapshot(text, file.read())
+        if kb is not None:
+            return kb
+    except OSError:
+        pass
+
+    kb = KnowledgeBase(text)
+    save_snapshot(kb, path)
+    return kb
+
+
+@lru_cache(maxsize=4)
+def shared_knowledge_base(text):
+    """KnowledgeBase única por processo para o mesmo texto (as sessões só leem)."""
+    return load_knowledge_base(text, snapshot_path())
+
+
+def select_within_budget(ranked, token_budget, min_relative_score=0.3):
+    """Filtra (Section, score) ranqueados pelo orçamento de tokens e pela pontuação relativa."""
+    selected = []
+    used_tokens = 0
+    best_score = ranked[0][1] if ranked else 0.0
+    for section, score in ranked:
+        # Seções com pontuação muito abaixo da melhor só gastam tokens
+        if score < best_score * min_relative_score:
+            break
+        if used_tokens + section.tokens > token_budget:
+            continue
+        selected.append((section, score))
+        used_tokens += section.tokens
+    return selected
+
+
+def format_sections(selected):
+    """Junta o texto das seções selecionadas na ordem original da KB."""
+    ordered = sorted((section for section, _ in selected), key=lambda section: section.section_id)
+    return "\n\n".join(section.text for section in ordered)
@@ -0,0 +1,149 @@
+"""Respostas locais para perguntas de consulta ("qual a URL do Jenkins?").
+
+Os itens da KB no formato "- Chave: valor" (e os itens sem chave) viram fatos indexados
+pelos termos do título da seção, da chave e do valor. Uma pergunta curta que começa com
+"qual", "onde", "link"... e casa com um único fato com folga sobre o segundo colocado é
+respondida na hora, sem chamar o modelo.
+"""
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from text_utils import normalize_text, tokenize
+
+# Começos de pergunta que indicam consulta a um dado (depois de normalize_text)
+LOOKUP_PREFIXES = ("qual", "quais", "onde", "cade", "link", "url", "endereco", "me passa", "versao")
+# Termos que pedem um endereço: casam com qualquer fato cujo valor tem URL
+URL_TERMS = {"url", "link", "endereco", "site"}
+# Peso de cada lugar onde o termo da pergunta aparece no fato
+KEY_WEIGHT = 1.0
+TITLE_WEIGHT = 0.9
+PARENT_WEIGHT = 0.6
+VALUE_WEIGHT = 0.7
+URL_VALUE_WEIGHT = 0.7
+# Item com sub-itens ("Ambientes:"): os termos dos sub-itens pesam menos que o próprio sub-item
+GROUP_VALUE_WEIGHT = 0.5
+# Diferença mínima para o segundo fato; abaixo disso a pergunta é ambígua
+MARGIN = 0.08
+MAX_QUESTION_TERMS = 6
+
+_BULLET_PATTERN = re.compile(r"^(?P<indent>\s*)-\s+(?P<body>.*\S)\s*$")
+_URL_PATTERN = re.compile(r"https?://\S+")
+
+
+class Fact:
+    """Um item da KB: título da seção, chave ("URL do servidor") e valor, com os sub-itens."""
+
+    def __init__(self, section_title, key, value, parent_keys=(), group=False):
+        self.section_title = section_title
+        self.key = key
+        self.value = value
+        self.key_terms = set(tokenize(key))
+        self.title_terms = set(tokenize(section_title))
+        # Sub-itens herdam a chave dos itens pais ("HOMOLOG" dentro de "Ambientes")
+        self.parent_terms = set(tokenize(" ".join(parent_keys)))
+        self.value_terms = set(tokenize(value))
+        self.value_weight = GROUP_VALUE_WEIGHT if group else VALUE_WEIGHT
+        self.has_url = bool(_URL_PATTERN.search(value))
+
+    def weight(self, term):
+        if term in self.key_terms:
+            return KEY_WEIGHT
+        if term in self.title_terms:
+            return TITLE_WEIGHT
+        if term in self.parent_terms:
+            return PARENT_WEIGHT
+        if term in URL_TERMS and self.has_url:
+            return min(URL_VALUE_WEIGHT, self.value_weight)
+        if term in self.value_terms:
+            return self.value_weight
+        return 0.0
+
+    def answer(self):
+        if self.value and self.value != self.key:
+            text = f"{self.key}: {self.value}" if "\n" not in self.value else f"{self.key}:\n{self.value}"
+        else:
+            text = self.key
+        return f"{text}\n(seção {self.section_title} da KB)"
+
+
+def extract_facts(section):
+    """Fatos dos itens "- ..." de uma seção; itens com sub-itens levam os sub-itens no valor."""
+    facts = []
+    parents = []  # (indentação, chave, linhas dos sub-itens)
+
+    def close(indent):
+        while parents and parents[-1][0] >= indent:
+            _, key, children = parents.pop()
+            if children:
+                facts.append(Fact(section.title, key, "\n".join(children), [parent[1] for parent in parents], group=True))
+
+    for line in section.text.splitlines():
+        match = _BULLET_PATTERN.match(line)
+        if not match:
+            continue
+        indent = len(match.group("indent").expandtabs())
+        body = match.group("body")
+        close(indent)
+        parent_keys = [parent[1] for parent in parents]
+        for parent in parents:
+            parent[2].append(line.strip())
+        # "https://..." tem dois-pontos mas não é chave
+        key, separator, value = body.partition(": ")
+        if separator and not _URL_PATTERN.match(key):
+            if value.strip():
+                facts.append(Fact(section.title, key.strip(), value.strip(), parent_keys))
+            scope_key = key.strip()
+        elif body.endswith(":"):
+            scope_key = body[:-1].strip()
+        else:
+            facts.append(Fact(section.title, body, body, parent_keys))
+            scope_key = body
+        parents.append((indent, scope_key, []))
+    close(0)
+    return facts
+
+
+class LookupMatcher:
+    """Índice termo → fatos montado a partir das seções da KB."""
+
+    def __init__(self, sections):
+        self.facts = [fact for section in sections for fact in extract_facts(section)]
+        self.postings = defaultdict(set)
+        for fact_id, fact in enumerate(self.facts):
+            for term in fact.key_terms | fact.title_terms | fact.parent_terms | fact.value_terms:
+                self.postings[term].add(fact_id)
+            if fact.has_url:
+                for term in URL_TERMS:
+                    self.postings[term].add(fact_id)
+
+    def match(self, question):
+        """Retorna (Fact, confiança de 0 a 1) ou (None, 0.0) se não for uma consulta."""
+        normalized = normalize_text(question).strip(" ?!.")
+        if not normalized.startswith(LOOKUP_PREFIXES):
+            return None, 0.0
+        terms = list(dict.fromkeys(tokenize(question)))
+        # "qual" e "onde" já saem como stopwords; o que sobra é o que se procura
+        terms = [term for term in terms if term not in ("quai", "cade", "passa")]
+        if not terms or len(terms) > MAX_QUESTION_TERMS:
+            return None, 0.0
+
+        candidates = set()
+        for term in terms:
+            candidates |= self.postings.get(term, set())
+        scored = sorted(
+            ((sum(self.facts[fact_id].weight(term) for term in terms) / len(terms), fact_id) for fact_id in candidates),
+            reverse=True,
+        )
+        if not scored:
+            return None, 0.0
+        best_score, best_id = scored[0]
+        second_score = scored[1][0] if len(scored) > 1 else 0.0
+        confidence = best_score if best_score - second_score >= MARGIN else best_score / 2
+        return self.facts[best_id], confidence
+
+
+@lru_cache(maxsize=4)
+def lookup_matcher(knowledge_base):
+    """LookupMatcher de uma versão da KB, montado uma vez por processo."""
+    return LookupMatcher(knowledge_base.sections)
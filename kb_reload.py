@@ -0,0 +1,233 @@
+"""Recarga da KB sem reiniciar os bots.
+
+Um KnowledgeStore por processo guarda a versão atual da KB; um KBWatcher observa o
+KB-CHOCODEV.txt (inotify no Linux, polling do mtime nos outros sistemas) e, quando o
+arquivo muda, o store monta a nova versão e a troca de uma vez. Cada sessão confere a
+versão no começo do turno, sem lock: a troca é a atribuição de um único objeto.
+"""
+import os
+import select
+import struct
+import sys
+import threading
+
+from answer_cache import discard_answer_caches
+from kb_index import save_snapshot, shared_knowledge_base, snapshot_path
+
+# Máscaras do inotify (linux/inotify.h)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class KnowledgeState:
+    """Uma versão da KB: texto, seções indexadas e número de geração (1, 2, 3...)."""
+
+    def __init__(self, text, knowledge_base, generation):
+        self.text = text
+        self.knowledge_base = knowledge_base
+        self.generation = generation
+
+    @property
+    def version(self):
+        return self.knowledge_base.version
+
+
+class KnowledgeStore:
+    """Versão atual da KB compartilhada pelas sessões do processo."""
+
+    def __init__(self, path, fallback_text, knowledge_base=None):
+        self.path = path
+        self.fallback_text = fallback_text
+        if knowledge_base is None:
+            knowledge_base = shared_knowledge_base(self.read_text())
+        self.current = KnowledgeState(knowledge_base.text, knowledge_base, 1)
+        self.watcher = None
+        self._reload_lock = threading.Lock()
+
+    def read_text(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return file.read()
+        except FileNotFoundError:
+            return self.fallback_text
+
+    def reload(self):
+        """Relê o arquivo; retorna True se a KB mudou e a nova versão entrou no lugar.
+
+        Levanta OSError se o arquivo não puder ser lido, inclusive se ele tiver sumido: no
+        meio de um "grava e renomeia" ou de um git checkout a KB atual continua valendo
+        (o texto de reserva é só para quando a KB nunca existiu).
+        """
+        # Só um recarregamento por vez; as sessões continuam lendo self.current enquanto isso
+        with self._reload_lock:
+            with open(self.path, "r", encoding="utf-8") as file:
+                text = file.read()
+            previous = self.current
+            if text == previous.text:
+                return False
+            knowledge_base = previous.knowledge_base.updated(text)
+            path = snapshot_path()
+            if path:
+                save_snapshot(knowledge_base, path)
+            self.current = KnowledgeState(text, knowledge_base, previous.generation + 1)
+        # Respostas e caches da versão anterior não servem mais
+        discard_answer_caches(previous.version)
+        return True
+
+    def replace(self, knowledge_base):
+        """Troca a KB atual por uma já montada em outro lugar (os workers do kit_pool)."""
+        with self._reload_lock:
+            previous = self.current
+            if knowledge_base.version == previous.version:
+                return False
+            self.current = KnowledgeState(knowledge_base.text, knowledge_base, previous.generation + 1)
+        discard_answer_caches(previous.version)
+        return True
+
+    def watch(self, poll_interval=2.0):
+        """Começa a observar o arquivo (uma única thread por store)."""
+        if self.watcher is None:
+            self.watcher = KBWatcher(self.path, self.reload, poll_interval)
+            self.watcher.start()
+        return self.watcher
+
+
+class KBWatcher:
+    """Chama on_change quando o arquivo muda: inotify no Linux, polling do mtime nos outros sistemas."""
+
+    def __init__(self, path, on_change, poll_interval=2.0, debounce=0.2):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="kit-kb-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        fd = self._open_inotify()
+        if fd is None:
+            self.mode = "polling"
+            self._poll()
+        else:
+            self.mode = "inotify"
+            try:
+                self._watch_inotify(fd)
+            finally:
+                os.close(fd)
+
+    def _changed(self):
+        # Editores gravam em várias etapas: espera o arquivo assentar antes de reler
+        if self._stop.wait(self.debounce):
+            return
+        try:
+            self.on_change()
+        except (OSError, UnicodeDecodeError):
+            pass  # Arquivo sumido ou no meio de uma gravação: o próximo evento tenta de novo
+        except Exception as error:
+            # Um erro inesperado não pode parar a observação: a KB atual continua valendo
+            print(f"[kb] falha ao recarregar {self.path}: {error!r}", file=sys.stderr)
+
+    def _open_inotify(self):
+        """Descritor do inotify observando a pasta da KB, ou None fora do Linux."""
+        try:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            inotify_add_watch = libc.inotify_add_watch
+        except (ImportError, OSError, AttributeError):
+            return None
+        fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        # Observa a pasta, não o arquivo: salvar com "grava e renomeia" troca o inode
+        directory = os.path.dirname(self.path).encode()
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if inotify_add_watch(fd, directory, mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _watch_inotify(self, fd):
+        filename = os.path.basename(self.path).encode()
+        while not self._stop.is_set():
+            # Timeout só para conferir o pedido de parada
+            readable, _, _ = select.select([fd], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            relevant = False
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+                relevant = relevant or name == filename
+                offset += _EVENT_HEADER.size + length
+            if relevant:
+                self._changed()
+
+    def _poll(self):
+        last = self._signature()
+        while not self._stop.wait(self.poll_interval):
+            signature = self._signature()
+            if signature != last:
+                last = signature
+                self._changed()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def shared_knowledge_store(path, fallback_text):
+    """KnowledgeStore único por processo para o arquivo `path`.
+
+    Com KIT_KB_WATCH ligado (padrão), o arquivo é observado e a KB recarregada sozinha;
+    KIT_KB_POLL_INTERVAL define o intervalo do polling quando não há inotify.
+    """
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = KnowledgeStore(path, fallback_text)
+            if os.getenv("KIT_KB_WATCH", "1").lower() not in ("0", "false", "nao", "não"):
+                store.watch(float(os.getenv("KIT_KB_POLL_INTERVAL", "2")))
+        return store
+
+
+def install_knowledge_base(path, fallback_text, knowledge_base):
+    """Usa `knowledge_base` como versão atual do store de `path` neste processo, sem ler o
+    arquivo nem observá-lo: quem publicou a KB avisa das próximas versões."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            _stores[path] = KnowledgeStore(path, fallback_text, knowledge_base)
+            return True
+    return store.replace(knowledge_base)
@@ -0,0 +1,218 @@
+"""KB em memória compartilhada para os workers do kit_pool.
+
+O dispatcher publica a KB num segmento de multiprocessing.shared_memory: um cabeçalho,
+um bloco pequeno em marshal (títulos, tamanhos, posições), o texto da KB, o texto das
+seções, os termos do vocabulário em ordem e os vetores de uint32 (posição de cada
+termo, início/quantidade das postings e os pares doc_id, frequência).
+
+Cada worker só decodifica o texto da KB, que vai inteiro no system prompt de qualquer
+forma. O texto das seções sai do segmento quando a seção é usada, e os termos são
+procurados por busca binária direto no segmento, sem montar um dicionário.
+"""
+import marshal
+import struct
+from array import array
+from bisect import bisect_left
+from multiprocessing import shared_memory
+
+from kb_index import BM25Index, KnowledgeBase, Section
+
+SEGMENT_MAGIC = b"KITSH"
+SEGMENT_FORMAT = 2
+# Magia, formato, versão do marshal, tamanho em bytes do bloco em marshal, do texto da KB,
+# do texto das seções e dos termos, quantidade de termos e de pares das postings
+_HEADER = struct.Struct("<5sBBQQQQQQ")
+_ITEM = array("I").itemsize
+
+
+def _align(offset):
+    return (offset + _ITEM - 1) // _ITEM * _ITEM
+
+
+class SegmentView:
+    """Segmento da KB aberto num worker, com cada bloco como memoryview.
+
+    Seções e postings guardam uma referência a ele; o mapeamento fecha quando a KB
+    antiga sai de uso depois de um reload.
+    """
+
+    def __init__(self, segment, meta_size, text_size, sections_size, terms_size, term_count, pair_count):
+        self.segment = segment
+        self._views = []
+        position = _HEADER.size
+        self.meta = self._slice(position, meta_size)
+        position += meta_size
+        self.text = self._slice(position, text_size)
+        position += text_size
+        self.sections = self._slice(position, sections_size)
+        position += sections_size
+        self.terms = self._slice(position, terms_size)
+        position = _align(position + terms_size)
+        self.term_offsets = self._cast(position, term_count + 1)
+        position += (term_count + 1) * _ITEM
+        self.entries = self._cast(position, term_count * 2)
+        position += term_count * 2 * _ITEM
+        self.pairs = self._cast(position, pair_count * 2)
+
+    def _slice(self, position, size):
+        view = self.segment.buf[position:position + size]
+        self._views.append(view)
+        return view
+
+    def _cast(self, position, count):
+        view = self._slice(position, count * _ITEM).cast("I")
+        self._views.append(view)
+        return view
+
+    def section_text(self, start, end):
+        with self.sections[start:end] as piece:
+            return str(piece, "utf-8")
+
+    def term(self, index):
+        with self.terms[self.term_offsets[index]:self.term_offsets[index + 1]] as piece:
+            return bytes(piece)
+
+    def close(self):
+        if self._views:
+            # As views derivadas (cast) são soltas antes das fatias de onde vieram
+            for view in reversed(self._views):
+                view.release()
+            self._views = []
+            self.segment.close()
+
+    def __del__(self):
+        self.close()
+
+
+class _Terms:
+    """Termos do vocabulário (em bytes UTF-8, em ordem) como sequência, para o bisect."""
+
+    def __init__(self, view):
+        self.view = view
+
+    def __len__(self):
+        return len(self.view.term_offsets) - 1
+
+    def __getitem__(self, index):
+        return self.view.term(index)
+
+
+class SharedPostings:
+    """postings do BM25Index (termo -> [(doc_id, frequência)]) lidas do segmento compartilhado."""
+
+    def __init__(self, view):
+        self.view = view
+        self._terms = _Terms(view)
+
+    def _find(self, term):
+        key = term.encode("utf-8")
+        index = bisect_left(self._terms, key)
+        if index < len(self._terms) and self._terms[index] == key:
+            return index
+        return None
+
+    def _postings(self, index):
+        start, count = self.view.entries[index * 2], self.view.entries[index * 2 + 1]
+        values = self.view.pairs[start * 2:(start + count) * 2].tolist()
+        return list(zip(values[::2], values[1::2]))
+
+    def get(self, term, default=None):
+        index = self._find(term)
+        return default if index is None else self._postings(index)
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __len__(self):
+        return len(self._terms)
+
+    def items(self):
+        for index in range(len(self._terms)):
+            yield self._terms[index].decode("utf-8"), self._postings(index)
+
+
+class SharedSection(Section):
+    """Section com o texto no segmento compartilhado, decodificado a cada uso."""
+
+    def __init__(self, section_id, title, tokens, view, start, end):
+        self.section_id = section_id
+        self.title = title
+        self.tokens = tokens
+        self.view = view
+        self.span = (start, end)
+
+    @property
+    def text(self):
+        return self.view.section_text(*self.span)
+
+
+def publish_knowledge_base(kb):
+    """Copia `kb` para um segmento novo; quem publica chama close() e unlink() quando ele sair de uso."""
+    # Em ordem de bytes, a mesma que o bisect usa no worker
+    terms = sorted((term.encode("utf-8"), postings) for term, postings in kb.index.postings.items())
+    term_offsets = array("I", [0])
+    entries = array("I")
+    pairs = array("I")
+    for key, postings in terms:
+        term_offsets.append(term_offsets[-1] + len(key))
+        entries.append(len(pairs) // 2)
+        entries.append(len(postings))
+        for doc_id, frequency in postings:
+            pairs.append(doc_id)
+            pairs.append(frequency)
+
+    section_texts = [section.text.encode("utf-8") for section in kb.sections]
+    spans = []
+    position = 0
+    for body in section_texts:
+        spans.append((position, position + len(body)))
+        position += len(body)
+    meta = marshal.dumps((
+        [section.title for section in kb.sections],
+        [section.tokens for section in kb.sections],
+        spans,
+        kb.index.doc_lengths,
+        kb.index.total_length,
+    ))
+    blocks = (meta, kb.text.encode("utf-8"), b"".join(section_texts), b"".join(key for key, _ in terms))
+    numbers = term_offsets + entries + pairs
+
+    offset = _align(_HEADER.size + sum(len(block) for block in blocks))
+    segment = shared_memory.SharedMemory(create=True, size=offset + len(numbers) * _ITEM)
+    _HEADER.pack_into(segment.buf, 0, SEGMENT_MAGIC, SEGMENT_FORMAT, marshal.version, *(len(block) for block in blocks), len(terms), len(pairs) // 2)
+    position = _HEADER.size
+    for block in blocks:
+        segment.buf[position:position + len(block)] = block
+        position += len(block)
+    segment.buf[offset:offset + len(numbers) * _ITEM] = numbers.tobytes()
+    return segment
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Antes do Python 3.13 abrir também registra o segmento no resource_tracker; os workers
+        # usam o mesmo tracker do dispatcher, então o registro repetido não muda nada e o
+        # segmento só some no unlink de quem publicou
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_knowledge_base(name):
+    """KnowledgeBase com as seções e as postings no segmento `name`; ValueError se não for um segmento da KB."""
+    segment = _attach(name)
+    magic, version, marshal_version, *sizes = _HEADER.unpack_from(segment.buf, 0)
+    if (magic, version, marshal_version) != (SEGMENT_MAGIC, SEGMENT_FORMAT, marshal.version):
+        segment.close()
+        raise ValueError(f"Segmento {name} não é uma KB publicada por esta versão da Kit")
+    view = SegmentView(segment, *sizes)
+    titles, tokens, spans, doc_lengths, total_length = marshal.loads(view.meta)
+    index = BM25Index()
+    index.postings = SharedPostings(view)
+    index.doc_lengths = doc_lengths
+    index.total_length = total_length
+    sections = [
+        SharedSection(section_id, title, section_tokens, view, start, end)
+        for section_id, (title, section_tokens, (start, end)) in enumerate(zip(titles, tokens, spans))
+    ]
+    return KnowledgeBase(str(view.text, "utf-8"), sections, index)
@@ -0,0 +1,183 @@
+"""Modo batch: responde um arquivo JSONL de perguntas sem digitar uma por uma.
+
+Uso:
+    python kit_batch.py perguntas.jsonl -o respostas.jsonl --concurrency 4 --rate 2
+
+Cada linha da entrada é um JSON com a pergunta em "question" (ou "pergunta", "message",
+ou "title" + "body") e, opcionalmente, um "id". Cada pergunta abre uma conversa nova e
+passa pelo mesmo send_message do chat, então o prompt é montado exatamente igual.
+
+A saída também é o checkpoint: ao rodar de novo com o mesmo -o, as perguntas já
+respondidas com sucesso são puladas e só as que faltam (ou deram erro) são enviadas.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bots import load_bot_class
+from metrics import usage_tokens
+
+QUESTION_FIELDS = ("question", "pergunta", "message")
+
+
+def read_questions(path):
+    """Lê o JSONL aos poucos; gera (id, pergunta) ou (id, None) para linhas inválidas."""
+    with open(path, "r", encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield f"linha-{number}", None
+                continue
+            question = next((item[field] for field in QUESTION_FIELDS if item.get(field)), None)
+            if question is None and item.get("title"):
+                question = "\n\n".join(part for part in (item.get("title"), item.get("body")) if part)
+            yield str(item.get("id") or item.get("request_id") or f"linha-{number}"), question
+
+
+def completed_ids(path):
+    """Ids já respondidos sem erro numa execução anterior."""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # última linha cortada por uma interrupção
+                if not result.get("error"):
+                    done.add(result["id"])
+    except OSError:
+        pass
+    return done
+
+
+class RateLimiter:
+    """Limita o início das requisições a `rate` por segundo, somando todas as threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(self.next_at, now)
+            self.next_at = wait_until + self.interval
+        time.sleep(max(0.0, wait_until - now))
+
+
+class BatchRunner:
+    def __init__(self, provider="gemini", concurrency=4, rate=0.0, use_cache=True):
+        self.bot_class = load_bot_class(provider)
+        self.provider = provider
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.use_cache = use_cache
+
+    def answer(self, question_id, question):
+        """Responde uma pergunta numa conversa nova e retorna a linha de saída."""
+        result = {"id": question_id, "question": question, "provider": self.provider}
+        if not question:
+            result["error"] = "Linha sem pergunta"
+            return result
+
+        bot = self.bot_class()
+        bot.verbose = False
+        if not self.use_cache:
+            bot.answer_cache = None
+        self.limiter.acquire()
+        started_at = time.perf_counter()
+        bot.send_message(question)
+        turn = bot.last_turn or {"source": "error", "error": "A mensagem foi tratada como comando"}
+
+        result["latency"] = time.perf_counter() - started_at
+        if turn["source"] == "error":
+            result["error"] = turn["error"]
+            return result
+        result["answer"] = turn["answer"]
+        result["source"] = turn["source"]
+        result["cached"] = turn["source"] == "cache"
+        if turn["source"] == "api":
+            # Com vários provedores (KIT_PROVIDERS) o roteador pode ter respondido por outro
+            result["provider"] = turn["provider"]
+            result["ttft"] = turn["ttft"]
+            result["usage"] = turn["usage"]
+        return result
+
+    def run(self, input_path, output_path):
+        """Responde as perguntas pendentes, gravando cada resultado assim que fica pronto."""
+        done = completed_ids(output_path)
+        totals = {"answered": 0, "skipped": 0, "errors": 0, "cached": 0, "local": 0, "input_tokens": 0, "output_tokens": 0}
+        latencies = []
+
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = set()
+
+            def collect(futures):
+                for future in futures:
+                    result = future.result()
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+                    if result.get("error"):
+                        totals["errors"] += 1
+                        continue
+                    totals["answered"] += 1
+                    totals["cached"] += result["cached"]
+                    totals["local"] += result.get("source") == "kb"
+                    latencies.append(result["latency"])
+                    tokens = usage_tokens(result.get("usage"))
+                    totals["input_tokens"] += tokens["input"]
+                    totals["output_tokens"] += tokens["output"]
+
+            for question_id, question in read_questions(input_path):
+                if question_id in done:
+                    totals["skipped"] += 1
+                    continue
+                done.add(question_id)
+                # Só lê a próxima linha quando há vaga: o arquivo pode ter milhares de perguntas
+                if len(pending) >= self.concurrency * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending.add(executor.submit(self.answer, question_id, question))
+            collect(wait(pending).done)
+
+        if latencies:
+            latencies.sort()
+            totals["latency_p50"] = latencies[len(latencies) // 2]
+            totals["latency_p95"] = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Responde um arquivo JSONL de perguntas com a Kit")
+    parser.add_argument("input", help="arquivo JSONL com as perguntas")
+    parser.add_argument("-o", "--output", default="respostas.jsonl", help="arquivo JSONL de saída (também serve de checkpoint)")
+    parser.add_argument("--provider", choices=["gemini", "anthropic"], default="gemini")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("KIT_BATCH_CONCURRENCY", "4")), help="perguntas em paralelo")
+    parser.add_argument("--rate", type=float, default=float(os.getenv("KIT_BATCH_RATE", "0")), help="máximo de perguntas iniciadas por segundo (0 = sem limite)")
+    parser.add_argument("--sem-cache", action="store_true", help="ignora o cache de respostas (útil para testar mudanças no prompt)")
+    args = parser.parse_args()
+
+    try:
+        runner = BatchRunner(args.provider, args.concurrency, args.rate, use_cache=not args.sem_cache)
+        totals = runner.run(args.input, args.output)
+    except ValueError as e:
+        print(f"Erro de configuração: {str(e)}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\nInterrompido. Rode o mesmo comando de novo para continuar de onde parou. 🍫")
+        sys.exit(130)
+    print(json.dumps(totals, ensure_ascii=False, indent=2))
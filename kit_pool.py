@@ -0,0 +1,554 @@
+"""Modo servidor com vários processos: um dispatcher HTTP na frente de N workers.
+
+Uso:
+    python kit_pool.py --port 8080 --workers 4
+
+As rotas são as mesmas do kit_server.py. A montagem do prompt, a busca na KB e a
+codificação do JSON usam CPU e, num processo só, disputam o GIL; aqui cada worker é um
+processo com as suas sessões (um KitServer sem HTTP), e o dispatcher só repassa as
+requisições. Cada sessão fica sempre no mesmo worker, onde está o histórico.
+
+A KB indexada fica em memória compartilhada (kb_shared.py), publicada pelo dispatcher;
+quando o KB-CHOCODEV.txt muda ele publica a nova versão e avisa os workers.
+
+Reinício sem perder conversas: as sessões gravam o log em disco (session_store.py) e,
+depois que o worker delas é reiniciado, são reabertas em outro worker na próxima
+mensagem. `kill -HUP <pid do dispatcher>` ou POST /workers/restart reiniciam os workers
+um por um, esperando as respostas em andamento; um worker que morre é trocado sozinho.
+GET /health mostra a carga de cada worker.
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from http import HTTPStatus
+
+from chatbot_base import FALLBACK_KNOWLEDGE
+from kb_index import KB_PATH
+from kb_reload import install_knowledge_base, shared_knowledge_store
+from kb_shared import attach_knowledge_base, publish_knowledge_base
+from kit_server import HttpError, KitServer
+from scheduler import PROVIDER_NAMES
+from session_store import shared_session_store
+
+READY_TIMEOUT = 60
+DRAIN_TIMEOUT = 120
+LOAD_INTERVAL = 1.0
+
+
+def share_rate_limits(workers):
+    """Divide os orçamentos KIT_<PROVEDOR>_RPM/_TPM entre os workers (o scheduler é por processo)."""
+    for name in PROVIDER_NAMES:
+        for suffix in ("RPM", "TPM"):
+            variable = f"KIT_{name.upper()}_{suffix}"
+            if os.getenv(variable):
+                os.environ[variable] = str(float(os.environ[variable]) / workers)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+# Worker
+
+
+class WorkerHost(KitServer):
+    """Lado do worker: as sessões deste processo, atendidas pelos comandos do dispatcher."""
+
+    def __init__(self, slot, connection, provider="gemini", idle_timeout=1800, threads=32):
+        super().__init__(provider, max_sessions=float("inf"), idle_timeout=idle_timeout, workers=threads)
+        self.slot = slot
+        self.connection = connection
+        self.session_store = shared_session_store()
+        self.busy = 0
+        self.turns = 0
+        self.errors = 0
+        self._send_lock = threading.Lock()
+
+    def send(self, *message):
+        # on_chunk chega das threads dos turnos; o Connection não é seguro para escritas simultâneas
+        with self._send_lock:
+            self.connection.send(message)
+
+    async def open_session(self, session_id=None, log_id=None):
+        session = await self.create_session(session_id, log_id)
+        log = session.bot.session_log
+        return dict(session.state(), welcome=session.bot.welcome_message, log_id=log.session_id if log else None)
+
+    def evict_idle(self):
+        evicted = super().evict_idle()
+        if evicted:
+            self.send("evicted", evicted)
+        return evicted
+
+    def load(self):
+        return {
+            "pid": os.getpid(),
+            "sessions": len(self.sessions),
+            "busy": self.busy,
+            "turns": self.turns,
+            "errors": self.errors,
+            "memory_kb": round(sum(session.bot.memory.nbytes for session in self.sessions.values()) / 1024, 1),
+            "kb_version": shared_knowledge_store(KB_PATH, FALLBACK_KNOWLEDGE).current.version,
+            "cpu_seconds": round(time.process_time(), 3),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def drain(self):
+        """Grava o log de todas as sessões; o worker vai ser parado."""
+        for session in self.sessions.values():
+            session.bot.close_session()
+        return len(self.sessions)
+
+    def install_knowledge(self, segment_name):
+        install_knowledge_base(KB_PATH, FALLBACK_KNOWLEDGE, attach_knowledge_base(segment_name))
+        return True
+
+    async def execute(self, kind, request_id, *args):
+        self.busy += 1
+        try:
+            if kind == "open":
+                result = await self.open_session(*args)
+            elif kind == "message":
+                session_id, message, stream = args
+                on_chunk = (lambda text: self.send("chunk", request_id, text)) if stream else None
+                result = await self.send_message(session_id, message, on_chunk)
+                self.turns += 1
+            elif kind == "state":
+                result = await self.session_state(*args)
+            elif kind == "end":
+                result = await self.end_session(*args)
+            elif kind == "kb":
+                result = self.install_knowledge(*args)
+            elif kind == "drain":
+                result = self.drain()
+            else:
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"Comando desconhecido: {kind}")
+            self.send("result", request_id, result)
+        except HttpError as error:
+            self.send("error", request_id, error.status, error.message)
+        except Exception as error:
+            self.errors += 1
+            self.send("error", request_id, HTTPStatus.INTERNAL_SERVER_ERROR, str(error))
+        finally:
+            self.busy -= 1
+
+    def read_commands(self, loop, commands):
+        try:
+            while True:
+                loop.call_soon_threadsafe(commands.put_nowait, self.connection.recv())
+        except (EOFError, OSError):
+            # Dispatcher saiu: o worker termina também
+            loop.call_soon_threadsafe(commands.put_nowait, ("stop",))
+
+    async def report_load(self):
+        while True:
+            self.send("load", self.load())
+            await asyncio.sleep(LOAD_INTERVAL)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        commands = asyncio.Queue()
+        threading.Thread(target=self.read_commands, args=(loop, commands), name="kit-pool-commands", daemon=True).start()
+        background = [asyncio.create_task(self.evict_idle_sessions()), asyncio.create_task(self.report_load())]
+        self.send("ready", os.getpid())
+        tasks = set()
+        try:
+            while True:
+                command = await commands.get()
+                if command[0] == "stop":
+                    break
+                task = asyncio.create_task(self.execute(*command))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in background:
+                task.cancel()
+            self.drain()
+            self.executor.shutdown(wait=False)
+
+
+def worker_main(slot, connection, provider, segment_name, workers, idle_timeout, threads):
+    """Entrada do processo worker."""
+    # Ctrl-C no terminal vai para o grupo todo; quem encerra os workers é o dispatcher
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # A KB vem do dispatcher, que observa o arquivo por todos
+    os.environ["KIT_KB_WATCH"] = "0"
+    share_rate_limits(workers)
+    host = WorkerHost(slot, connection, provider, idle_timeout, threads)
+    host.install_knowledge(segment_name)
+    asyncio.run(host.run())
+
+
+# Dispatcher
+
+
+class WorkerHandle:
+    """Um processo worker visto pelo dispatcher: pipe, pedidos em andamento e carga."""
+
+    def __init__(self, slot, generation):
+        self.slot = slot
+        self.generation = generation
+        self.process = None
+        self.connection = None
+        self.pending = {}
+        self.in_flight = 0
+        self.sessions = 0
+        self.load = {}
+        self.ready = None
+        self.draining = False
+        self.stopping = False
+        self.started_at = time.time()
+        self._ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+
+    def start(self, loop, context, pool):
+        self.loop = loop
+        self.pool = pool
+        self.ready = loop.create_future()
+        self.segment_name = pool.segment.name
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=worker_main,
+            args=(self.slot, child, pool.provider, pool.segment.name, len(pool.workers), pool.idle_timeout, pool.threads),
+            name=f"kit-worker-{self.slot}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        threading.Thread(target=self.read_messages, name=f"kit-pool-reader-{self.slot}", daemon=True).start()
+
+    @property
+    def accepting(self):
+        return self.ready.done() and not self.ready.exception() and not self.draining and not self.stopping
+
+    def read_messages(self):
+        try:
+            while True:
+                message = self.connection.recv()
+                self.loop.call_soon_threadsafe(self.deliver, message)
+        except (EOFError, OSError):
+            try:
+                self.loop.call_soon_threadsafe(self.lost)
+            except RuntimeError:
+                pass  # O loop do dispatcher já terminou
+        except RuntimeError:
+            pass
+
+    def deliver(self, message):
+        kind = message[0]
+        if kind == "chunk":
+            _, request_id, text = message
+            entry = self.pending.get(request_id)
+            if entry is not None and entry[1] is not None:
+                entry[1](text)
+        elif kind in ("result", "error"):
+            entry = self.pending.pop(message[1], None)
+            if entry is None or entry[0].done():
+                return
+            if kind == "result":
+                entry[0].set_result(message[2])
+            else:
+                entry[0].set_exception(HttpError(message[2], message[3]))
+        elif kind == "load":
+            self.load = message[1]
+        elif kind == "ready":
+            if not self.ready.done():
+                self.ready.set_result(message[1])
+        elif kind == "evicted":
+            self.pool.forget(self, message[1])
+
+    def lost(self):
+        """O pipe fechou: o processo terminou (parado ou morto)."""
+        self.stopping = True
+        if not self.ready.done():
+            self.ready.set_exception(HttpError(HTTPStatus.SERVICE_UNAVAILABLE, f"Worker {self.slot} não iniciou"))
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "O worker desta sessão reiniciou, tente de novo"))
+        self.pending.clear()
+
+    async def request(self, kind, *args, on_chunk=None):
+        request_id = next(self._ids)
+        future = self.loop.create_future()
+        self.pending[request_id] = (future, on_chunk)
+        self.in_flight += 1
+        try:
+            with self._send_lock:
+                self.connection.send((kind, request_id) + args)
+            return await future
+        except (OSError, ValueError):
+            self.pending.pop(request_id, None)
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "O worker desta sessão reiniciou, tente de novo")
+        finally:
+            self.in_flight -= 1
+
+    def stop(self):
+        self.stopping = True
+        try:
+            with self._send_lock:
+                self.connection.send(("stop",))
+        except (OSError, ValueError):
+            pass
+
+    def stats(self):
+        state = "ok" if self.accepting else "parando" if self.draining or self.stopping else "iniciando"
+        return dict(
+            self.load,
+            worker=self.slot,
+            generation=self.generation,
+            state=state,
+            assigned_sessions=self.sessions,
+            in_flight=self.in_flight,
+            uptime_seconds=round(time.time() - self.started_at, 1),
+        )
+
+
+class PooledSession:
+    def __init__(self, worker, log_id):
+        self.worker = worker
+        self.log_id = log_id
+        # Uma operação por vez: a sessão pode precisar ser reaberta em outro worker
+        self.lock = asyncio.Lock()
+
+
+class KitPool(KitServer):
+    """Dispatcher: atende o HTTP (herdado do KitServer) e repassa cada sessão ao seu worker."""
+
+    def __init__(self, provider="gemini", workers=None, max_sessions=1000, idle_timeout=1800, threads=32):
+        super().__init__(provider, max_sessions, idle_timeout, workers=2)
+        self.provider = provider
+        self.idle_timeout = idle_timeout
+        self.threads = threads
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = [None] * (workers or os.cpu_count() or 1)
+        self.restarts = 0
+        self.segment = None
+        self.knowledge_store = None
+
+    # Workers
+
+    def spawn(self, slot):
+        previous = self.workers[slot]
+        worker = WorkerHandle(slot, previous.generation + 1 if previous else 1)
+        self.workers[slot] = worker
+        worker.start(self.loop, self.context, self)
+        return worker
+
+    async def wait_ready(self, worker):
+        await asyncio.wait_for(asyncio.shield(worker.ready), READY_TIMEOUT)
+        if worker.segment_name != self.segment.name:
+            # A KB mudou enquanto o worker iniciava
+            await worker.request("kb", self.segment.name)
+
+    async def choose_worker(self):
+        """Worker que recebe uma sessão: o menos ocupado entre os que aceitam sessões.
+
+        Durante um reinício pode não haver nenhum por alguns instantes; espera até READY_TIMEOUT.
+        """
+        deadline = time.monotonic() + READY_TIMEOUT
+        while True:
+            candidates = [worker for worker in self.workers if worker.accepting]
+            if candidates:
+                return min(candidates, key=lambda worker: (worker.in_flight + worker.load.get("busy", 0), worker.sessions))
+            if time.monotonic() > deadline:
+                raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Nenhum worker disponível, tente novamente em instantes")
+            await asyncio.sleep(0.05)
+
+    async def restart_worker(self, slot):
+        """Reinício gracioso: para de mandar sessões novas, espera o que está em andamento e troca o processo."""
+        worker = self.workers[slot]
+        worker.draining = True
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while worker.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        try:
+            await asyncio.wait_for(worker.request("drain"), 10)
+        except (HttpError, asyncio.TimeoutError):
+            pass
+        worker.stop()
+        await self.loop.run_in_executor(None, worker.process.join, 10)
+        if worker.process.is_alive():
+            worker.process.kill()
+        self.restarts += 1
+        await self.wait_ready(self.spawn(slot))
+
+    async def rolling_restart(self):
+        async with self.restart_lock:
+            for slot in range(len(self.workers)):
+                await self.restart_worker(slot)
+
+    async def supervise(self):
+        """Troca workers que morreram e publica a KB nova quando o arquivo muda."""
+        generation = self.knowledge_store.current.generation
+        while True:
+            await asyncio.sleep(LOAD_INTERVAL)
+            for slot, worker in enumerate(self.workers):
+                if not worker.draining and not worker.process.is_alive():
+                    worker.lost()
+                    self.restarts += 1
+                    asyncio.ensure_future(self.wait_ready(self.spawn(slot)))
+            current = self.knowledge_store.current
+            if current.generation != generation:
+                generation = current.generation
+                await self.publish_knowledge(current.knowledge_base)
+
+    async def publish_knowledge(self, knowledge_base):
+        previous, self.segment = self.segment, publish_knowledge_base(knowledge_base)
+        ready = [worker for worker in self.workers if worker.accepting or worker.draining]
+        for worker in ready:
+            worker.segment_name = self.segment.name
+        await asyncio.gather(*(worker.request("kb", self.segment.name) for worker in ready), return_exceptions=True)
+        # Os workers já abriram o segmento novo; o antigo some quando o último mapeamento fechar
+        previous.close()
+        previous.unlink()
+
+    def forget(self, worker, session_ids):
+        """Sessões removidas pelo worker (paradas há muito tempo)."""
+        for session_id in session_ids:
+            session = self.sessions.get(session_id)
+            if session is not None and session.worker is worker:
+                del self.sessions[session_id]
+                worker.sessions -= 1
+
+    # Operações das rotas
+
+    async def open_session(self, session_id=None, log_id=None):
+        if len(self.sessions) >= self.max_sessions:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Limite de sessões atingido, tente novamente mais tarde")
+        worker = await self.choose_worker()
+        session_id = uuid.uuid4().hex
+        worker.sessions += 1
+        try:
+            result = await worker.request("open", session_id, None)
+        except HttpError:
+            worker.sessions -= 1
+            raise
+        self.sessions[session_id] = PooledSession(worker, result.pop("log_id"))
+        return result
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, "Sessão não encontrada ou encerrada")
+        return session
+
+    def drop(self, session_id, session):
+        if self.sessions.pop(session_id, None) is not None:
+            session.worker.sessions -= 1
+
+    async def routed(self, session_id, kind, *args, on_chunk=None):
+        """Manda o comando ao worker da sessão, reabrindo-a em outro se o dela foi reiniciado."""
+        session = self.get_session(session_id)
+        async with session.lock:
+            worker = session.worker
+            while worker.draining and self.workers[worker.slot] is worker:
+                await asyncio.sleep(0.05)
+            if self.workers[worker.slot] is not worker:
+                if session.log_id is None:
+                    # Sem log em disco (KIT_SESSIONS=0) a conversa ficou no worker antigo
+                    self.drop(session_id, session)
+                    raise HttpError(HTTPStatus.NOT_FOUND, "Sessão não encontrada ou encerrada")
+                worker = await self.choose_worker()
+                worker.sessions += 1
+                session.worker.sessions -= 1
+                session.worker = worker
+                await worker.request("open", session_id, session.log_id)
+            try:
+                result = await worker.request(kind, session_id, *args, on_chunk=on_chunk)
+            except HttpError as error:
+                if error.status == HTTPStatus.NOT_FOUND:
+                    self.drop(session_id, session)
+                raise
+            if isinstance(result, dict) and result.get("should_exit"):
+                self.drop(session_id, session)
+            return result
+
+    async def session_state(self, session_id):
+        return await self.routed(session_id, "state")
+
+    async def send_message(self, session_id, message, on_chunk=None):
+        return await self.routed(session_id, "message", message, on_chunk is not None, on_chunk=on_chunk)
+
+    async def end_session(self, session_id):
+        return await self.routed(session_id, "end")
+
+    def health(self):
+        return {
+            "status": "ok" if any(worker.accepting for worker in self.workers) else "degraded",
+            "sessions": len(self.sessions),
+            "restarts": self.restarts,
+            "kb_version": self.knowledge_store.current.version,
+            "workers": [worker.stats() for worker in self.workers],
+        }
+
+    async def dispatch(self, method, target, headers, body, writer, keep_alive):
+        path = target.partition("?")[0].rstrip("/")
+        if method == "POST" and path == "/workers/restart":
+            await self.rolling_restart()
+            await self.write_json(writer, HTTPStatus.OK, self.health(), keep_alive)
+            return keep_alive
+        return await super().dispatch(method, target, headers, body, writer, keep_alive)
+
+    async def serve(self, host, port):
+        self.loop = asyncio.get_running_loop()
+        self.restart_lock = asyncio.Lock()
+        # Valida a configuração (API key, KB) antes de subir os workers
+        await self.loop.run_in_executor(self.executor, self.new_bot)
+        self.knowledge_store = shared_knowledge_store(KB_PATH, FALLBACK_KNOWLEDGE)
+        self.segment = publish_knowledge_base(self.knowledge_store.current.knowledge_base)
+        try:
+            for slot in range(len(self.workers)):
+                self.spawn(slot)
+            await asyncio.gather(*(self.wait_ready(worker) for worker in self.workers))
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            supervisor = asyncio.create_task(self.supervise())
+            if hasattr(signal, "SIGHUP"):
+                self.loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.rolling_restart()))
+            print(f"Kit ouvindo em http://{host}:{server.sockets[0].getsockname()[1]} com {len(self.workers)} workers (dispatcher {os.getpid()}) 🍫")
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                supervisor.cancel()
+        finally:
+            for worker in self.workers:
+                if worker is not None:
+                    worker.stop()
+            for worker in self.workers:
+                if worker is not None:
+                    await self.loop.run_in_executor(None, worker.process.join, 10)
+            self.segment.close()
+            self.segment.unlink()
+            self.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kit em modo servidor com vários processos")
+    parser.add_argument("--host", default=os.getenv("KIT_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("KIT_SERVER_PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("KIT_POOL_WORKERS", "0")) or None, help="processos worker (padrão: um por núcleo)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("KIT_SERVER_WORKERS", "32")), help="threads para as chamadas à API em cada worker")
+    parser.add_argument("--max-sessions", type=int, default=int(os.getenv("KIT_MAX_SESSIONS", "1000")))
+    parser.add_argument("--idle-timeout", type=float, default=float(os.getenv("KIT_SESSION_IDLE_TIMEOUT", "1800")), help="segundos até uma sessão parada ser removida")
+    args = parser.parse_args()
+
+    try:
+        pool = KitPool(workers=args.workers, max_sessions=args.max_sessions, idle_timeout=args.idle_timeout, threads=args.threads)
+        asyncio.run(pool.serve(args.host, args.port))
+    except ValueError as e:
+        print(f"Erro de configuração: {str(e)}")
+    except KeyboardInterrupt:
+        print("\nServidor encerrado. Até logo! 🍫")
@@ -0,0 +1,319 @@
+"""Modo servidor: várias sessões de onboarding da Kit num único processo (HTTP/JSON + SSE).
+
+Uso:
+    python kit_server.py --port 8080
+
+Rotas:
+    POST   /sessions                 cria uma sessão -> {"session_id", "welcome", ...}
+    POST   /sessions/<id>/messages   {"message": "..."} -> {"response", "should_exit", ...}
+                                     com "Accept: text/event-stream" (ou ?stream=1) a resposta chega em SSE
+    GET    /sessions/<id>            estado da sessão (interações usadas e resumo)
+    DELETE /sessions/<id>            encerra a sessão (o mesmo que digitar "sair")
+    GET    /health                   sessões ativas
+
+Cada sessão tem o seu próprio GeminiChatbot (histórico, limite de interações e resumo);
+a KB indexada, o cache de respostas e o cache de prompt são compartilhados.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from bots import load_bot_class
+from session_store import SessionNotFound
+
+EXIT_COMMANDS = ("sair", "exit", "quit")
+GOODBYE_MESSAGE = "Até logo! Foi um prazer ajudar no seu onboarding na Choco-dev! 🍫"
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Session:
+    """Uma conversa com um dev; só processa uma mensagem por vez."""
+
+    def __init__(self, session_id, bot):
+        self.session_id = session_id
+        self.bot = bot
+        self.lock = asyncio.Lock()
+        self.created_at = time.time()
+        self.last_seen = time.monotonic()
+
+    def state(self):
+        return {
+            "session_id": self.session_id,
+            "response_count": self.bot.response_count,
+            "max_responses": self.bot.max_responses,
+            "interaction_summary": self.bot.interaction_summary,
+            "memory_exchanges": len(self.bot.memory),
+            "memory_bytes": self.bot.memory.nbytes,
+        }
+
+
+class KitServer:
+    """Hospeda as sessões e atende as requisições HTTP sem bloquear o event loop.
+
+    As chamadas à API do provedor (requests, síncronas) rodam num pool de threads,
+    então uma resposta lenta não trava as outras sessões.
+    """
+
+    def __init__(self, provider="gemini", max_sessions=1000, idle_timeout=1800, workers=32):
+        self.bot_class = load_bot_class(provider)
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kit-session")
+        # Com um SessionStore cada sessão grava o log em disco e pode ser aberta de novo (kit_pool)
+        self.session_store = None
+
+    def new_bot(self, log_id=None):
+        bot = self.bot_class()
+        bot.verbose = False
+        # O cliente HTTP não escolhe arquivos do disco do servidor: só os da pasta configurada
+        bot.document_root = os.getenv("KIT_SERVER_DOCUMENT_DIR", "")
+        if self.session_store is not None:
+            try:
+                bot.start_session(self.session_store, log_id)
+            except SessionNotFound:
+                raise HttpError(HTTPStatus.NOT_FOUND, "Sessão não encontrada ou encerrada")
+        return bot
+
+    # Sessões
+
+    async def create_session(self, session_id=None, log_id=None):
+        if len(self.sessions) >= self.max_sessions:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Limite de sessões atingido, tente novamente mais tarde")
+        loop = asyncio.get_running_loop()
+        bot = await loop.run_in_executor(self.executor, self.new_bot, log_id)
+        session = Session(session_id or uuid.uuid4().hex, bot)
+        self.sessions[session.session_id] = session
+        return session
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, "Sessão não encontrada ou encerrada")
+        session.last_seen = time.monotonic()
+        return session
+
+    def run_turn(self, session, message, on_chunk=None):
+        """Executa um turno do mesmo jeito que o start_chat do terminal."""
+        bot = session.bot
+        if message.strip().lower() in EXIT_COMMANDS:
+            if bot.response_count > 0:
+                return {"response": bot.generate_interaction_summary(), "should_exit": True}
+            return {"response": GOODBYE_MESSAGE, "should_exit": True}
+
+        response, should_exit = bot.send_message(message, on_chunk=on_chunk)
+        result = {
+            "response": response,
+            "should_exit": should_exit,
+            "response_count": bot.response_count,
+            "max_responses": bot.max_responses,
+        }
+        if should_exit:
+            result["summary"] = bot.generate_interaction_summary()
+        return result
+
+    def finish_turn(self, session, result):
+        if result["should_exit"]:
+            self.sessions.pop(session.session_id, None)
+            session.bot.close_session(finished=True)
+        session.last_seen = time.monotonic()
+
+    def evict_idle(self):
+        """Remove as sessões paradas há mais de idle_timeout segundos; retorna os ids removidos."""
+        now = time.monotonic()
+        evicted = []
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_seen > self.idle_timeout and not session.lock.locked():
+                self.sessions.pop(session_id, None)
+                session.bot.close_session()
+                evicted.append(session_id)
+        return evicted
+
+    async def evict_idle_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, max(1, self.idle_timeout / 2)))
+            self.evict_idle()
+
+    # Operações das rotas (o kit_pool troca estas pelas dos workers)
+
+    async def open_session(self, session_id=None, log_id=None):
+        session = await self.create_session(session_id, log_id)
+        return dict(session.state(), welcome=session.bot.welcome_message)
+
+    async def session_state(self, session_id):
+        return self.get_session(session_id).state()
+
+    async def send_message(self, session_id, message, on_chunk=None):
+        """Um turno da sessão; on_chunk pode ser chamado de outra thread."""
+        session = self.get_session(session_id)
+        async with session.lock:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, self.run_turn, session, message, on_chunk)
+            self.finish_turn(session, result)
+        return result
+
+    async def end_session(self, session_id):
+        return await self.send_message(session_id, "sair")
+
+    def require_session(self, session_id):
+        """Confere se a sessão existe antes de começar uma resposta em SSE."""
+        self.get_session(session_id)
+
+    def health(self):
+        return {"status": "ok", "sessions": len(self.sessions)}
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self.write_json(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Corpo da requisição grande demais"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                keep_alive = await self.dispatch(method, target, headers, body, writer, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body, writer, keep_alive):
+        """Roteia a requisição; retorna se a conexão pode continuar aberta."""
+        path, _, query = target.partition("?")
+        path = path.rstrip("/")
+        segments = [segment for segment in path.split("/") if segment]
+        try:
+            if method == "GET" and segments == ["health"]:
+                await self.write_json(writer, HTTPStatus.OK, self.health(), keep_alive)
+            elif method == "POST" and segments == ["sessions"]:
+                await self.write_json(writer, HTTPStatus.CREATED, await self.open_session(), keep_alive)
+            elif len(segments) == 2 and segments[0] == "sessions" and method == "GET":
+                await self.write_json(writer, HTTPStatus.OK, await self.session_state(segments[1]), keep_alive)
+            elif len(segments) == 2 and segments[0] == "sessions" and method == "DELETE":
+                await self.write_json(writer, HTTPStatus.OK, await self.end_session(segments[1]), keep_alive)
+            elif len(segments) == 3 and segments[0] == "sessions" and segments[2] == "messages" and method == "POST":
+                try:
+                    message = json.loads(body or b"{}")["message"]
+                except (ValueError, KeyError, TypeError):
+                    raise HttpError(HTTPStatus.BAD_REQUEST, 'Envie um JSON no formato {"message": "..."}')
+                if not isinstance(message, str) or not message.strip():
+                    raise HttpError(HTTPStatus.BAD_REQUEST, "A mensagem não pode ser vazia")
+                self.require_session(segments[1])
+                if "text/event-stream" in headers.get("accept", "") or "stream=1" in query.split("&"):
+                    await self.stream_message(segments[1], message, writer)
+                    return False
+                await self.write_json(writer, HTTPStatus.OK, await self.send_message(segments[1], message), keep_alive)
+            else:
+                raise HttpError(HTTPStatus.NOT_FOUND, "Rota não encontrada")
+        except HttpError as error:
+            await self.write_json(writer, error.status, {"error": error.message}, keep_alive)
+        except Exception as error:
+            await self.write_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)}, keep_alive=False)
+            return False
+        return keep_alive
+
+    async def stream_message(self, session_id, message, writer):
+        """Responde em SSE: eventos "chunk" conforme o texto chega e um "done" no final."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def on_chunk(text):
+            loop.call_soon_threadsafe(queue.put_nowait, text)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        turn = asyncio.ensure_future(self.send_message(session_id, message, on_chunk))
+        # Depois dos pedaços já agendados por on_chunk
+        turn.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, None))
+        while True:
+            text = await queue.get()
+            if text is None:
+                break
+            await self.write_event(writer, "chunk", {"text": text})
+        try:
+            result = turn.result()
+        except HttpError as error:
+            await self.write_event(writer, "error", {"error": error.message})
+            return
+        except Exception as error:
+            await self.write_event(writer, "error", {"error": str(error)})
+            return
+        await self.write_event(writer, "done", result)
+
+    async def write_event(self, writer, event, payload):
+        writer.write(f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    async def write_json(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        status = HTTPStatus(status)
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def serve(self, host, port):
+        # Valida a configuração (API key, KB) antes de aceitar conexões
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.new_bot)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        eviction = asyncio.create_task(self.evict_idle_sessions())
+        print(f"Kit ouvindo em http://{host}:{server.sockets[0].getsockname()[1]} 🍫")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            eviction.cancel()
+            self.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kit em modo servidor (várias sessões num processo)")
+    parser.add_argument("--host", default=os.getenv("KIT_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("KIT_SERVER_PORT", "8080")))
+    parser.add_argument("--max-sessions", type=int, default=int(os.getenv("KIT_MAX_SESSIONS", "1000")))
+    parser.add_argument("--idle-timeout", type=float, default=float(os.getenv("KIT_SESSION_IDLE_TIMEOUT", "1800")), help="segundos até uma sessão parada ser removida")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("KIT_SERVER_WORKERS", "32")), help="threads para as chamadas à API")
+    args = parser.parse_args()
+
+    try:
+        kit_server = KitServer(max_sessions=args.max_sessions, idle_timeout=args.idle_timeout, workers=args.workers)
+        asyncio.run(kit_server.serve(args.host, args.port))
+    except ValueError as e:
+        print(f"Erro de configuração: {str(e)}")
+    except KeyboardInterrupt:
+        print("\nServidor encerrado. Até logo! 🍫")
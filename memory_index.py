@@ -0,0 +1,137 @@
+"""Memória das trocas antigas de uma sessão longa.
+
+Cada troca (pergunta + resposta) vira um vetor TF-IDF de palavras e pares de palavras,
+com hashing em DIMENSIONS posições. Os vetores ficam numa matriz esparsa (CSR) em
+arrays: poucos bytes por troca e nenhuma dependência. Quando a conversa passa da
+janela do histórico, as trocas que já saíram dela e mais se parecem com a pergunta
+atual voltam inteiras para o prompt.
+"""
+import math
+import zlib
+from array import array
+
+from kb_index import Section, select_within_budget
+from text_utils import tokenize
+
+# Posições do hashing; cabem no array "H" das features
+DIMENSIONS = 4096
+# Similaridade de cosseno mínima para uma troca antiga voltar ao prompt
+MIN_SCORE = 0.15
+
+
+def exchange_text(question, answer):
+    return f"Usuário: {question}\nKit: {answer}"
+
+
+def hashed_features(text):
+    """Contagem por posição do hashing das palavras e pares de palavras do texto."""
+    terms = tokenize(text)
+    counts = {}
+    for term in terms + [f"{first} {second}" for first, second in zip(terms, terms[1:])]:
+        # crc32 e não hash(): o vetor precisa ser o mesmo em qualquer processo
+        feature = zlib.crc32(term.encode("utf-8")) % DIMENSIONS
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+class ConversationMemory:
+    """Trocas da sessão indexadas para recuperação, com limite de memória em bytes.
+
+    Passando de max_bytes, as trocas mais antigas saem primeiro.
+    """
+
+    def __init__(self, max_bytes=262144):
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self.clear()
+
+    def clear(self):
+        self.exchanges = []
+        # Linha i da matriz: features[offsets[i]:offsets[i + 1]] com os pesos de tf na mesma faixa
+        self.offsets = array("I", [0])
+        self.features = array("H")
+        self.weights = array("f")
+        # Em quantas trocas cada posição aparece; criado na primeira troca
+        self.document_frequency = None
+        self.text_bytes = 0
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.exchanges)
+
+    @property
+    def nbytes(self):
+        """Bytes ocupados pela matriz, pela frequência das posições e pelo texto das trocas."""
+        arrays = [self.offsets, self.features, self.weights]
+        if self.document_frequency is not None:
+            arrays.append(self.document_frequency)
+        return sum(len(values) * values.itemsize for values in arrays) + self.text_bytes
+
+    def add(self, question, answer):
+        text = exchange_text(question, answer)
+        counts = hashed_features(text)
+        if self.document_frequency is None:
+            self.document_frequency = array("I", bytes(DIMENSIONS * 4))
+        for feature, count in sorted(counts.items()):
+            self.features.append(feature)
+            self.weights.append(1.0 + math.log(count))
+            self.document_frequency[feature] += 1
+        self.offsets.append(len(self.features))
+        self.exchanges.append(Section(self.next_id, f"Troca {self.next_id + 1}", text))
+        self.next_id += 1
+        self.text_bytes += len(text.encode("utf-8"))
+        while len(self.exchanges) > 1 and self.nbytes > self.max_bytes:
+            self.evict_oldest()
+
+    def evict_oldest(self):
+        end = self.offsets[1]
+        for feature in self.features[:end]:
+            self.document_frequency[feature] -= 1
+        del self.features[:end]
+        del self.weights[:end]
+        self.offsets = array("I", (offset - end for offset in self.offsets[1:]))
+        self.text_bytes -= len(self.exchanges.pop(0).text.encode("utf-8"))
+        self.evicted += 1
+
+    def search(self, query, top_k=2, token_budget=1000, skip_recent=0):
+        """(Section, score) das trocas mais parecidas com a pergunta, sem as skip_recent mais novas."""
+        candidates = len(self.exchanges) - skip_recent
+        if candidates <= 0:
+            return []
+        total = len(self.exchanges)
+        idf = [math.log((1 + total) / (1 + frequency)) + 1.0 for frequency in self.document_frequency]
+        query_vector = {feature: (1.0 + math.log(count)) * idf[feature] for feature, count in hashed_features(query).items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
+        if not query_norm:
+            return []
+
+        ranked = []
+        for row in range(candidates):
+            dot = norm = 0.0
+            for position in range(self.offsets[row], self.offsets[row + 1]):
+                feature = self.features[position]
+                weight = self.weights[position] * idf[feature]
+                norm += weight * weight
+                dot += weight * query_vector.get(feature, 0.0)
+            if dot:
+                score = dot / (math.sqrt(norm) * query_norm)
+                if score >= MIN_SCORE:
+                    ranked.append((self.exchanges[row], score))
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return select_within_budget(ranked[:top_k], token_budget)
+
+    def dump(self):
+        """Trocas guardadas, da mais antiga para a mais nova, para o snapshot da sessão."""
+        return [exchange.text for exchange in self.exchanges]
+
+    def load(self, texts):
+        self.clear()
+        for text in texts:
+            question, _, answer = text[len("Usuário: "):].partition("\nKit: ")
+            self.add(question, answer)
+
+    def summary_text(self):
+        return (
+            f"- Memória da conversa: {len(self.exchanges)} trocas, {self.nbytes / 1024:.1f} KB "
+            f"(limite {self.max_bytes / 1024:.0f} KB, {self.evicted} descartadas)"
+        )
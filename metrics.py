@@ -0,0 +1,344 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def usage_tokens(usage):
+    """Tokens de entrada, saída e em cache do usageMetadata (Gemini) ou usage (Anthropic)."""
+    if not usage:
+        return {"input": 0, "output": 0, "cached": 0}
+    if "promptTokenCount" in usage or "candidatesTokenCount" in usage:
+        return {
+            "input": usage.get("promptTokenCount", 0),
+            "output": usage.get("candidatesTokenCount", 0),
+            "cached": usage.get("cachedContentTokenCount", 0),
+        }
+    cached = usage.get("cache_read_input_tokens") or 0
+    return {
+        "input": (usage.get("input_tokens") or 0) + cached + (usage.get("cache_creation_input_tokens") or 0),
+        "output": usage.get("output_tokens") or 0,
+        "cached": cached,
+    }
+
+
+class Histogram:
+    """Contagem por bucket (para o Prometheus) e últimas amostras (para p50/p95)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, max_samples=1000):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for index, limit in enumerate(self.buckets):
+            if value <= limit:
+                self.counts[index] += 1
+                break
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Span:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.name, time.perf_counter() - self.started_at)
+
+
+class TurnTrace:
+    """Tempos de cada etapa de um turno (build, encode, ttfb, receive, parse...)."""
+
+    enabled = True
+
+    def __init__(self):
+        self.spans = {}
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add(self, name, seconds):
+        # A mesma etapa pode rodar mais de uma vez (nova tentativa, failover): soma
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTrace:
+    """Trace desligado: span() devolve sempre o mesmo objeto vazio, sem medir nada."""
+
+    enabled = False
+    spans = {}
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def add(self, name, seconds):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+class MetricsRegistry:
+    """Métricas do processo inteiro: histogramas, tokens, arquivo de trace JSONL e arquivo Prometheus."""
+
+    def __init__(self, trace_path=None, prometheus_path=None):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.turn_latency = {}
+        self.turn_ttft = {}
+        self.span_latency = {}
+        self.turns = {}
+        self.tokens = {}
+        # Fila de admissão (scheduler.py): espera por provedor, profundidade atual e chamadas juntadas
+        self.admission_wait = {}
+        self.queue_depth = {}
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        # Gravação dos arquivos, fora do _lock para o disco não segurar os outros turnos
+        self._file_lock = threading.Lock()
+        self._prometheus_version = 0
+        self._prometheus_written = 0
+
+    def record(self, record):
+        """Registra um turno (dicionário montado por SessionMetrics.record)."""
+        labels = (record["provider"] or "nenhum", record["source"])
+        with self._lock:
+            self.turns[labels] = self.turns.get(labels, 0) + 1
+            self.turn_latency.setdefault(labels, Histogram()).observe(record["total"])
+            if record.get("ttft") is not None:
+                self.turn_ttft.setdefault(labels, Histogram()).observe(record["ttft"])
+            for name, seconds in record.get("spans", {}).items():
+                self.span_latency.setdefault(name, Histogram()).observe(seconds)
+            for kind, count in record["tokens"].items():
+                key = (labels[0], kind)
+                self.tokens[key] = self.tokens.get(key, 0) + count
+            prometheus = None
+            if self.prometheus_path:
+                self._prometheus_version += 1
+                prometheus = (self._prometheus_version, self.prometheus_text())
+        if self.trace_path:
+            self._append_trace(record)
+        if prometheus:
+            self._write_prometheus(*prometheus)
+
+    def record_admission(self, provider, wait):
+        with self._lock:
+            self.admission_wait.setdefault(provider, Histogram()).observe(wait)
+
+    def set_queue_depth(self, provider, depth):
+        with self._lock:
+            self.queue_depth[provider] = depth
+
+    def record_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def _append_trace(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            with self._file_lock:
+                directory = os.path.dirname(self.trace_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.trace_path, "a", encoding="utf-8") as file:
+                    file.write(line)
+        except OSError as error:
+            # Disco cheio ou sem permissão: a métrica se perde, o turno não
+            print(f"[métricas] não foi possível gravar o trace em {self.trace_path}: {error}", file=sys.stderr)
+
+    def _write_prometheus(self, version, text):
+        directory = os.path.dirname(self.prometheus_path) or "."
+        with self._file_lock:
+            # Outro turno já gravou um retrato mais novo das métricas
+            if version < self._prometheus_written:
+                return
+            temporary = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                # Escreve num temporário e troca: quem lê (node_exporter) nunca vê o arquivo pela
+                # metade. O nome é único, então processos com o mesmo caminho (pool) não colidem
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, prefix=".kit-metrics-", suffix=".tmp", delete=False) as file:
+                    temporary = file.name
+                    file.write(text)
+                # O temporário nasce 0600; o node_exporter costuma rodar com outro usuário
+                os.chmod(temporary, 0o644)
+                os.replace(temporary, self.prometheus_path)
+                self._prometheus_written = version
+            except OSError as error:
+                print(f"[métricas] não foi possível gravar {self.prometheus_path}: {error}", file=sys.stderr)
+                if temporary:
+                    try:
+                        os.remove(temporary)
+                    except OSError:
+                        pass
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP kit_turns_total Turnos respondidos por provedor e origem (api, cache, kb, error).",
+            "# TYPE kit_turns_total counter",
+        ]
+        for (provider, source), count in sorted(self.turns.items()):
+            lines.append(f'kit_turns_total{{provider="{provider}",source="{source}"}} {count}')
+        lines += [
+            "# HELP kit_tokens_total Tokens de entrada, saída e em cache informados pelo provedor.",
+            "# TYPE kit_tokens_total counter",
+        ]
+        for (provider, kind), count in sorted(self.tokens.items()):
+            lines.append(f'kit_tokens_total{{provider="{provider}",kind="{kind}"}} {count}')
+        lines += [
+            "# HELP kit_scheduler_queue_depth Chamadas esperando vaga no orçamento do provedor.",
+            "# TYPE kit_scheduler_queue_depth gauge",
+        ]
+        for provider, depth in sorted(self.queue_depth.items()):
+            lines.append(f'kit_scheduler_queue_depth{{provider="{provider}"}} {depth}')
+        lines += [
+            "# HELP kit_coalesced_total Turnos respondidos pela chamada idêntica de outra sessão.",
+            "# TYPE kit_coalesced_total counter",
+            f"kit_coalesced_total {self.coalesced}",
+        ]
+        for name, help_text, histograms, label in (
+            ("kit_turn_seconds", "Duração total do turno.", self.turn_latency, None),
+            ("kit_turn_ttft_seconds", "Tempo até o primeiro token.", self.turn_ttft, None),
+            ("kit_span_seconds", "Duração de cada etapa do turno.", self.span_latency, "span"),
+            ("kit_scheduler_wait_seconds", "Espera na fila de admissão do provedor.", self.admission_wait, "provider"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for key, histogram in sorted(histograms.items()):
+                labels = f'{label}="{key}"' if label else f'provider="{key[0]}",source="{key[1]}"'
+                cumulative = 0
+                for limit, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{limit}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def shared_metrics_registry():
+    """MetricsRegistry único por processo (KIT_TRACE_PATH e KIT_METRICS_PROM_PATH no .env)."""
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = MetricsRegistry(os.getenv("KIT_TRACE_PATH") or None, os.getenv("KIT_METRICS_PROM_PATH") or None)
+        return _shared_registry
+
+
+def tracing_enabled():
+    """Etapas dos turnos só são medidas com KIT_TRACE=1 ou com arquivo de trace/Prometheus configurado."""
+    return (
+        os.getenv("KIT_TRACE", "").lower() in ("1", "true", "sim")
+        or bool(os.getenv("KIT_TRACE_PATH"))
+        or bool(os.getenv("KIT_METRICS_PROM_PATH"))
+    )
+
+
+class SessionMetrics:
+    """Latências e tokens de uma sessão, para o comando 'estatisticas' e o --profile."""
+
+    def __init__(self, registry=None, tracing=False):
+        self.registry = registry
+        self.tracing = tracing
+        self.latency = Histogram()
+        self.ttft = Histogram()
+        self.tokens = {"input": 0, "output": 0, "cached": 0}
+        self.turns = 0
+        self.cached_turns = 0
+        self.local_turns = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.last_record = None
+
+    def start_turn(self):
+        return TurnTrace() if self.tracing else NULL_TRACE
+
+    def record(self, trace, source, total, provider=None, ttft=None, usage=None):
+        tokens = usage_tokens(usage)
+        record = {
+            "timestamp": time.time(),
+            "provider": provider,
+            "source": source,
+            "total": total,
+            "ttft": ttft,
+            "tokens": tokens,
+            "spans": dict(trace.spans),
+        }
+        self.turns += 1
+        if source == "error":
+            self.errors += 1
+        elif source == "cancelled":
+            # Turno interrompido pelo usuário: não entra na latência
+            self.cancelled += 1
+        else:
+            self.cached_turns += source == "cache"
+            self.local_turns += source == "kb"
+            self.latency.observe(total)
+            if ttft is not None:
+                self.ttft.observe(ttft)
+        for kind, count in tokens.items():
+            self.tokens[kind] += count
+        self.last_record = record
+        if self.registry is not None:
+            self.registry.record(record)
+        return record
+
+    def turn_report(self):
+        """Uma linha com os tempos do último turno (usada pelo --profile)."""
+        record = self.last_record
+        if record is None:
+            return "[profile] Nenhum turno medido ainda."
+        parts = [f"total {record['total']:.3f}s"]
+        if record["ttft"] is not None:
+            parts.append(f"1º token {record['ttft']:.3f}s")
+        parts += [f"{name} {seconds:.3f}s" for name, seconds in record["spans"].items()]
+        tokens = record["tokens"]
+        parts.append(f"tokens {tokens['input']} entrada / {tokens['output']} saída / {tokens['cached']} em cache")
+        origin = record["provider"] or record["source"]
+        return f"[profile] {origin}: " + ", ".join(parts)
+
+    def summary_text(self):
+        """Resumo da sessão: p50/p95 de latência e total de tokens."""
+        def seconds(value):
+            return "-" if value is None else f"{value:.2f}s"
+
+        return (
+            "🍫 Estatísticas desta sessão:\n"
+            f"- Perguntas: {self.turns} ({self.local_turns} direto da KB, {self.cached_turns} do cache de respostas, {self.errors} com erro, {self.cancelled} canceladas)\n"
+            f"- Latência: p50 {seconds(self.latency.percentile(0.5))}, p95 {seconds(self.latency.percentile(0.95))}\n"
+            f"- Primeiro token: p50 {seconds(self.ttft.percentile(0.5))}, p95 {seconds(self.ttft.percentile(0.95))}\n"
+            f"- Tokens: {self.tokens['input']} de entrada ({self.tokens['cached']} em cache), {self.tokens['output']} de saída"
+        )
@@ -0,0 +1,316 @@
+"""Servidor local que imita as APIs do Gemini e da Anthropic para testes e medições.
+
+Uso:
+    python mock_server.py --port 8765 --latency 0.5 --chunk-delay 0.05
+    python mock_server.py --cache-mode unsupported   # simula provedor sem cache de prompt
+    python mock_server.py --fail-first 2             # as 2 primeiras chamadas respondem 503
+    python mock_server.py --token-rate 40 --error-rate 0.05
+    python mock_server.py --sem-gzip                 # recusa corpos comprimidos com 415
+
+Depois aponte os bots para ele no .env:
+    GEMINI_API_BASE=http://127.0.0.1:8765
+    ANTHROPIC_API_BASE=http://127.0.0.1:8765
+"""
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "Olá, aqui é a Kit de mentirinha! 🍫 Esta resposta veio do servidor local de testes."
+
+_GEMINI_PATH = re.compile(r"^/v1beta/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)$")
+
+
+def split_reply(text):
+    """Quebra a resposta em pedaços parecidos com tokens (palavra + espaço)."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Uma instância do handler por conexão TCP: conta quantas o cliente abriu
+        self.server.record_connection()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        path, _, query = self.path.partition("?")
+        if self.headers.get("Content-Encoding") == "gzip":
+            if not self.server.accept_gzip:
+                self.server.record_request(path, None, length)
+                self.send_json(415, {"error": {"code": 415, "message": "Content-Encoding gzip não suportado"}})
+                return
+            raw = gzip.decompress(raw)
+        body = json.loads(raw or b"{}")
+        self.server.record_request(path, body, length)
+
+        failure = self.server.next_failure()
+        if failure is not None:
+            status, retry_after = failure
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+            self.send_json(status, {"error": {"code": status, "message": "Erro simulado pelo servidor de testes"}}, headers)
+            return
+
+        time.sleep(self.server.latency)
+        reply = self.server.reply_for(body)
+
+        gemini_match = _GEMINI_PATH.match(path)
+        if path == "/v1beta/cachedContents":
+            self.create_cached_content(body)
+        elif gemini_match:
+            cached_tokens = 0
+            if body.get("cachedContent"):
+                cached_tokens = self.server.cached_contents.get(body["cachedContent"])
+                if cached_tokens is None:
+                    self.send_json(404, {"error": {"code": 404, "message": "CachedContent not found", "status": "NOT_FOUND"}})
+                    return
+            usage = self.server.usage(body, reply, "gemini", cached_tokens=cached_tokens)
+            if gemini_match.group("method") == "streamGenerateContent":
+                self.stream_gemini(reply, usage)
+            else:
+                self.send_json(200, {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": reply}]}, "finishReason": "STOP"}],
+                    "usageMetadata": usage,
+                })
+        elif path == "/v1/messages":
+            cache_usage = self.anthropic_cache_usage(body)
+            if cache_usage is None:
+                return
+            usage = self.server.usage(body, reply, "anthropic", **cache_usage)
+            if body.get("stream"):
+                self.stream_anthropic(reply, usage)
+            else:
+                self.send_json(200, {
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "text", "text": reply}],
+                    "usage": usage,
+                })
+        else:
+            self.send_json(404, {"error": {"code": 404, "message": f"Rota desconhecida: {path}"}})
+
+    def do_DELETE(self):
+        path = self.path.partition("?")[0]
+        name = path[len("/v1beta/"):]
+        if path.startswith("/v1beta/cachedContents/") and self.server.cached_contents.pop(name, None) is not None:
+            self.send_json(200, {})
+        else:
+            self.send_json(404, {"error": {"code": 404, "message": f"Rota desconhecida: {path}"}})
+
+    def create_cached_content(self, body):
+        tokens = len(json.dumps(body.get("systemInstruction", {}), ensure_ascii=False)) // 4
+        if self.server.cache_mode != "supported":
+            self.send_json(400, {"error": {
+                "code": 400,
+                "message": f"Cached content is too small. total_token_count={tokens}, min_total_token_count=4096",
+                "status": "INVALID_ARGUMENT",
+            }})
+            return
+        name = f"cachedContents/mock-{next(self.server.cache_ids)}"
+        self.server.cached_contents[name] = tokens
+        self.server.cached_content_bodies[name] = body
+        self.send_json(200, {"name": name, "model": body.get("model"), "usageMetadata": {"totalTokenCount": tokens}})
+
+    def anthropic_cache_usage(self, body):
+        """Simula o cache_control da Anthropic; retorna None se já respondeu com erro."""
+        system = body.get("system")
+        if not isinstance(system, list) or not any("cache_control" in block for block in system):
+            return {}
+        if self.server.cache_mode != "supported":
+            self.send_json(400, {"type": "error", "error": {
+                "type": "invalid_request_error",
+                "message": "system.0.cache_control: Extra inputs are not permitted",
+            }})
+            return None
+        prefix = json.dumps(system, ensure_ascii=False, sort_keys=True)
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        tokens = len(prefix) // 4
+        if key in self.server.anthropic_prefixes:
+            return {"cache_read_tokens": tokens}
+        self.server.anthropic_prefixes.add(key)
+        return {"cache_write_tokens": tokens}
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, payload, event=None):
+        text = (f"event: {event}\n" if event else "") + f"data: {json.dumps(payload)}\n\n"
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def stream_gemini(self, reply, usage):
+        self.start_stream()
+        pieces = split_reply(reply)
+        for index, piece in enumerate(pieces):
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if index == len(pieces) - 1:
+                chunk["usageMetadata"] = usage
+            self.send_event(chunk)
+            time.sleep(self.server.chunk_delay)
+        self.end_stream()
+
+    def stream_anthropic(self, reply, usage):
+        self.start_stream()
+        self.send_event({"type": "message_start", "message": {"role": "assistant", "usage": usage}}, "message_start")
+        self.send_event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        for piece in split_reply(reply):
+            self.send_event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}, "content_block_delta")
+            time.sleep(self.server.chunk_delay)
+        self.send_event({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        self.send_event({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": usage["output_tokens"]}}, "message_delta")
+        self.send_event({"type": "message_stop"}, "message_stop")
+        self.end_stream()
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Servidor HTTP em thread própria; use como context manager em testes."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, chunk_delay=0.0, reply=DEFAULT_REPLY, cache_mode="supported", token_rate=None, error_rate=0.0, seed=None, accept_gzip=True):
+        super().__init__((host, port), MockLLMHandler)
+        self.latency = latency
+        # token_rate (pedaços por segundo no stream) tem precedência sobre chunk_delay
+        self.chunk_delay = 1.0 / token_rate if token_rate else chunk_delay
+        # Fração das requisições POST que responde 503, sorteada (além das de inject_errors)
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.reply = reply
+        # "supported" imita cachedContents/cache_control; "unsupported" recusa os dois
+        self.cache_mode = cache_mode
+        # Corpo com Content-Encoding: gzip; False responde 415, como um provedor que não aceita
+        self.accept_gzip = accept_gzip
+        self.cached_contents = {}
+        # Corpo de cada cachedContents criado, para quem precisa do system prompt em cache (benchmarks.evaluation)
+        self.cached_content_bodies = {}
+        self.anthropic_prefixes = set()
+        self.cache_ids = itertools.count(1)
+        self.requests = []
+        self.bytes_received = 0
+        self.connections = 0
+        self.failures = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record_request(self, path, body, length=0):
+        with self._lock:
+            self.requests.append((path, body))
+            self.bytes_received += length
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def inject_errors(self, status=503, count=1, retry_after=None):
+        """As próximas `count` requisições POST respondem `status` (com Retry-After opcional)."""
+        with self._lock:
+            self.failures.extend([(status, retry_after)] * count)
+
+    def next_failure(self):
+        with self._lock:
+            if self.failures:
+                return self.failures.pop(0)
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 503, None
+            return None
+
+    def reply_for(self, body):
+        return self.reply(body) if callable(self.reply) else self.reply
+
+    def usage(self, body, reply, provider, cached_tokens=0, cache_read_tokens=0, cache_write_tokens=0):
+        input_tokens = len(json.dumps(body, ensure_ascii=False)) // 4
+        output_tokens = len(reply) // 4
+        if provider == "gemini":
+            usage = {
+                "promptTokenCount": input_tokens + cached_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": input_tokens + cached_tokens + output_tokens,
+            }
+            if cached_tokens:
+                usage["cachedContentTokenCount"] = cached_tokens
+            return usage
+        return {
+            "input_tokens": input_tokens - cache_read_tokens - cache_write_tokens,
+            "cache_read_input_tokens": cache_read_tokens,
+            "cache_creation_input_tokens": cache_write_tokens,
+            "output_tokens": output_tokens,
+        }
+
+    def handle_error(self, request, client_address):
+        # Cliente que fecha o stream no meio (turno cancelado) não é erro do mock
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita as APIs do Gemini e da Anthropic")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos até o primeiro byte")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="segundos entre pedaços do stream")
+    parser.add_argument("--token-rate", type=float, default=None, help="pedaços do stream por segundo (substitui --chunk-delay)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração das chamadas que responde 503")
+    parser.add_argument("--fail-first", type=int, default=0, help="quantas chamadas iniciais respondem 503")
+    parser.add_argument("--cache-mode", choices=["supported", "unsupported"], default="supported", help="simula suporte a cache de prompt")
+    parser.add_argument("--sem-gzip", action="store_true", help="recusa corpos com Content-Encoding: gzip (415)")
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, args.latency, args.chunk_delay, cache_mode=args.cache_mode, token_rate=args.token_rate, error_rate=args.error_rate, accept_gzip=not args.sem_gzip)
+    server.inject_errors(503, args.fail_first, retry_after=1)
+    print(f"Servidor mock ouvindo em {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,142 @@
+"""Corpo JSON das chamadas aos provedores, codificado aos poucos.
+
+O histórico e o system prompt mudam pouco de um turno para o outro: cada turno (e cada
+bloco do system prompt) é codificado uma vez e guardado em bytes; nos turnos seguintes o
+corpo é montado juntando os pedaços prontos e só o que é novo passa pelo json.dumps.
+Com KIT_GZIP_REQUESTS ligado, corpos grandes vão comprimidos (Content-Encoding: gzip)
+enquanto o provedor aceitar.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Campos com uma lista de turnos: cada item é guardado separado
+LIST_FIELDS = ("contents", "messages")
+# Campos grandes e repetidos de um turno para o outro (system prompt)
+CACHED_FIELDS = ("systemInstruction", "system")
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+GZIP_MIN_BYTES = 4096
+GZIP_LEVEL = 5
+
+
+def _dumps(value):
+    # UTF-8 direto: "ç" vai em 2 bytes em vez de um escape \uXXXX de 6
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _freeze(value):
+    """Chave hashable com o conteúdo de value (dicts e listas viram tuplas)."""
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ("[",) + tuple(_freeze(item) for item in value)
+    return value
+
+
+class EncodedRequest:
+    """Corpo pronto para o POST, com o tamanho antes e depois da compressão."""
+
+    def __init__(self, body, data, headers, encode_seconds):
+        self.body = body
+        self.data = data
+        self.headers = headers
+        self.encode_seconds = encode_seconds
+
+    def uncompressed(self):
+        """Passa a enviar o corpo sem compressão."""
+        self.data = self.body
+        self.headers = {}
+
+    @property
+    def raw_size(self):
+        return len(self.body)
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def compressed(self):
+        return "Content-Encoding" in self.headers
+
+
+class PayloadEncoder:
+    """Codifica o corpo reaproveitando os bytes de turnos e system prompts já vistos.
+
+    O cache é por conteúdo (o histórico é recriado a cada turno pelo ConversationWindow)
+    e tem limite de bytes; os mais antigos saem primeiro.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.fragments = OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def fragment(self, value):
+        key = _freeze(value)
+        with self._lock:
+            data = self.fragments.get(key)
+            if data is not None:
+                self.fragments.move_to_end(key)
+                self.hits += 1
+                return data
+        data = _dumps(value)
+        with self._lock:
+            self.misses += 1
+            if key not in self.fragments and len(data) <= self.max_bytes:
+                self.fragments[key] = data
+                self.cached_bytes += len(data)
+                while self.cached_bytes > self.max_bytes:
+                    _, removed = self.fragments.popitem(last=False)
+                    self.cached_bytes -= len(removed)
+        return data
+
+    def encode(self, request_data):
+        """Bytes do JSON de request_data (mesmo conteúdo do json.dumps, sem espaços)."""
+        parts = []
+        for name, value in request_data.items():
+            if name in LIST_FIELDS and isinstance(value, list):
+                encoded = b"[" + b",".join(self.fragment(item) for item in value) + b"]"
+            elif name in CACHED_FIELDS:
+                encoded = self.fragment(value)
+            else:
+                encoded = _dumps(value)
+            parts.append(_dumps(name) + b":" + encoded)
+        return b"{" + b",".join(parts) + b"}"
+
+
+class RequestCompression:
+    """gzip do corpo das requisições, desligado de vez se o provedor recusar."""
+
+    def __init__(self, enabled=False, min_bytes=GZIP_MIN_BYTES, level=GZIP_LEVEL):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def apply(self, body):
+        """(dados, cabeçalhos extras) para enviar body."""
+        if not self.enabled or len(body) < self.min_bytes:
+            return body, {}
+        return gzip.compress(body, self.level, mtime=0), {"Content-Encoding": "gzip"}
+
+
+def request_compression_from_env():
+    """RequestCompression configurado por KIT_GZIP_REQUESTS e KIT_GZIP_MIN_BYTES."""
+    enabled = os.getenv("KIT_GZIP_REQUESTS", "0").lower() in ("1", "true", "sim")
+    return RequestCompression(enabled, int(os.getenv("KIT_GZIP_MIN_BYTES", str(GZIP_MIN_BYTES))))
+
+
+def encode_request(encoder, compression, request_data, trace):
+    """EncodedRequest de request_data, medindo as etapas encode e compress no trace."""
+    started_at = time.perf_counter()
+    with trace.span("encode"):
+        body = encoder.encode(request_data)
+    with trace.span("compress"):
+        data, headers = compression.apply(body)
+    return EncodedRequest(body, data, headers, time.perf_counter() - started_at)
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+
+from http_client import request_exceptions, shared_http_client
+
+DEFAULT_STATE_PATH = "./.kit_cache/gemini_cached_content.json"
+
+# Respostas do cachedContents que querem dizer "não dá para este modelo/conta/prompt"
+UNSUPPORTED_STATUS = (400, 403, 404)
+# Espera depois de uma falha passageira (rede, 429, 5xx) antes de tentar criar o cache de novo
+RETRY_BACKOFF_BASE = 5.0
+RETRY_BACKOFF_MAX = 300.0
+
+
+class PromptCacheStats:
+    """Contadores de acerto/erro do cache de prompt do provedor, lidos do usage de cada resposta."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+        self.consecutive_misses = 0
+
+    def record(self, cached_tokens=0, cache_write_tokens=0):
+        """Registra um turno; retorna True quando o provedor reaproveitou o prefixo em cache."""
+        self.cache_write_tokens += cache_write_tokens
+        if cached_tokens:
+            self.hits += 1
+            self.cached_tokens += cached_tokens
+            self.consecutive_misses = 0
+            return True
+        self.misses += 1
+        # Criar o cache (cache_write) não é falha: o próximo turno deve acertar
+        self.consecutive_misses = 0 if cache_write_tokens else self.consecutive_misses + 1
+        return False
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_tokens": self.cached_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+        }
+
+
+class GeminiContextCache:
+    """Mantém um cachedContents do Gemini com o system prompt estático (persona + KB completa)."""
+
+    def __init__(self, api_base, api_key, model, state_path=DEFAULT_STATE_PATH, ttl_seconds=3600, http=None):
+        self.api_base = api_base
+        self.http = http or shared_http_client()
+        self.api_key = api_key
+        self.model = model
+        self.state_path = state_path
+        self.ttl_seconds = ttl_seconds
+        self.supported = True
+        # Falha passageira: sem cache até retry_at, a não ser que a KB mude
+        self.failures = 0
+        self.retry_at = 0.0
+        self.failed_kb_version = None
+        # cachedContents recusados seguidos no generateContent (ver rejected())
+        self.rejections = 0
+        self.name = None
+        self.kb_version = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._load_state()
+
+    def _load_state(self):
+        # O mesmo cache serve para todas as sessões enquanto a KB não mudar
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+        if state.get("api_base") == self.api_base and state.get("model") == self.model:
+            self.name = state.get("name")
+            self.kb_version = state.get("kb_version")
+            self.expires_at = state.get("expires_at", 0.0)
+
+    def _save_state(self):
+        # Disco cheio ou pasta sem permissão: o cache continua valendo em memória,
+        # só não é reaproveitado pela próxima execução
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.state_path, "w", encoding="utf-8") as file:
+                json.dump({
+                    "api_base": self.api_base,
+                    "model": self.model,
+                    "name": self.name,
+                    "kb_version": self.kb_version,
+                    "expires_at": self.expires_at,
+                }, file)
+        except OSError:
+            pass
+
+    def get(self, system_prompt, kb_version, deadline=None):
+        """Retorna o nome do cachedContent válido para esta versão da KB, criando se preciso.
+
+        deadline (time.monotonic) é o prazo do turno, que a criação do cache também consome.
+        """
+        # Várias sessões podem pedir ao mesmo tempo; só uma cria o cache
+        with self._lock:
+            if not self.supported:
+                return None
+            # Renova um pouco antes de expirar para não usar um cache que some no meio do turno
+            if self.name and self.kb_version == kb_version and time.time() < self.expires_at - 60:
+                return self.name
+            if kb_version == self.failed_kb_version and time.time() < self.retry_at:
+                return None
+            stale = self._forget()
+            name = self._create(system_prompt, kb_version, deadline)
+        self._delete(stale)
+        return name
+
+    def _create(self, system_prompt, kb_version, deadline=None):
+        try:
+            response = self.http.post(
+                f"{self.api_base}/v1beta/cachedContents?key={self.api_key}",
+                "gemini",
+                headers={"Content-Type": "application/json"},
+                json={
+                    "model": f"models/{self.model}",
+                    "systemInstruction": {"parts": [{"text": system_prompt}]},
+                    "ttl": f"{self.ttl_seconds}s",
+                },
+                deadline=deadline,
+            )
+            response.raise_for_status()
+            self.name = response.json()["name"]
+        except request_exceptions().HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status in UNSUPPORTED_STATUS:
+                # Modelo/conta sem suporte ou prompt pequeno demais: segue sem cache de vez
+                self.supported = False
+            else:
+                self.backoff(kb_version)
+            return None
+        except (request_exceptions().RequestException, KeyError, ValueError):
+            # Timeout, conexão ou resposta estranha: este turno vai sem cache, tenta de novo depois
+            self.backoff(kb_version)
+            return None
+
+        self.failures = 0
+        self.failed_kb_version = None
+        self.kb_version = kb_version
+        self.expires_at = time.time() + self.ttl_seconds
+        self._save_state()
+        return self.name
+
+    def backoff(self, kb_version):
+        self.failures += 1
+        self.retry_at = time.time() + min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (self.failures - 1))
+        self.failed_kb_version = kb_version
+
+    def rejected(self):
+        """O generateContent recusou o cachedContent: esquece o cache e recria no próximo turno.
+
+        Um cache expirado ou apagado no provedor é recusado uma vez; se o recém-criado também
+        for recusado, o modelo não aceita cachedContents e o cache é desligado.
+        """
+        with self._lock:
+            stale = self._forget()
+            self.rejections += 1
+            if self.rejections >= 2:
+                self.supported = False
+        self._delete(stale)
+
+    def accepted(self):
+        """O generateContent aceitou o cachedContent: zera a contagem de recusas."""
+        with self._lock:
+            self.rejections = 0
+
+    def invalidate(self):
+        """Esquece (e tenta apagar no provedor) o cache atual."""
+        with self._lock:
+            stale = self._forget()
+        self._delete(stale)
+
+    def _forget(self):
+        # Chamado com o lock; retorna o nome do cache antigo para apagar depois, fora dele
+        name = self.name
+        self.name = None
+        self.kb_version = None
+        self.expires_at = 0.0
+        return name
+
+    def _delete(self, name):
+        # O DELETE vai fora do lock: um provedor lento não trava o turno das outras sessões
+        if name:
+            try:
+                self.http.delete(f"{self.api_base}/v1beta/{name}?key={self.api_key}", "gemini")
+            except request_exceptions().RequestException:
+                pass
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def shared_gemini_context_cache(api_base, api_key, model):
+    """GeminiContextCache único por processo para o mesmo endpoint e modelo."""
+    with _shared_caches_lock:
+        key = (api_base, api_key, model)
+        if key not in _shared_caches:
+            _shared_caches[key] = GeminiContextCache(api_base, api_key, model)
+        return _shared_caches[key]
+
+
+def anthropic_system_blocks(static_prompt):
+    """System da Anthropic em bloco com breakpoint de cache no fim do prefixo estático."""
+    return [{"type": "text", "text": static_prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+def prompt_cache_enabled():
+    return os.getenv("KIT_PROMPT_CACHE", "1").lower() not in ("0", "false", "nao", "não")
@@ -0,0 +1,302 @@
+import json
+import os
+import time
+
+from colorama import Fore, Style
+
+from history_window import turn_text
+from http_client import request_exceptions, shared_http_client
+from metrics import NULL_TRACE
+from payload import PayloadEncoder, encode_request, request_compression_from_env
+from prompt_cache import PromptCacheStats, anthropic_system_blocks, prompt_cache_enabled, shared_gemini_context_cache
+from sse import anthropic_stream_text, gemini_stream_text
+
+
+def merge_roles(turns, user_role, assistant_role):
+    """(papel, texto) de cada turno, juntando turnos seguidos do mesmo papel.
+
+    Aceita turnos no formato Gemini (parts, "model") ou Anthropic (content, "assistant"),
+    então o histórico continua válido quando a conversa troca de provedor.
+    """
+    merged = []
+    for turn in turns:
+        role = user_role if turn["role"] == "user" else assistant_role
+        text = turn_text(turn)
+        # Uma pergunta que deu erro fica sem resposta; a Anthropic exige papéis alternados
+        if merged and merged[-1][0] == role:
+            merged[-1] = (role, merged[-1][1] + "\n\n" + text)
+        else:
+            merged.append((role, text))
+    return merged
+
+
+def to_gemini_contents(turns):
+    return [{"role": role, "parts": [{"text": text}]} for role, text in merge_roles(turns, "user", "model")]
+
+
+def to_anthropic_messages(turns):
+    return [{"role": role, "content": text} for role, text in merge_roles(turns, "user", "assistant")]
+
+
+def raise_for_status(response):
+    """response.raise_for_status lendo o corpo antes, para os detalhes do erro continuarem
+    disponíveis depois que a resposta (aberta com stream=True) for fechada."""
+    if response.status_code >= 400:
+        response.content
+    response.raise_for_status()
+
+
+def post_request(provider, url, request, trace, deadline=None):
+    """POST do corpo já codificado (aberto com stream=True).
+
+    Se o provedor recusar o corpo comprimido e aceitar o mesmo corpo sem gzip, a
+    compressão fica desligada para as próximas chamadas.
+    """
+    headers = dict(provider.headers, **request.headers) if request.compressed else provider.headers
+    with trace.span("ttfb"):
+        response = provider.http.post(url, provider.name, headers=headers, data=request.data, stream=True, deadline=deadline)
+    if request.compressed and response.status_code in (400, 415):
+        # Lê o erro antes de fechar para a conexão voltar ao pool
+        response.content
+        response.close()
+        request.uncompressed()
+        with trace.span("ttfb"):
+            response = provider.http.post(url, provider.name, headers=provider.headers, data=request.data, stream=True, deadline=deadline)
+        if response.status_code < 400:
+            provider.compression.enabled = False
+    return response
+
+
+class SystemPrompt:
+    """System prompt de um turno: o prefixo estático (que pode ficar em cache no provedor)
+    e a versão com recuperação por seções, montada só se o provedor precisar dela."""
+
+    def __init__(self, static, kb_version, build_retrieval):
+        self.static = static
+        self.kb_version = kb_version
+        self.build_retrieval = build_retrieval
+        self._retrieval = None
+
+    def retrieval(self):
+        if self._retrieval is None:
+            self._retrieval = self.build_retrieval()
+        return self._retrieval
+
+
+class Reply:
+    def __init__(self, text, first_token_at, usage, provider, request=None, coalesced=False):
+        self.text = text
+        self.first_token_at = first_token_at
+        self.usage = usage
+        self.provider = provider
+        # EncodedRequest da chamada que deu certo (tempo de codificação e bytes enviados)
+        self.request = request
+        # True quando a resposta veio da chamada idêntica de outra sessão (scheduler.Coalescer)
+        self.coalesced = coalesced
+
+
+class GeminiProvider:
+    """generateContent/streamGenerateContent do Gemini, com cachedContents para o prompt estático."""
+
+    name = "gemini"
+
+    def __init__(self, api_key, api_base="https://generativelanguage.googleapis.com", model="gemini-2.0-flash", streaming=True, prompt_caching=True, debug=False, http=None, compression=None):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.api_url = f"{api_base}/v1beta/models/{model}:generateContent?key={api_key}"
+        self.stream_url = f"{api_base}/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+        self.headers = {"Content-Type": "application/json"}
+        self.streaming = streaming
+        self.debug = debug
+        self.http = http or shared_http_client()
+        self.prompt_cache = shared_gemini_context_cache(api_base, api_key, model) if prompt_caching else None
+        self.prompt_cache_stats = PromptCacheStats()
+        self.encoder = PayloadEncoder()
+        self.compression = compression or request_compression_from_env()
+
+    def make_turn(self, role, text):
+        return {"role": "user" if role == "user" else "model", "parts": [{"text": text}]}
+
+    def build_request(self, turns, cached_content=None, system_prompt=None):
+        request_data = {
+            "contents": to_gemini_contents(turns),
+            "generationConfig": {
+                "temperature": 0.88,
+                "maxOutputTokens": 1000,
+                "topP": 0.95
+            }
+        }
+        # O cachedContent já traz o system prompt; sem ele, vai como instrução do sistema
+        if cached_content:
+            request_data["cachedContent"] = cached_content
+        elif system_prompt:
+            request_data["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+        return request_data
+
+    def send(self, request_data, on_chunk=None, trace=NULL_TRACE, deadline=None):
+        """Chama a API (com ou sem streaming) e retorna (texto, instante do 1º token, usageMetadata, EncodedRequest)."""
+        streaming = bool(on_chunk and self.streaming)
+        request = encode_request(self.encoder, self.compression, request_data, trace)
+        response = post_request(self, self.stream_url if streaming else self.api_url, request, trace, deadline)
+        with response:
+            raise_for_status(response)
+            if streaming:
+                pieces = []
+                usage = {}
+                first_token_at = None
+                with trace.span("receive"):
+                    for text in gemini_stream_text(response.iter_lines(), usage):
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        pieces.append(text)
+                        on_chunk(text)
+                return "".join(pieces), first_token_at, usage, request
+
+            with trace.span("receive"):
+                content = response.content
+            with trace.span("parse"):
+                response_data = json.loads(content)
+        return response_data["candidates"][0]["content"]["parts"][0]["text"], None, response_data.get("usageMetadata", {}), request
+
+    def generate(self, system, turns, on_chunk=None, trace=NULL_TRACE, deadline=None):
+        # Com o cache de prompt a KB completa já está no provedor; sem ele,
+        # só as seções relevantes da KB vão no systemInstruction
+        cached_content = None
+        if self.prompt_cache is not None:
+            cached_content = self.prompt_cache.get(system.static, system.kb_version, deadline)
+        with trace.span("build"):
+            system_prompt = None if cached_content else system.retrieval()
+            request_data = self.build_request(turns, cached_content, system_prompt)
+
+        try:
+            text, first_token_at, usage, request = self.send(request_data, on_chunk, trace, deadline)
+        except request_exceptions().HTTPError as e:
+            # cachedContent recusado (expirado ou apagado no provedor): volta ao prompt normal
+            if not cached_content or e.response is None or e.response.status_code not in (400, 403, 404):
+                raise
+            self.prompt_cache.rejected()
+            cached_content = None
+            text, first_token_at, usage, request = self.send(self.build_request(turns, None, system.retrieval()), on_chunk, trace, deadline)
+
+        if cached_content:
+            self.prompt_cache.accepted()
+            self.record_prompt_cache_usage(usage)
+        return Reply(text, first_token_at, usage, self.name, request)
+
+    def record_prompt_cache_usage(self, usage):
+        """Contabiliza acerto/erro do cache de prompt a partir do usageMetadata."""
+        cached_tokens = usage.get("cachedContentTokenCount", 0)
+        hit = self.prompt_cache_stats.record(cached_tokens)
+        if self.debug:
+            status = "acerto" if hit else "erro"
+            print(Fore.YELLOW + f"[debug] Cache de prompt: {status} ({cached_tokens} tokens em cache)" + Style.RESET_ALL)
+
+
+class AnthropicProvider:
+    """Messages API da Anthropic, com breakpoint cache_control no prompt estático."""
+
+    name = "anthropic"
+
+    def __init__(self, api_key, api_base="https://api.anthropic.com", model="claude-3-sonnet-20240229", streaming=True, prompt_caching=True, debug=False, http=None, compression=None):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.base_url = f"{api_base}/v1/messages"
+        self.headers = {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+        self.streaming = streaming
+        self.debug = debug
+        self.http = http or shared_http_client()
+        self.prompt_caching = prompt_caching
+        self.prompt_cache_stats = PromptCacheStats()
+        self.encoder = PayloadEncoder()
+        self.compression = compression or request_compression_from_env()
+
+    def make_turn(self, role, text):
+        return {"role": "user" if role == "user" else "assistant", "content": text}
+
+    def send(self, data, on_chunk=None, trace=NULL_TRACE, deadline=None):
+        """Chama a API (com ou sem streaming) e retorna (texto, instante do 1º token, usage, EncodedRequest)."""
+        streaming = bool(on_chunk and self.streaming)
+        request = encode_request(self.encoder, self.compression, dict(data, stream=True) if streaming else data, trace)
+        response = post_request(self, self.base_url, request, trace, deadline)
+        with response:
+            raise_for_status(response)
+            if streaming:
+                pieces = []
+                usage = {}
+                first_token_at = None
+                with trace.span("receive"):
+                    for text in anthropic_stream_text(response.iter_lines(), usage):
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        pieces.append(text)
+                        on_chunk(text)
+                return "".join(pieces), first_token_at, usage, request
+
+            with trace.span("receive"):
+                content = response.content
+            with trace.span("parse"):
+                response_data = json.loads(content)
+        return response_data["content"][0]["text"], None, response_data.get("usage", {}), request
+
+    def generate(self, system, turns, on_chunk=None, trace=NULL_TRACE, deadline=None):
+        # Com o cache de prompt vai o prefixo estático (persona + KB completa) marcado com
+        # cache_control; sem ele, só as seções relevantes da KB
+        use_prompt_cache = self.prompt_caching
+        with trace.span("build"):
+            data = {
+                "model": self.model,
+                "max_tokens": 1000,
+                "messages": to_anthropic_messages(turns),
+                "system": anthropic_system_blocks(system.static) if use_prompt_cache else system.retrieval(),
+                "temperature": 0.7
+            }
+
+        try:
+            text, first_token_at, usage, request = self.send(data, on_chunk, trace, deadline)
+        except request_exceptions().HTTPError as e:
+            # Provedor sem suporte a cache_control: segue com o system prompt em texto. Outros
+            # 400 (mensagens inválidas, max_tokens...) não têm a ver com o cache e sobem
+            if not use_prompt_cache or e.response is None or e.response.status_code != 400 or "cache_control" not in e.response.text:
+                raise
+            self.prompt_caching = use_prompt_cache = False
+            data["system"] = system.retrieval()
+            text, first_token_at, usage, request = self.send(data, on_chunk, trace, deadline)
+
+        if use_prompt_cache:
+            self.record_prompt_cache_usage(usage)
+        return Reply(text, first_token_at, usage, self.name, request)
+
+    def record_prompt_cache_usage(self, usage):
+        """Contabiliza acerto/erro do cache de prompt a partir do usage da resposta."""
+        cached_tokens = usage.get("cache_read_input_tokens") or 0
+        write_tokens = usage.get("cache_creation_input_tokens") or 0
+        hit = self.prompt_cache_stats.record(cached_tokens, write_tokens)
+        if self.debug:
+            status = "acerto" if hit else "escrita" if write_tokens else "erro"
+            print(Fore.YELLOW + f"[debug] Cache de prompt: {status} ({cached_tokens} tokens em cache)" + Style.RESET_ALL)
+        # Provedor ignorando o cache: mandar a KB inteira sai mais caro que a recuperação por seções
+        if self.prompt_cache_stats.consecutive_misses >= 3:
+            self.prompt_caching = False
+
+
+def provider_from_env(name, streaming=True, debug=False):
+    """Cria o provedor `name` ("gemini" ou "anthropic") com a chave e o endereço do .env."""
+    if name == "gemini":
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("API key não encontrada. Adicione a GOOGLE_API_KEY no .env")
+        api_base = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+        return GeminiProvider(api_key, api_base, streaming=streaming, prompt_caching=prompt_cache_enabled(), debug=debug)
+    if name == "anthropic":
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("API key não encontrada. Adicione a ANTHROPIC_API_KEY no .env")
+        api_base = os.getenv("ANTHROPIC_API_BASE", "https://api.anthropic.com")
+        return AnthropicProvider(api_key, api_base, streaming=streaming, prompt_caching=prompt_cache_enabled(), debug=debug)
+    raise ValueError(f"Provedor desconhecido: {name} (use gemini ou anthropic)")
@@ -0,0 +1,289 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import request_exceptions
+from metrics import NULL_TRACE, shared_metrics_registry, usage_tokens
+from providers import Reply, provider_from_env
+from scheduler import PRIORITY_NORMAL, Coalescer, coalesce_key, coalescing_enabled, estimate_request_tokens, shared_admission_scheduler
+from sse import StreamError
+
+
+def failures():
+    """Falhas que fazem o roteador tentar outro provedor."""
+    return (request_exceptions().RequestException, StreamError)
+
+
+class BackendStats:
+    """Janela móvel de latência (até o 1º token) e erros de um provedor."""
+
+    def __init__(self, window_seconds=300, max_samples=200):
+        self.window_seconds = window_seconds
+        self.samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok=True):
+        with self._lock:
+            self.samples.append((time.monotonic(), latency, ok))
+
+    def recent(self):
+        # Amostras antigas saem da janela: um provedor rebaixado volta a ser tentado
+        limit = time.monotonic() - self.window_seconds
+        with self._lock:
+            while self.samples and self.samples[0][0] < limit:
+                self.samples.popleft()
+            return list(self.samples)
+
+    def error_rate(self):
+        samples = self.recent()
+        if not samples:
+            return 0.0
+        return sum(1 for _, _, ok in samples if not ok) / len(samples)
+
+    def percentile(self, fraction):
+        latencies = sorted(latency for _, latency, ok in self.recent() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def as_dict(self):
+        samples = self.recent()
+        return {
+            "samples": len(samples),
+            "error_rate": self.error_rate(),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def hedge_executor():
+    """Pool compartilhado das requisições do roteador com hedging."""
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="kit-hedge")
+        return _hedge_executor
+
+
+class ProviderRouter:
+    """Escolhe o provedor de cada turno pela ordem de preferência e pela saúde recente.
+
+    Um provedor com taxa de erro acima de max_error_rate ou p95 acima de slow_p95 vai
+    para o fim da fila. Se a chamada falha antes do primeiro pedaço de texto, o próximo
+    provedor é tentado. Com hedge_after, se o primeiro token não chegar nesse tempo,
+    uma segunda requisição vai para o próximo provedor e fica a resposta que começar antes.
+
+    Com scheduler, cada chamada espera vaga no orçamento do provedor; com coalescer,
+    turnos idênticos em andamento viram uma única chamada. turn_timeout limita o tempo
+    do turno inteiro (fila, novas tentativas e troca de provedor), não o de cada tentativa.
+    """
+
+    def __init__(self, providers, hedge_after=None, slow_p95=None, max_error_rate=0.5, min_samples=3, scheduler=None, coalescer=None, turn_timeout=None):
+        if not providers:
+            raise ValueError("Nenhum provedor configurado")
+        self.providers = list(providers)
+        self.hedge_after = hedge_after
+        self.slow_p95 = slow_p95
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.stats = {provider.name: BackendStats() for provider in self.providers}
+        self.hedges = 0
+        self.scheduler = scheduler
+        self.coalescer = coalescer
+        self.turn_timeout = turn_timeout
+
+    @property
+    def primary(self):
+        return self.providers[0]
+
+    def healthy(self, provider):
+        stats = self.stats[provider.name]
+        if len(stats.recent()) < self.min_samples:
+            return True
+        if stats.error_rate() > self.max_error_rate:
+            return False
+        p95 = stats.percentile(0.95)
+        return self.slow_p95 is None or p95 is None or p95 <= self.slow_p95
+
+    def order(self):
+        # sorted é estável: entre os saudáveis vale a ordem de preferência
+        return sorted(self.providers, key=lambda provider: not self.healthy(provider))
+
+    def call(self, provider, system, turns, on_chunk=None, trace=NULL_TRACE, session=None, priority=PRIORITY_NORMAL, deadline=None):
+        admission = None
+        if self.scheduler is not None:
+            admission = self.scheduler.admit(provider.name, session, estimate_request_tokens(system, turns), priority, trace)
+        started_at = time.perf_counter()
+        try:
+            reply = provider.generate(system, turns, on_chunk, trace, deadline)
+        except failures():
+            self.stats[provider.name].record(time.perf_counter() - started_at, ok=False)
+            if admission is not None:
+                admission.done()
+            raise
+        self.stats[provider.name].record((reply.first_token_at or time.perf_counter()) - started_at)
+        if admission is not None:
+            tokens = usage_tokens(reply.usage)
+            admission.done(tokens["input"] + tokens["output"] if reply.usage else None)
+        return reply
+
+    def generate(self, system, turns, on_chunk=None, trace=NULL_TRACE, session=None, priority=PRIORITY_NORMAL):
+        """Responde o turno com o melhor provedor disponível; retorna um Reply.
+
+        session identifica a conversa na fila do scheduler; priority vem de scheduler.turn_priority.
+        """
+        deadline = time.monotonic() + self.turn_timeout if self.turn_timeout else None
+        if self.coalescer is None:
+            return self.route(system, turns, on_chunk, trace, session, priority, deadline)
+
+        first_chunk = []
+
+        def forward(text):
+            if not first_chunk:
+                first_chunk.append(time.perf_counter())
+            on_chunk(text)
+
+        reply, shared = self.coalescer.run(
+            coalesce_key(system, turns, on_chunk is not None),
+            lambda publish: self.route(system, turns, publish, trace, session, priority, deadline),
+            forward if on_chunk else None,
+        )
+        if not shared:
+            return reply
+        # Resposta da chamada de outra sessão: nenhum token gasto por esta
+        return Reply(reply.text, first_chunk[0] if first_chunk else None, {}, reply.provider, coalesced=True)
+
+    def route(self, system, turns, on_chunk=None, trace=NULL_TRACE, session=None, priority=PRIORITY_NORMAL, deadline=None):
+        """Chama os provedores em ordem (ou com hedging) até um responder."""
+        candidates = self.order()
+        if self.hedge_after is not None and len(candidates) > 1:
+            return self.hedged(system, turns, on_chunk, candidates, trace, session, priority, deadline)
+
+        last_error = None
+        for provider in candidates:
+            streamed = []
+
+            def forward(text):
+                streamed.append(text)
+                on_chunk(text)
+
+            try:
+                return self.call(provider, system, turns, forward if on_chunk else None, trace, session, priority, deadline)
+            except failures() as error:
+                # Texto já exibido não pode ser trocado pelo de outro provedor
+                if streamed:
+                    raise
+                last_error = error
+        raise last_error
+
+    def hedged(self, system, turns, on_chunk, candidates, trace=NULL_TRACE, session=None, priority=PRIORITY_NORMAL, deadline=None):
+        """Como generate, mas dispara uma segunda requisição se o primeiro token demorar.
+
+        Só os pedaços do provedor que começou a responder primeiro chegam em on_chunk;
+        a requisição perdedora termina em segundo plano e é descartada.
+        """
+        results = queue.Queue()
+        lock = threading.Lock()
+        state = {"winner": None}
+        remaining = list(candidates)
+        running = 0
+
+        def attempt(provider):
+            def forward(text):
+                with lock:
+                    if state["winner"] is None:
+                        state["winner"] = provider
+                    won = state["winner"] is provider
+                if won:
+                    on_chunk(text)
+
+            try:
+                results.put((provider, self.call(provider, system, turns, forward if on_chunk else None, trace, session, priority, deadline), None))
+            except Exception as error:
+                # Inclui erros que não são do provedor (ex.: turno cancelado em on_chunk): o laço abaixo decide
+                results.put((provider, None, error))
+
+        def launch():
+            nonlocal running
+            running += 1
+            hedge_executor().submit(attempt, remaining.pop(0))
+
+        launch()
+        hedge_at = time.monotonic() + self.hedge_after
+        hedged = False
+        last_error = None
+        while running:
+            timeout = None
+            if remaining and not hedged:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            try:
+                provider, reply, error = results.get(timeout=timeout)
+            except queue.Empty:
+                hedged = True
+                with lock:
+                    started = state["winner"] is not None
+                if not started:
+                    self.hedges += 1
+                    launch()
+                continue
+
+            running -= 1
+            with lock:
+                if error is None and state["winner"] is None:
+                    state["winner"] = provider
+                won = state["winner"] is provider
+            if error is None and won:
+                return reply
+            if error is not None:
+                if won or not isinstance(error, failures()):
+                    raise error
+                last_error = error
+                # Falhou antes de responder: passa para o próximo provedor
+                if remaining and not running:
+                    launch()
+                    hedge_at = time.monotonic() + self.hedge_after
+        raise last_error
+
+    def stats_dict(self):
+        stats = {name: stats.as_dict() for name, stats in self.stats.items()}
+        if self.scheduler is not None:
+            for name, depth in self.scheduler.depth().items():
+                stats.setdefault(name, {})["queue_depth"] = depth
+        return stats
+
+
+_shared_routers = {}
+_shared_routers_lock = threading.Lock()
+
+
+def router_from_env(default_provider, streaming=True, debug=False):
+    """Roteador compartilhado no processo, configurado pelo .env.
+
+    KIT_PROVIDERS lista os provedores em ordem de preferência (ex.: "gemini,anthropic");
+    sem ela só o provedor padrão do bot é usado. Os orçamentos KIT_<PROVEDOR>_RPM/_TPM
+    valem para o processo inteiro; KIT_COALESCE=0 desliga a junção de turnos idênticos.
+    """
+    names = tuple(name.strip().lower() for name in os.getenv("KIT_PROVIDERS", default_provider).split(",") if name.strip())
+    hedge_after = os.getenv("KIT_HEDGE_AFTER")
+    slow_p95 = os.getenv("KIT_ROUTER_SLOW_P95")
+    key = (names, streaming, debug, hedge_after, slow_p95)
+    with _shared_routers_lock:
+        if key not in _shared_routers:
+            registry = shared_metrics_registry()
+            _shared_routers[key] = ProviderRouter(
+                [provider_from_env(name, streaming, debug) for name in names],
+                hedge_after=float(hedge_after) if hedge_after else None,
+                slow_p95=float(slow_p95) if slow_p95 else None,
+                max_error_rate=float(os.getenv("KIT_ROUTER_MAX_ERROR_RATE", "0.5")),
+                scheduler=shared_admission_scheduler(registry),
+                coalescer=Coalescer(registry) if coalescing_enabled() else None,
+                turn_timeout=float(os.getenv("KIT_HTTP_TOTAL_TIMEOUT", "90")) or None,
+            )
+        return _shared_routers[key]
@@ -0,0 +1,299 @@
+"""Fila de admissão das chamadas aos provedores e junção de chamadas iguais em andamento.
+
+Com várias sessões no mesmo processo (servidor, batch), o AdmissionScheduler segura
+cada chamada até caber no orçamento de requisições e tokens por minuto do provedor
+(KIT_<PROVEDOR>_RPM / KIT_<PROVEDOR>_TPM). A vez é dada por sessão, em rodízio, e
+perguntas curtas passam na frente. O Coalescer faz perguntas idênticas feitas ao
+mesmo tempo usarem uma única chamada, com a resposta (e o stream) entregue a todas.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from history_window import turn_text
+from text_utils import estimate_tokens
+
+PRIORITY_SHORT = 0
+PRIORITY_NORMAL = 1
+# Perguntas até este tamanho (tokens estimados) são consultas rápidas e furam a fila
+SHORT_QUESTION_TOKENS = 24
+
+
+def turn_priority(question):
+    return PRIORITY_SHORT if estimate_tokens(question) <= SHORT_QUESTION_TOKENS else PRIORITY_NORMAL
+
+
+@lru_cache(maxsize=8)
+def _prompt_tokens(prompt):
+    return estimate_tokens(prompt)
+
+
+def estimate_request_tokens(system, turns):
+    """Tokens de entrada estimados de um turno: system prompt estático e histórico."""
+    return _prompt_tokens(system.static) + sum(estimate_tokens(turn_text(turn)) for turn in turns)
+
+
+class TokenBucket:
+    """Balde de `per_minute` unidades por minuto, com rajada de até um minuto cheio."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, amount, now):
+        """Segundos até haver `amount` no balde (0 se já há)."""
+        self._refill(now)
+        # Um pedido maior que o balde inteiro espera só o balde encher
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+    def adjust(self, difference):
+        """Corrige a estimativa com o gasto real (o nível pode ficar negativo)."""
+        self.level -= difference
+
+
+class _Ticket:
+    __slots__ = ("session", "priority", "tokens", "enqueued_at")
+
+    def __init__(self, session, priority, tokens):
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class ProviderQueue:
+    """Orçamento e fila de um provedor: uma fila por sessão, atendidas em rodízio."""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.sessions = OrderedDict()
+        self.depth = 0
+
+    def push(self, ticket):
+        self.sessions.setdefault(ticket.session, deque()).append(ticket)
+        self.depth += 1
+
+    def head(self):
+        """Próximo a entrar: o primeiro na ordem do rodízio entre os de maior prioridade."""
+        best = None
+        for tickets in self.sessions.values():
+            if best is None or tickets[0].priority < best.priority:
+                best = tickets[0]
+        return best
+
+    def pop(self, ticket):
+        tickets = self.sessions[ticket.session]
+        tickets.popleft()
+        self.depth -= 1
+        # A sessão atendida vai para o fim do rodízio
+        if tickets:
+            self.sessions.move_to_end(ticket.session)
+        else:
+            del self.sessions[ticket.session]
+
+    def delay(self, tokens, now):
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.delay(1, now)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+
+class Admission:
+    """Vaga concedida a uma chamada; done(usage) acerta o balde de tokens com o gasto real."""
+
+    def __init__(self, queue, tokens, wait):
+        self.queue = queue
+        self.tokens = tokens
+        self.wait = wait
+
+    def done(self, actual_tokens=None):
+        if actual_tokens is not None and self.queue.tokens is not None:
+            self.queue.tokens.adjust(actual_tokens - self.tokens)
+
+
+class AdmissionScheduler:
+    """Orçamentos por provedor compartilhados pelas sessões do processo."""
+
+    def __init__(self, limits, registry=None):
+        # limits: {"gemini": (rpm, tpm), ...}; provedor fora do dicionário não tem limite
+        self.limits = limits
+        self.registry = registry
+        self.queues = {}
+        self._cond = threading.Condition()
+
+    def _queue(self, provider):
+        queue = self.queues.get(provider)
+        if queue is None:
+            queue = self.queues[provider] = ProviderQueue(*self.limits.get(provider, (0, 0)))
+        return queue
+
+    def admit(self, provider, session, tokens, priority=PRIORITY_NORMAL, trace=None):
+        """Bloqueia até a chamada caber no orçamento do provedor; retorna a Admission."""
+        ticket = _Ticket(session, priority, tokens)
+        with self._cond:
+            queue = self._queue(provider)
+            if queue.requests is None and queue.tokens is None:
+                return Admission(queue, tokens, 0.0)
+            queue.push(ticket)
+            self._report_depth(provider, queue)
+            # Quem chega pode passar na frente de quem está esperando o balde encher
+            self._cond.notify_all()
+            while True:
+                if queue.head() is ticket:
+                    delay = queue.delay(tokens, time.monotonic())
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+            queue.pop(ticket)
+            queue.take(tokens)
+            self._report_depth(provider, queue)
+            self._cond.notify_all()
+        wait = time.monotonic() - ticket.enqueued_at
+        if trace is not None:
+            trace.add("queue", wait)
+        if self.registry is not None:
+            self.registry.record_admission(provider, wait)
+        return Admission(queue, tokens, wait)
+
+    def _report_depth(self, provider, queue):
+        if self.registry is not None:
+            self.registry.set_queue_depth(provider, queue.depth)
+
+    def depth(self):
+        with self._cond:
+            return {provider: queue.depth for provider, queue in self.queues.items()}
+
+
+class InflightCall:
+    """Chamada em andamento: guarda o stream para quem chegar depois e o resultado final."""
+
+    def __init__(self):
+        self.chunks = []
+        self.listeners = []
+        self.reply = None
+        self.error = None
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, text):
+        # Entrega sob o lock: quem se inscreve no meio recebe os pedaços na ordem certa
+        with self._lock:
+            self.chunks.append(text)
+            for listener in list(self.listeners):
+                try:
+                    listener(text)
+                except Exception:
+                    # Quem desistiu (turno cancelado) para de receber; a chamada só
+                    # para quando ninguém mais está ouvindo
+                    self.listeners.remove(listener)
+                    if not self.listeners:
+                        raise
+
+    def subscribe(self, on_chunk):
+        with self._lock:
+            for text in self.chunks:
+                on_chunk(text)
+            self.listeners.append(on_chunk)
+
+
+class Coalescer:
+    """Junta chamadas idênticas em andamento numa só."""
+
+    def __init__(self, registry=None):
+        self.registry = registry
+        self.inflight = {}
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def run(self, key, call, on_chunk=None):
+        """call(on_chunk) faz a chamada de verdade; retorna (Reply, True se veio de outra chamada)."""
+        with self._lock:
+            inflight = self.inflight.get(key)
+            leader = inflight is None
+            if leader:
+                inflight = self.inflight[key] = InflightCall()
+            else:
+                self.coalesced += 1
+        if on_chunk:
+            inflight.subscribe(on_chunk)
+
+        if not leader:
+            if self.registry is not None:
+                self.registry.record_coalesced()
+            inflight.finished.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.reply, True
+
+        try:
+            inflight.reply = call(inflight.publish if on_chunk else None)
+            return inflight.reply, False
+        except BaseException as error:
+            inflight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self.inflight[key]
+            inflight.finished.set()
+
+
+def coalesce_key(system, turns, streaming):
+    """Mesma persona, mesma versão da KB e mesmo histórico: a resposta pode ser dividida."""
+    return (system.kb_version, system.static, tuple((turn["role"], turn_text(turn)) for turn in turns), streaming)
+
+
+PROVIDER_NAMES = ("gemini", "anthropic")
+
+
+def limits_from_env(names=PROVIDER_NAMES):
+    """{provedor: (rpm, tpm)} a partir de KIT_GEMINI_RPM, KIT_GEMINI_TPM, KIT_ANTHROPIC_RPM..."""
+    limits = {}
+    for name in names:
+        rpm = float(os.getenv(f"KIT_{name.upper()}_RPM", "0"))
+        tpm = float(os.getenv(f"KIT_{name.upper()}_TPM", "0"))
+        if rpm or tpm:
+            limits[name] = (rpm, tpm)
+    return limits
+
+
+_shared_scheduler = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def shared_admission_scheduler(registry=None):
+    """AdmissionScheduler único por processo, ou None se nenhum provedor tem limite no .env."""
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            limits = limits_from_env()
+            if not limits:
+                return None
+            _shared_scheduler = AdmissionScheduler(limits, registry)
+        return _shared_scheduler
+
+
+def coalescing_enabled():
+    return os.getenv("KIT_COALESCE", "1").lower() not in ("0", "false", "nao", "não")
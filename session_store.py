@@ -0,0 +1,287 @@
+"""Sessões do chat gravadas em disco, para continuar depois de fechar o terminal ou de um Ctrl-C.
+
+Cada sessão é um log só de inclusão (SQLite em modo WAL) com um registro curto por
+evento: tipo de uma letra e o texto. As gravações são agrupadas e confirmadas juntas a
+cada KIT_SESSION_FLUSH_MS por uma thread própria, e a cada SNAPSHOT_EVERY eventos vai
+junto um snapshot do estado do bot. Retomar lê o snapshot e só os eventos depois dele,
+então o tempo não cresce com o tamanho da conversa.
+
+Compactação (apaga o que já está nos snapshots e as sessões encerradas antigas):
+    python session_store.py --compactar
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_SESSION_PATH = "./.kit_cache/sessions.sqlite3"
+SNAPSHOT_EVERY = 32
+MAX_BATCH = 256
+
+# Tipos de evento do log
+EVENT_USER = "u"
+EVENT_ASSISTANT = "a"
+EVENT_CLEAR = "x"
+EVENT_DOCUMENT = "d"
+EVENT_INTERACTION = "i"
+EVENT_CHOCOLATE = "c"
+EVENT_RESET = "r"
+EVENT_CANCEL = "k"
+EVENT_PIN = "p"
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionStore:
+    """Arquivo SQLite com as sessões; seguro para várias threads."""
+
+    def __init__(self, path=DEFAULT_SESSION_PATH, flush_interval=0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL + synchronous=NORMAL: cada commit só acrescenta ao WAL; o fsync fica para o checkpoint
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                bot TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished INTEGER NOT NULL DEFAULT 0,
+                snapshot_seq INTEGER NOT NULL DEFAULT 0,
+                snapshot TEXT
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+        """)
+        self.connection.commit()
+        self.pending = []
+        self._db_lock = threading.Lock()
+        self._queue_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="kit-session-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # Gravação
+
+    def _queue(self, sql, params):
+        with self._queue_lock:
+            self.pending.append((sql, params))
+            full = len(self.pending) >= MAX_BATCH
+        if full:
+            self._wake.set()
+
+    def create(self, bot_name):
+        session_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self._queue("INSERT INTO sessions (id, bot, created_at, updated_at) VALUES (?, ?, ?, ?)", (session_id, bot_name, now, now))
+        return session_id
+
+    def append(self, session_id, seq, kind, text):
+        self._queue("INSERT INTO events (session_id, seq, kind, text) VALUES (?, ?, ?, ?)", (session_id, seq, kind, text))
+
+    def save_snapshot(self, session_id, seq, state, finished=False):
+        self._queue(
+            "UPDATE sessions SET snapshot_seq = ?, snapshot = ?, updated_at = ?, finished = ? WHERE id = ?",
+            (seq, json.dumps(state, ensure_ascii=False, separators=(",", ":")), time.time(), int(finished), session_id),
+        )
+
+    def flush(self):
+        """Grava agora tudo o que está na fila, numa única transação.
+
+        Se a transação falha, grava de novo um registro por vez: um evento com problema
+        (seq repetido, por exemplo) não leva junto os das outras sessões.
+        """
+        with self._db_lock:
+            with self._queue_lock:
+                batch, self.pending = self.pending, []
+            if not batch or self._closed:
+                return
+            try:
+                with self.connection:
+                    for sql, params in batch:
+                        self.connection.execute(sql, params)
+            except sqlite3.Error:
+                self._flush_rows(batch)
+
+    def _flush_rows(self, batch):
+        dropped = 0
+        for sql, params in batch:
+            try:
+                with self.connection:
+                    self.connection.execute(sql, params)
+            except sqlite3.Error as error:
+                dropped += 1
+                # Só o comando e a sessão: o texto da conversa não vai para o log
+                session_id = params[-1] if sql.startswith("UPDATE") else params[0]
+                print(f"[sessões] registro descartado da sessão {session_id} ({sql.split()[0]}): {error}", file=sys.stderr)
+        if dropped:
+            print(f"[sessões] {dropped} de {len(batch)} registros não foram gravados", file=sys.stderr)
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # Disco cheio ou arquivo travado: a conversa continua, só não fica salva
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        with self._db_lock:
+            self._closed = True
+            self.connection.close()
+
+    # Leitura
+
+    def load(self, session_id):
+        """(id, bot, snapshot ou None, seq do snapshot, eventos depois dele).
+
+        Sem session_id, abre a sessão não encerrada mais recente.
+        """
+        self.flush()
+        with self._db_lock:
+            if session_id:
+                row = self.connection.execute(
+                    "SELECT id, bot, snapshot_seq, snapshot FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT id, bot, snapshot_seq, snapshot FROM sessions WHERE finished = 0 ORDER BY updated_at DESC LIMIT 1"
+                ).fetchone()
+            if row is None:
+                raise SessionNotFound(session_id or "(nenhuma sessão aberta)")
+            session_id, bot, snapshot_seq, snapshot = row
+            events = self.connection.execute(
+                "SELECT seq, kind, text FROM events WHERE session_id = ? AND seq > ? ORDER BY seq", (session_id, snapshot_seq)
+            ).fetchall()
+        return session_id, bot, json.loads(snapshot) if snapshot else None, snapshot_seq, events
+
+    def sessions(self, limit=20):
+        self.flush()
+        with self._db_lock:
+            return self.connection.execute(
+                "SELECT id, bot, created_at, updated_at, finished FROM sessions ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    # Compactação
+
+    def compact(self, retention_days=30):
+        """Apaga eventos já incluídos nos snapshots e sessões encerradas há mais de retention_days.
+
+        Retorna (eventos apagados, sessões apagadas).
+        """
+        self.flush()
+        cutoff = time.time() - retention_days * 24 * 3600
+        with self._db_lock:
+            with self.connection:
+                removed_sessions = self.connection.execute(
+                    "SELECT id FROM sessions WHERE finished = 1 AND updated_at < ?", (cutoff,)
+                ).fetchall()
+                removed_events = 0
+                for (session_id,) in removed_sessions:
+                    removed_events += self.connection.execute("DELETE FROM events WHERE session_id = ?", (session_id,)).rowcount
+                    self.connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                removed_events += self.connection.execute("""
+                    DELETE FROM events WHERE seq <= (
+                        SELECT snapshot_seq FROM sessions WHERE sessions.id = events.session_id
+                    )
+                """).rowcount
+            # Devolve o espaço ao sistema: zera o WAL e reescreve o arquivo
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.connection.execute("VACUUM")
+        return removed_events, len(removed_sessions)
+
+
+class SessionLog:
+    """Log de uma sessão aberta: numera os eventos e pede um snapshot a cada SNAPSHOT_EVERY.
+
+    O bot grava cada evento antes de mudar o próprio estado; assim, o snapshot tirado
+    antes do evento seguinte corresponde exatamente aos eventos até self.seq.
+    """
+
+    def __init__(self, store, session_id, last_seq=0, snapshot_seq=0):
+        self.store = store
+        self.session_id = session_id
+        self.seq = last_seq
+        self.snapshot_seq = snapshot_seq
+
+    @property
+    def snapshot_due(self):
+        return self.seq - self.snapshot_seq >= SNAPSHOT_EVERY
+
+    def record(self, kind, text=""):
+        self.seq += 1
+        self.store.append(self.session_id, self.seq, kind, text)
+
+    def snapshot(self, state, finished=False):
+        self.store.save_snapshot(self.session_id, self.seq, state, finished)
+        self.snapshot_seq = self.seq
+
+    def flush(self):
+        self.store.flush()
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def shared_session_store():
+    """SessionStore do processo conforme KIT_SESSIONS / KIT_SESSION_PATH (ou None se desligado)."""
+    global _session_store
+    if os.getenv("KIT_SESSIONS", "1").lower() in ("0", "false", "nao", "não"):
+        return None
+    with _session_store_lock:
+        if _session_store is None:
+            try:
+                _session_store = SessionStore(
+                    os.getenv("KIT_SESSION_PATH", DEFAULT_SESSION_PATH),
+                    float(os.getenv("KIT_SESSION_FLUSH_MS", "200")) / 1000,
+                )
+            except sqlite3.Error:
+                # Sem o arquivo de sessões o bot continua funcionando, só não dá para retomar
+                return None
+        return _session_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção das sessões salvas da Kit")
+    parser.add_argument("--compactar", action="store_true", help="apaga eventos já nos snapshots e sessões encerradas antigas")
+    parser.add_argument("--dias", type=float, default=float(os.getenv("KIT_SESSION_RETENTION_DAYS", "30")), help="por quantos dias manter as sessões encerradas")
+    parser.add_argument("--listar", action="store_true", help="mostra as sessões mais recentes")
+    args = parser.parse_args()
+
+    store = SessionStore(os.getenv("KIT_SESSION_PATH", DEFAULT_SESSION_PATH))
+    if args.listar or not args.compactar:
+        for session_id, bot, created_at, updated_at, finished in store.sessions():
+            status = "encerrada" if finished else "aberta"
+            print(f"{session_id}  {bot:<9}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(updated_at))}  {status}")
+    if args.compactar:
+        def disk_usage():
+            return sum(os.path.getsize(path) for path in (store.path, store.path + "-wal") if os.path.exists(path))
+
+        size_before = disk_usage()
+        events, sessions = store.compact(args.dias)
+        print(f"{events} eventos e {sessions} sessões apagados; {size_before} → {disk_usage()} bytes")
+    store.close()
@@ -0,0 +1,94 @@
+"""Resumo da sessão montado aos poucos, em segundo plano.
+
+Depois de cada turno, o RollingSummarizer condensa a pergunta e a resposta numa linha
+(resumo extrativo local, sem chamar o modelo). Ao sair ou reiniciar, o resumo da
+conversa inteira já está pronto.
+"""
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from text_utils import tokenize
+
+MAX_SUMMARY_CHARS = 300
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_MARKUP = re.compile(r"^[\s>*#-]+|\*\*|`")
+# Linhas que o próprio bot acrescenta à resposta e não dizem nada sobre o assunto
+_NOISE = ("[Você ainda tem", "⚡ Resposta rápida", "(seção ")
+
+
+def interaction_title(question, max_words=8):
+    words = question.split()
+    title = " ".join(words[:max_words])
+    return title + "..." if len(words) > max_words else title
+
+
+def summarize_turn(question, answer, max_chars=MAX_SUMMARY_CHARS):
+    """(título, resumo) de um turno: as frases da resposta mais ligadas à pergunta, na ordem original."""
+    question_terms = set(tokenize(question))
+    sentences = []
+    for raw in _SENTENCE_SPLIT.split(answer):
+        sentence = _MARKUP.sub("", raw).strip()
+        if len(sentence) < 20 or sentence.startswith(_NOISE):
+            continue
+        sentences.append(sentence)
+    if not sentences:
+        return interaction_title(question), " ".join(answer.split())[:max_chars]
+
+    scored = []
+    for position, sentence in enumerate(sentences):
+        terms = tokenize(sentence)
+        overlap = len(question_terms.intersection(terms))
+        # Frases que repetem termos da pergunta valem mais; as primeiras costumam ser a resposta direta
+        score = overlap / math.sqrt(len(terms) or 1) + 0.5 / (1 + position)
+        scored.append((score, position, sentence))
+
+    chosen = []
+    used = 0
+    for score, position, sentence in sorted(scored, reverse=True):
+        if used + len(sentence) > max_chars and chosen:
+            continue
+        chosen.append((position, sentence[:max_chars]))
+        used += len(sentence) + 1
+    summary = " ".join(sentence for _, sentence in sorted(chosen))
+    return interaction_title(question), summary
+
+
+_summary_executor = None
+_summary_executor_lock = threading.Lock()
+
+
+def summary_executor():
+    """Pool compartilhado dos resumos em segundo plano."""
+    global _summary_executor
+    with _summary_executor_lock:
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="kit-summary")
+        return _summary_executor
+
+
+class RollingSummarizer:
+    """Resumo de cada turno calculado em segundo plano, na ordem da conversa."""
+
+    def __init__(self, summarize=summarize_turn):
+        self.summarize = summarize
+        self.futures = []
+
+    def submit(self, question, answer):
+        self.futures.append(summary_executor().submit(self.summarize, question, answer))
+
+    def result(self, timeout=0.1):
+        """Lista de (título, resumo) de todos os turnos, ou None se algum ainda não terminou."""
+        done, pending = wait(self.futures, timeout=timeout)
+        if pending or any(future.exception() for future in done):
+            return None
+        return [future.result() for future in self.futures]
+
+    def clear(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+
+    def __len__(self):
+        return len(self.futures)
@@ -0,0 +1,72 @@
+import json
+
+
+def iter_sse_events(lines):
+    """Converte linhas de um stream SSE em eventos (nome, dados)."""
+    event_name = None
+    data_lines = []
+    for raw_line in lines:
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+        line = line.rstrip("\r")
+        if not line:
+            # Linha em branco encerra o evento atual
+            if data_lines:
+                yield event_name, "\n".join(data_lines)
+            event_name = None
+            data_lines = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event_name = value
+        elif field == "data":
+            data_lines.append(value)
+    if data_lines:
+        yield event_name, "\n".join(data_lines)
+
+
+def gemini_stream_text(lines, usage=None):
+    """Extrai os pedaços de texto de um streamGenerateContent?alt=sse do Gemini.
+
+    Se usage for um dict, ele recebe o usageMetadata enviado pelo provedor.
+    """
+    for _, data in iter_sse_events(lines):
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise StreamError(chunk["error"].get("message", str(chunk["error"])))
+        if usage is not None and "usageMetadata" in chunk:
+            usage.update(chunk["usageMetadata"])
+        for candidate in chunk.get("candidates", []):
+            for part in candidate.get("content", {}).get("parts", []):
+                if part.get("text"):
+                    yield part["text"]
+
+
+def anthropic_stream_text(lines, usage=None):
+    """Extrai os pedaços de texto de um stream SSE da API de mensagens da Anthropic.
+
+    Se usage for um dict, ele recebe o usage de message_start e message_delta.
+    """
+    for event_name, data in iter_sse_events(lines):
+        payload = json.loads(data)
+        event_type = payload.get("type", event_name)
+        if event_type == "error":
+            raise StreamError(payload.get("error", {}).get("message", data))
+        if usage is not None:
+            if event_type == "message_start":
+                usage.update(payload.get("message", {}).get("usage", {}))
+            elif event_type == "message_delta":
+                usage.update(payload.get("usage", {}))
+        if event_type == "content_block_delta":
+            delta = payload.get("delta", {})
+            if delta.get("type") == "text_delta" and delta.get("text"):
+                yield delta["text"]
+        elif event_type == "message_stop":
+            return
+
+
+class StreamError(Exception):
+    """Erro enviado pelo provedor no meio de um stream SSE."""
@@ -0,0 +1,62 @@
+import re
+import unicodedata
+
+# Palavras muito comuns em português que não ajudam a diferenciar seções
+STOPWORDS = {
+    "a", "ao", "aos", "as", "até", "com", "como", "da", "das", "de", "do", "dos",
+    "e", "é", "em", "entre", "era", "essa", "esse", "esta", "está", "este", "eu",
+    "foi", "há", "isso", "isto", "já", "lhe", "mais", "mas", "me", "meu", "minha",
+    "na", "nas", "no", "nos", "não", "o", "os", "ou", "para", "pela", "pelo", "por",
+    "pra", "qual", "quais", "que", "se", "sem", "ser", "seu", "sua", "são", "também",
+    "tem", "um", "uma", "uns", "umas", "você", "vocês", "onde", "quando", "sobre",
+    "fica", "ficam", "the", "of", "and", "to", "is",
+}
+STOPWORDS = {unicodedata.normalize("NFKD", word).encode("ascii", "ignore").decode() for word in STOPWORDS}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+
+
+def fold_accents(text):
+    """Remove acentos mantendo as letras base (ção -> cao)."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_text(text):
+    """Deixa o texto em minúsculas, sem acentos e com espaços simples."""
+    return " ".join(fold_accents(text).lower().split())
+
+
+def stem(word):
+    """Stemmer leve para português: reduz plurais e sufixos mais comuns."""
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    for suffix, replacement in (("coes", "cao"), ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("res", "r"), ("ns", "m")):
+        if word.endswith(suffix):
+            return word[: -len(suffix)] + replacement
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text, keep=()):
+    """Quebra o texto em termos normalizados, sem stopwords e com stemming leve.
+
+    As stopwords em `keep` (já sem acentos) continuam no resultado.
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(normalize_text(text)):
+        if token in STOPWORDS and token not in keep:
+            continue
+        terms.append(stem(token))
+        # Termos compostos (ci/cd, choco-dev, node.js) também entram separados
+        if any(separator in token for separator in "./-"):
+            terms.extend(stem(part) for part in re.split(r"[./-]", token) if part and part not in STOPWORDS)
+    return terms
+
+
+def estimate_tokens(text):
+    """Estimativa local de tokens (~4 caracteres por token)."""
+    if not text:
+        return 0
+    return (len(text) + 3) // 4